@@ -0,0 +1,910 @@
+import argparse
+import heapq
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from bisect import bisect_right
+from itertools import zip_longest
+from timeit import default_timer as timer
+
+from collections import Counter
+
+from resources import Resource, OvenResource, Task, MANIPULATOR_COLD, MANIPULATOR_WARM, OVEN2, OVEN4, WARM_ROOM_30, \
+    WARM_ROOM, CapacityResource, OPERATION_TYPE
+from scheduler import Scheduler
+from timeline import compact_schedule, save_schedule, ScheduleFile
+from events import tracer, DEBUG, INFO
+from metrics import profiled
+from data_generator import init_seed, generate_orders, generate_order_distribution, order_batches, bus_time
+
+
+def check(condition, message):
+    # sanity check of a benchmark result; unlike assert it also runs under python -O
+    if not condition:
+        raise RuntimeError(message)
+
+
+# Linear scans the resources used before the free-gap index, kept as the reference
+def scan_find_time(resource, duration, start_time, priority):
+    pairs = list(zip_longest(resource.tasks, resource.tasks[1:], fillvalue=None))
+    if not pairs:
+        return start_time, 0
+    for index, pair in enumerate(pairs):
+        if index == 0:
+            if start_time + duration < pair[0].start:
+                return start_time, 0
+
+        if pair[1] is None:
+            start_time = max(pair[0].end, start_time)
+            return start_time, start_time - pair[0].end
+
+        possibly_start = max(pair[0].end, start_time)
+        if possibly_start + duration <= pair[1].start:
+            return possibly_start, possibly_start - pair[0].end
+
+        if pair[1].priority < priority and pair[0].priority != priority and pair[1].priority != priority:
+            return possibly_start, possibly_start - pair[0].end
+
+    return None
+
+
+def scan_oven_find_time(resource, duration, start_time, priority):
+    pairs = list(zip_longest(resource.tasks, resource.tasks[1:], fillvalue=None))
+    if not pairs:
+        return start_time, 0
+
+    extra = resource.extra_duration
+
+    for pair in pairs:
+        end0 = pair[0].end + extra
+
+        if pair[1] is None:
+            start_time = max(end0 + extra, start_time)
+            return start_time, start_time - end0
+
+        start1 = pair[1].start - extra
+
+        if end0 >= start_time - extra:
+            if start1 - end0 >= duration + extra:
+                return end0 + extra, 0
+
+        if end0 < (start_time - extra) < start1:
+            if start_time + duration + extra < start1:
+                return start_time, start_time - end0
+
+    return None
+
+
+def build_timeline(resource, count, density, seed=0):
+    # density is the share of the timeline covered by tasks
+    rnd = random.Random(seed)
+    start = 0
+    for i in range(count):
+        duration = rnd.choice([30, 30, 60, 420])
+        task = Task(start, duration, f"product.{i}", resource, "OTHER", rnd.choice([5, 5, 7]))
+        resource.add_task(task)
+        start += duration + int(duration * (1 - density) / density * rnd.random() * 2)
+    return resource
+
+
+def time_queries(find_time, resource, queries):
+    started = timer()
+    for (duration, start_time, priority) in queries:
+        find_time(duration, start_time, priority)
+    return timer() - started
+
+
+def bench_find_time(sizes=(1000, 10000, 100000), densities=(0.5, 0.99), query_count=200):
+    rows = []
+    for oven in (False, True):
+        for count in sizes:
+            for density in densities:
+                resource = OvenResource("OVEN", 30) if oven else Resource("HAND")
+                build_timeline(resource, count, density)
+                end = resource.tasks[-1].end
+                rnd = random.Random(1)
+                queries = [(rnd.choice([30, 60, 420]), rnd.randrange(end), 6) for _ in range(query_count)]
+
+                scan = scan_oven_find_time if oven else scan_find_time
+                for query in queries:
+                    check(resource.find_time(*query) == scan(resource, *query),
+                          f"find_time{query} differs from the scan")
+
+                indexed = time_queries(resource.find_time, resource, queries)
+                scanned = time_queries(lambda *q: scan(resource, *q), resource, queries)
+                rows.append((resource.name, count, density, scanned / query_count, indexed / query_count))
+    return rows
+
+
+class DictTask:
+    # Task layout before __slots__ and the free-gap index, for the storage comparison
+    def __init__(self, start, duration, product_id, resource, task_type, priority):
+        self.start = start
+        self.end = start + duration
+        self.duration = duration
+        self.product_id = product_id
+        self.resource = resource
+        self.prev_task = None
+        self.next_task = None
+        self.type = task_type
+        self.priority = priority
+
+
+def measure(build):
+    tracemalloc.start()
+    started = timer()
+    result = build()
+    elapsed = timer() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def bench_storage(count=100000):
+    # Task records alone, a live timeline (its Task records in the blocks of the free-gap
+    # index) and the compact columnar copy
+    rows = []
+    product_ids = [f"order.{i // 4}" for i in range(count)]
+
+    def objects(task_class):
+        resource = Resource("HAND")
+        return [task_class(i * 30, 30, product_ids[i], resource, "LOAD", 5) for i in range(count)]
+
+    for (name, task_class) in (("dict Task", DictTask), ("slots Task", Task)):
+        (tasks, size, elapsed) = measure(lambda: objects(task_class))
+        started = timer()
+        busy = sum(task.end - task.start for task in tasks)
+        rows.append((name, size, elapsed, timer() - started))
+
+    def live():
+        resource = Resource("HAND")
+        resource._append(objects(Task))
+        return resource
+
+    (resource, size, elapsed) = measure(live)
+    started = timer()
+    check(sum(task.end - task.start for task in resource.tasks) == busy, "live timeline lost busy time")
+    rows.append(("live timeline", size, elapsed, timer() - started))
+
+    (timelines, size, elapsed) = measure(lambda: compact_schedule({"HAND": resource}))
+    started = timer()
+    check(timelines["HAND"].busy_time() == busy, "compact timeline lost busy time")
+    rows.append(("compact", size, elapsed, timer() - started))
+    return rows
+
+
+def order_sequence(oven, cook_time):
+    return [
+        {"resource": MANIPULATOR_COLD, "type": OPERATION_TYPE["UNLOAD"], "duration": 30, "priority": 5},
+        {"resource": MANIPULATOR_WARM, "type": OPERATION_TYPE["LOAD"], "duration": 30, "priority": 7},
+        {"resource": oven, "type": OPERATION_TYPE["OVEN"], "duration": cook_time, "priority": 5},
+        {"resource": MANIPULATOR_WARM, "type": OPERATION_TYPE["UNLOAD"], "duration": 30, "priority": 5},
+    ]
+
+
+def main_workload(count, oven=OVEN2, seed=123):
+    # orders as main.py generates them
+    init_seed(seed)
+    orders = generate_orders(count=count, cook_time_base=7 * 60, cook_time_scale=0, cook_min_time=6 * 60,
+                             cook_max_time=8 * 60, pickup_max_time=10 * 60)
+    resources = {}
+    for r in MANIPULATOR_COLD + MANIPULATOR_WARM + oven:
+        resources[r] = Resource(r) if r not in oven else OvenResource(r, 30)
+    return Scheduler(resources), orders
+
+
+def run_orders(scheduler, orders, oven=OVEN2, **kwargs):
+    placed = {}
+    for order in orders:
+        placed[order["order"]] = scheduler.schedule_forward(
+            sequence=order_sequence(oven, order["cook_time"]), product_id=order["order"],
+            start_time=order["start_time"], **kwargs)
+    return placed
+
+
+class CountingSink:
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, event):
+        self.counts[type(event).__name__] += 1
+
+
+def pickup_sequence():
+    return [{"resource": MANIPULATOR_WARM, "type": OPERATION_TYPE["PICKUP"], "duration": 30, "priority": 5}]
+
+
+def bench_pickups(count=1000):
+    # a pickup per order after count orders released at once: insert_sequence per pickup in
+    # start order, or insert_sequences for all of them in order id order (it sorts them)
+    rows = []
+    for bulk in (False, True):
+        (scheduler, orders) = main_workload(count)
+        placed = run_orders(scheduler, orders)
+        items = [(placed[order["order"]][-1].end + int(order["pickup_timeout"]), order["order"]) for order in orders]
+        started = timer()
+        if bulk:
+            scheduler.insert_sequences([(pickup_sequence(), start_time, number) for (start_time, number) in items])
+        else:
+            items.sort()
+            for (start_time, number) in items:
+                scheduler.insert_sequence(pickup_sequence(), start_time, number)
+        elapsed = timer() - started
+        makespan = max(resource.get_total_time() for resource in scheduler.resources.values())
+        invalid = sum(resource.validate_timeline()[0] is not None for resource in scheduler.resources.values())
+        rows.append(("bulk" if bulk else "one by one", len(items), elapsed, makespan, invalid))
+    return rows
+
+
+def bench_what_if(count=10000, trials=200):
+    # cost of evaluating one alternative on a forked schedule and rolling it back;
+    # alternatives arrive near the end of the schedule, like live orders and pickups do
+    (scheduler, orders) = main_workload(count)
+    placed = run_orders(scheduler, orders)
+    end = max(tasks[-1].end for tasks in placed.values())
+    rnd = random.Random(2)
+    horizon = end - 3600
+    rows = []
+    for (name, evaluate) in (
+            ("placement", lambda t: scheduler.schedule_forward(order_sequence(OVEN2, 420), "what-if", t)),
+            ("pickup", lambda t: scheduler.insert_sequence(pickup_sequence(), t, "what-if"))):
+        started = timer()
+        changes = 0
+        for _ in range(trials):
+            with scheduler.fork():
+                evaluate(rnd.randrange(horizon, end))
+                changes += len(scheduler.journal.entries)
+        rows.append((name, count, (timer() - started) / trials, changes / trials))
+    return rows
+
+
+def bench_slot_cache(count=1000, trials=2000):
+    # time without and with the slot cache and its hit rate: placing count orders, what-if
+    # alternatives from a small set of start times (rolled back, so the timelines return to
+    # cached versions) and local search candidates. The last two time only the queries on
+    # the count-order schedule.
+    from local_search import LocalSearch, Placement
+
+    def placement(scheduler, orders):
+        run_orders(scheduler, orders)
+
+    def what_if(scheduler, orders):
+        placed = run_orders(scheduler, orders)
+        end = max(tasks[-1].end for tasks in placed.values())
+        starts = [end - 3600 + 180 * index for index in range(20)]
+        scheduler.cache_stats(reset=True)
+        started = timer()
+        for trial in range(trials):
+            with scheduler.fork():
+                scheduler.schedule_forward(order_sequence(OVEN2, 420), "what-if", starts[trial % len(starts)])
+        return started
+
+    def local_search(scheduler, orders):
+        placed = run_orders(scheduler, orders)
+        placements = [Placement(order["order"], order_sequence(OVEN2, order["cook_time"]), order["start_time"],
+                                placed[order["order"]]) for order in orders]
+        scheduler.cache_stats(reset=True)
+        started = timer()
+        LocalSearch(scheduler, placements).run(trials)
+        return started
+
+    rows = []
+    for (name, run) in (("placement", placement), ("what-if", what_if), ("local search", local_search)):
+        elapsed = []
+        for cached in (False, True):
+            (scheduler, _) = main_workload(0)
+            scheduler.enable_cache(cached)
+            init_seed(123)
+            orders = generate_orders(count=count, cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60,
+                                     cook_max_time=8 * 60, pickup_max_time=10 * 60)
+            started = timer()
+            started = run(scheduler, orders) or started
+            elapsed.append(timer() - started)
+        rows.append((name, *elapsed, scheduler.cache_stats()["hit_rate"]))
+    return rows
+
+
+def bench_restore(count=20000):
+    # getting a count-order schedule back into a process: re-running placement, or opening a
+    # saved file and building every task, only the tasks evict(now) keeps, or none of them
+    (scheduler, orders) = main_workload(count)
+    started = timer()
+    run_orders(scheduler, orders)
+    rows = [("replay", None, timer() - started, sum(len(r.tasks) for r in scheduler.resources.values()))]
+    now = max(task.end for r in scheduler.resources.values() for task in r.tasks) - 3600
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "schedule.bin")
+        save_schedule(scheduler, path)
+        rows.append(("file", os.path.getsize(path), None, None))
+        # timed without tracemalloc, which slows object-heavy code down several times
+        started = timer()
+        schedule = ScheduleFile(path)
+        elapsed = timer() - started
+        (other, size, _) = measure(lambda: ScheduleFile(path))
+        other.close()
+        rows.append(("open", size, elapsed, 0))
+        for (name, at) in (("load", None), ("load at now", now)):
+            started = timer()
+            restored = schedule.scheduler(at)
+            elapsed = timer() - started
+            tasks = sum(len(r.tasks) for r in restored.resources.values())
+            del restored
+            rows.append((name, measure(lambda: schedule.scheduler(at))[1], elapsed, tasks))
+        schedule.close()
+    return rows
+
+
+def bench_cells(cell_counts=None, days=30):
+    # one day profile per cell, so per-cell work stays the same and throughput can follow the
+    # cores; 1..cpu count cells by default
+    from cells import ShardedScheduler
+    from service import day_orders
+
+    settings = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                    cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+    if cell_counts is None:
+        cell_counts = range(1, (os.cpu_count() or 1) + 1)
+    rows = []
+    for count in cell_counts:
+        orders = []
+        for copy in range(count):
+            for order in list(day_orders(days, 123 + copy, **settings)):
+                order["order"] = f"{order['order']}/{copy}"
+                orders.append(order)
+        orders.sort(key=lambda order: order["start_time"])
+        with ShardedScheduler(count, OVEN4, evict_every=3600) as sharded:
+            started = timer()
+            sharded.schedule(orders)
+            rows.append((count, len(orders), timer() - started))
+    return rows
+
+
+def bench_local_search(count=1000, candidates=2000):
+    # candidates evaluated per second on count orders released at once with cook times
+    # spread around 7 minutes (equal orders leave nothing to reorder), greedy and annealed
+    from local_search import LocalSearch, Placement
+
+    rows = []
+    for temperature in (0, 60):
+        (scheduler, _) = main_workload(0)
+        init_seed(123)
+        orders = generate_orders(count=count, cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60,
+                                 cook_max_time=8 * 60, pickup_max_time=10 * 60)
+        placed = run_orders(scheduler, orders)
+        placements = [Placement(order["order"], order_sequence(OVEN2, order["cook_time"]), order["start_time"],
+                                placed[order["order"]]) for order in orders]
+        result = LocalSearch(scheduler, placements).run(candidates, temperature)
+        rows.append((temperature, count, result["per_second"], result["kept"], *result["cost"]))
+    return rows
+
+
+def bench_just_in_time(days=30, oven=OVEN4):
+    # days of bus_time orders placed forward or just in time for their pickup: cascade
+    # moves while placing orders, how long finished orders wait and how many miss their pickup
+    from service import day_orders
+    from simulation import build_scheduler, simulate, due_time
+
+    settings = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                    cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+    orders = list(day_orders(days, 11, **settings))
+    rows = []
+    for mode in ("forward", "mixed"):
+        scheduler = build_scheduler(oven)
+        scheduler.enable_stats()
+        started = timer()
+        placed = simulate(scheduler, orders, oven, mode=mode)
+        elapsed = timer() - started
+        counts = scheduler.stats()["counts"]
+        ends = [(placed[order["order"]][-1].end, due_time(order)) for order in orders]
+        rows.append((mode, len(orders), counts.get("schedule_backward", 0), counts.get("moved", 0),
+                     sum(max(due - end, 0) for (end, due) in ends) / len(ends),
+                     sum(end > due for (end, due) in ends), elapsed))
+    return rows
+
+
+def bench_order_generation(days=2000):
+    # bus_time orders as dicts, one generate_order_distribution call per day, against arrays
+    settings = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                    cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+    rows = []
+    for (name, generate) in (
+            ("dicts", lambda: [generate_order_distribution(bus_time=bus_time, verbose=False, **settings)
+                               for _ in range(days)]),
+            ("exact", lambda: list(order_batches(bus_time, days=days, chunk_days=100, exact=True, **settings))),
+            ("arrays", lambda: list(order_batches(bus_time, days=days, chunk_days=100, **settings)))):
+        init_seed(5)
+        started = timer()
+        orders = generate()
+        elapsed = timer() - started
+        init_seed(5)
+        (_, size, _) = measure(generate)
+        rows.append((name, sum(len(chunk) for chunk in orders), size, elapsed))
+    return rows
+
+
+def bench_groups(days=30, oven=OVEN4, store_time=1800):
+    # bus_time orders with a STORE step on WARM_ROOM_30, each slot searched on its own or as groups,
+    # or on one CapacityResource with as many places
+    settings = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                    cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+    init_seed(9)
+    batches = list(order_batches(bus_time, days=days, chunk_days=days, **settings))
+
+    def run(group_min_size, capacity=False):
+        resources = {}
+        for r in MANIPULATOR_COLD + MANIPULATOR_WARM + oven:
+            resources[r] = Resource(r) if r not in oven else OvenResource(r, 30)
+        if capacity:
+            room = WARM_ROOM
+            resources[room[0]] = CapacityResource(room[0], len(WARM_ROOM_30))
+        else:
+            room = WARM_ROOM_30
+            resources.update((r, Resource(r)) for r in room)
+        store = {"resource": room, "type": OPERATION_TYPE["STORE"], "duration": store_time, "priority": 5}
+        scheduler = Scheduler(resources, group_min_size=group_min_size)
+        return [scheduler.schedule_forward(order_sequence(oven, cook_time) + [store], number, start_time)
+                for batch in batches
+                for (number, cook_time, start_time) in zip(range(len(batch)), batch["cook_time"].tolist(),
+                                                           batch["start_time"].tolist())]
+
+    rows = []
+    schedules = []
+    for (name, group_min_size, capacity) in (("members", None, False), ("groups", 3, False), ("capacity", 3, True)):
+        started = timer()
+        placed = run(group_min_size, capacity)
+        elapsed = timer() - started
+        sink = tracer.add_sink(CountingSink(), DEBUG)
+        try:
+            run(group_min_size, capacity)
+        finally:
+            tracer.remove_sink(sink)
+        schedules.append([(task.resource.name, task.start) for tasks in placed for task in tasks])
+        rows.append((name, len(placed), sink.counts["CandidateEvaluated"], elapsed))
+    check(schedules[0] == schedules[1], "groups placed differently from their members")
+    # the slots of a room that never fills up are interchangeable with its places
+    check([start for (_, start) in schedules[1]] == [start for (_, start) in schedules[2]],
+          "capacity room placed differently from its slots")
+    return rows
+
+
+def bench_replay(count=10000):
+    # count orders and the pickups of the PICKUPS that finish last: placed with the search,
+    # the same while recording the decisions, the trace replayed without searching and
+    # searched again by diff
+    from recording import replay, diff
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.jsonl")
+        for recorded in (False, True):
+            (scheduler, orders) = main_workload(count)
+            if recorded:
+                scheduler.record(path)
+            started = timer()
+            placed = run_orders(scheduler, orders)
+            scheduler.insert_sequences([(pickup_sequence(), placed[order["order"]][-1].end + order["pickup_timeout"],
+                                         order["order"]) for order in last_finished(orders, placed)])
+            rows.append(("recorded" if recorded else "search", None, timer() - started))
+            scheduler.record(None)
+        timelines = {name: [(task.start, task.product_id) for task in resource.tasks]
+                     for (name, resource) in scheduler.resources.items()}
+        started = timer()
+        (replayed, _) = replay(path)
+        rows.append(("replay", os.path.getsize(path), timer() - started))
+        check(timelines == {name: [(task.start, task.product_id) for task in resource.tasks]
+                            for (name, resource) in replayed.resources.items()}, "replay differs from the search")
+        started = timer()
+        divergence = diff(path)
+        check(divergence is None, divergence and divergence.message())
+        rows.append(("diff", None, timer() - started))
+    return rows
+
+
+def print_tables():
+    print(f"{'resource':<8} {'tasks':>7} {'density':>7} {'scan, us':>10} {'index, us':>10} {'speedup':>8}")
+    for (name, count, density, scanned, indexed) in bench_find_time():
+        print(f"{name:<8} {count:>7} {density:>7} {scanned * 1e6:>10.1f} {indexed * 1e6:>10.1f} "
+              f"{scanned / indexed:>8.1f}")
+
+    print()
+    print(f"{'storage (100k tasks)':<20} {'MB':>8} {'build, ms':>10} {'scan, ms':>10}")
+    for (name, size, elapsed, scan) in bench_storage():
+        scan = f"{scan * 1e3:>10.1f}" if scan is not None else f"{'-':>10}"
+        print(f"{name:<20} {size / 2 ** 20:>8.1f} {elapsed * 1e3:>10.1f} {scan}")
+
+    print()
+    print(f"{'orders':<8} {'count':>8} {'MB':>8} {'time, s':>8}")
+    for (name, count, size, elapsed) in bench_order_generation():
+        print(f"{name:<8} {count:>8} {size / 2 ** 20:>8.1f} {elapsed:>8.2f}")
+
+    print()
+    print(f"{'pickups':<10} {'count':>6} {'time, s':>8} {'makespan, s':>11} {'invalid':>7}")
+    for (name, count, elapsed, makespan, invalid) in bench_pickups():
+        print(f"{name:<10} {count:>6} {elapsed:>8.3f} {makespan:>11.0f} {invalid:>7}")
+
+    print()
+    print(f"{'mode':<8} {'orders':>7} {'backward':>9} {'moved':>7} {'wait, s':>8} {'late':>6} {'time, s':>8}")
+    for (mode, count, backward, moved, wait, late, elapsed) in bench_just_in_time():
+        print(f"{mode:<8} {count:>7} {backward:>9} {moved:>7} {wait:>8.0f} {late:>6} {elapsed:>8.2f}")
+
+    print()
+    print(f"{'warm room':<10} {'orders':>7} {'queries':>9} {'time, s':>8}")
+    for (name, count, queries, elapsed) in bench_groups():
+        print(f"{name:<10} {count:>7} {queries:>9} {elapsed:>8.2f}")
+
+    print()
+    print(f"{'restore':<12} {'MB':>8} {'time, s':>8} {'tasks':>8}")
+    for (name, size, elapsed, tasks) in bench_restore():
+        size = f"{size / 2 ** 20:>8.1f}" if size is not None else f"{'-':>8}"
+        elapsed = f"{elapsed:>8.3f}" if elapsed is not None else f"{'-':>8}"
+        tasks = f"{tasks:>8}" if tasks is not None else f"{'-':>8}"
+        print(f"{name:<12} {size} {elapsed} {tasks}")
+
+    print()
+    print(f"{'trace':<10} {'MB':>8} {'time, s':>8}")
+    for (name, size, elapsed) in bench_replay():
+        size = f"{size / 2 ** 20:>8.1f}" if size is not None else f"{'-':>8}"
+        print(f"{name:<10} {size} {elapsed:>8.3f}")
+
+    print()
+    print(f"{'local search':<12} {'orders':>7} {'cand/s':>8} {'kept':>6} {'cost before':>12} {'cost after':>12}")
+    for (temperature, count, per_second, kept, before, after) in bench_local_search():
+        print(f"{'T=' + str(temperature):<12} {count:>7} {per_second:>8.0f} {kept:>6} {before:>12.0f} {after:>12.0f}")
+
+    print()
+    print(f"{'cells':<6} {'orders':>7} {'time, s':>8} {'orders/s':>9} {'speedup':>8}  ({os.cpu_count()} cpus)")
+    single = None
+    for (count, orders, elapsed) in bench_cells():
+        single = single or orders / elapsed
+        print(f"{count:<6} {orders:>7} {elapsed:>8.2f} {orders / elapsed:>9.0f} {orders / elapsed / single:>8.2f}")
+
+    print()
+    print(f"{'slot cache':<12} {'time, s':>8} {'cached, s':>9} {'hits':>6}")
+    for (name, uncached, cached, hit_rate) in bench_slot_cache():
+        print(f"{name:<12} {uncached:>8.3f} {cached:>9.3f} {hit_rate:>6.0%}")
+
+    print()
+    print(f"{'what-if':<10} {'orders':>7} {'ms':>8} {'changes':>9}")
+    for (name, count, elapsed, changes) in bench_what_if():
+        print(f"{name:<10} {count:>7} {elapsed * 1e3:>8.2f} {changes:>9.0f}")
+
+
+# Import cost, each in a fresh interpreter. The core (CORE_MODULES) has to load without any
+# of HEAVY_MODULES; plotting pulls plotly and pandas, data generation numpy.
+CORE_MODULES = ("scheduler", "timeline", "concurrent_scheduler", "recording")
+STARTUP_MODULES = ("", "scheduler", "timeline", "concurrent_scheduler", "recording", "simulation", "plot_schedule")
+HEAVY_MODULES = ("numpy", "pandas", "plotly", "matplotlib")
+_STARTUP_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+if sys.argv[1]:
+    __import__(sys.argv[1])
+print(json.dumps({"seconds": time.perf_counter() - started,
+                  "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                  "loaded": sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[2:]))}))
+"""
+
+
+def bench_startup(modules=STARTUP_MODULES, repeat=3):
+    # (module, import seconds, max RSS bytes, heavy modules loaded); "" is the bare interpreter.
+    # A module whose dependencies are not installed gets (module, None, None, the error).
+    rows = []
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        runs = []
+        for _ in range(repeat):
+            probe = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, module, *HEAVY_MODULES], cwd=directory,
+                                   capture_output=True, text=True)
+            error = probe.stderr.strip().splitlines()[-1] if probe.returncode else ""
+            if error.startswith("ModuleNotFoundError"):
+                break
+            probe.check_returncode()
+            runs.append(json.loads(probe.stdout))
+        if runs:
+            rows.append((module, min(run["seconds"] for run in runs), min(run["rss"] for run in runs),
+                         runs[0]["loaded"]))
+        else:
+            rows.append((module, None, None, error))
+    return rows
+
+
+def print_startup():
+    # returns the core modules that load a heavy dependency
+    print(f"{'import':<20} {'ms':>8} {'max rss, MB':>11}  heavy modules")
+    failed = []
+    for (module, seconds, rss, loaded) in bench_startup():
+        if seconds is None:
+            print(f"{module:<20} {'-':>8} {'-':>11}  skipped, {loaded}")
+            continue
+        print(f"{module or '(python)':<20} {seconds * 1e3:>8.1f} {rss / 2 ** 20:>11.1f}  {', '.join(loaded) or '-'}")
+        if module in CORE_MODULES and loaded:
+            failed.append(module)
+    return failed
+
+
+# Scaling suite. Every case builds its input in setup(size), untimed, and returns a run()
+# that does the measured work and returns the number of operations it performed. Speeds are
+# compared with the baseline relative to a calibration loop run next to every case, so a
+# faster, slower or busier machine does not show up as a change. The baseline is
+# machine-local and not committed: the first run records it.
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+SIZES = (100, 1000, 10000, 100000)
+PICKUPS = 200
+
+
+def case_schedule_forward(size):
+    (scheduler, orders) = main_workload(size)
+    return lambda: len(run_orders(scheduler, orders))
+
+
+def case_schedule_forward_checked(size):
+    (scheduler, orders) = main_workload(size)
+    scheduler.check_invariants("collect")
+    return lambda: len(run_orders(scheduler, orders))
+
+
+def last_finished(orders, placed):
+    # the PICKUPS orders that finish last: a pickup early in a packed schedule cascades
+    # through the rest of it
+    return sorted(orders, key=lambda order: placed[order["order"]][-1].end)[-PICKUPS:]
+
+
+def case_insert_sequence(size):
+    # pickups for the orders that finish last, into a schedule of size orders
+    (scheduler, orders) = main_workload(size)
+    placed = run_orders(scheduler, orders)
+    orders = last_finished(orders, placed)
+
+    def run():
+        for order in orders:
+            start_time = placed[order["order"]][-1].end + int(order["pickup_timeout"])
+            scheduler.insert_sequence(pickup_sequence(), start_time, order["order"])
+        return len(orders)
+
+    return run
+
+
+def case_insert_sequences(size):
+    # the pickups of case_insert_sequence in one bulk call
+    (scheduler, orders) = main_workload(size)
+    placed = run_orders(scheduler, orders)
+    items = [(pickup_sequence(), placed[order["order"]][-1].end + int(order["pickup_timeout"]), order["order"])
+             for order in last_finished(orders, placed)]
+
+    def run():
+        return len(scheduler.insert_sequences(items))
+
+    return run
+
+
+def case_find_time(oven, density):
+    def setup(size):
+        resource = OvenResource("OVEN", 30) if oven else Resource("HAND")
+        build_timeline(resource, size, density)
+        rnd = random.Random(1)
+        end = resource.tasks[-1].end
+        queries = [(rnd.choice([30, 60, 420]), rnd.randrange(end), 6) for _ in range(2000)]
+
+        def run():
+            for query in queries:
+                resource.find_time(*query)
+            return len(queries)
+
+        return run
+
+    return setup
+
+
+def packed_chains(size):
+    # size tasks back to back on A, each chained to a shorter task on B that follows it
+    (a, b) = (Resource("A"), Resource("B"))
+    for i in range(size):
+        first = Task(i * 30, 30, f"product.{i}", a, "LOAD", 5)
+        second = Task(i * 30 + 30, 20, f"product.{i}", b, "UNLOAD", 5)
+        (first.next_task, second.prev_task) = (second, first)
+        a.add_task(first)
+        b.add_task(second)
+    return a, b
+
+
+def case_align_tasks(size):
+    # a task in front of A moves every A task once and, through the chains, every B task once
+    (a, b) = packed_chains(size)
+    task = Task(0, 10, "product.new", a, "LOAD", 5)
+
+    def run():
+        a.insert_task(task, 0)
+        check(b.tasks[-1].start == size * 30 + 10, "cascade did not reach the last B task")
+        return size * 2
+
+    return run
+
+
+def case_validate_timeline(size):
+    (a, _) = packed_chains(size)
+
+    def run():
+        check(a.validate_timeline() == (None, None), "packed chains overlap")
+        return size
+
+    return run
+
+
+CASES = {
+    "schedule_forward": case_schedule_forward,
+    "schedule_forward/checked": case_schedule_forward_checked,
+    "insert_sequence": case_insert_sequence,
+    "insert_sequences": case_insert_sequences,
+    "find_time/hand/sparse": case_find_time(False, 0.5),
+    "find_time/hand/dense": case_find_time(False, 0.99),
+    "find_time/oven/sparse": case_find_time(True, 0.5),
+    "find_time/oven/dense": case_find_time(True, 0.99),
+    "align_tasks": case_align_tasks,
+    "validate_timeline": case_validate_timeline,
+}
+
+
+def run_case(setup, size, repeat):
+    # best of repeat timed runs, each next to a calibration_loop run (the median of those is
+    # the calibration), then one traced run: peak memory covers setup and run, replans only
+    # the run
+    best = None
+    calibrations = []
+    for _ in range(repeat):
+        run = setup(size)
+        started = timer()
+        ops = run()
+        elapsed = timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+        started = timer()
+        calibrations.append(calibration_loop() / (timer() - started))
+
+    tracemalloc.start()
+    sink = None
+    try:
+        run = setup(size)
+        sink = tracer.add_sink(CountingSink(), INFO)
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        if sink is not None:
+            tracer.remove_sink(sink)
+    return {"ops": ops, "seconds": best, "ops_per_sec": ops / best, "calibration": statistics.median(calibrations),
+            "peak_bytes": peak, "replans": sink.counts["Replan"]}
+
+
+class _Item:
+    __slots__ = ("start", "end")
+
+
+def calibration_loop(count=20000):
+    # fixed interpreter work of the kind the cases do: slot attributes, bisection with a key,
+    # dict updates and a heap; returns the number of items
+    items = []
+    by_start = {}
+    heap = []
+    for i in range(count):
+        item = _Item()
+        item.start = i * 7919 % count
+        item.end = item.start + 30
+        items.insert(bisect_right(items, item.start, key=_start), item)
+        by_start[item.start] = item
+        heapq.heappush(heap, (item.end, i))
+    while heap:
+        (end, _) = heapq.heappop(heap)
+        by_start[end - 30].end += 1
+    return count
+
+
+def _start(item):
+    return item.start
+
+
+def run_suite(sizes=SIZES, cases=None, repeat=3):
+    results = {}
+    for (name, setup) in CASES.items():
+        if cases and not any(name.startswith(case) for case in cases):
+            continue
+        for size in sizes:
+            key = f"{name}/{size}"
+            results[key] = run_case(setup, size, repeat)
+            row = results[key]
+            print(f"{key:<34} {row['ops_per_sec']:>12.0f} {row['peak_bytes'] / 2 ** 20:>9.1f} {row['replans']:>8}",
+                  flush=True)
+    return results
+
+
+def profile_suite(sizes, cases, memory=False, limit=15):
+    # one profiled run per case and size instead of timings
+    for (name, setup) in CASES.items():
+        if cases and not any(name.startswith(case) for case in cases):
+            continue
+        for size in sizes:
+            run = setup(size)
+            with profiled(memory=memory) as profile:
+                run()
+            print(f"=== {name}/{size}")
+            print(profile.report(limit))
+
+
+def compare(results, baseline, threshold):
+    # Regressions against a baseline: slower relative to the calibration loop or bigger by
+    # more than threshold, or more replans. Peak memory depends on the Python version and is
+    # only compared on the one the baseline was recorded with.
+    regressions = []
+    same_python = baseline["python"] == platform.python_version()
+    for (key, row) in results.items():
+        old = baseline["cases"].get(key)
+        if old is None or "calibration" not in old:
+            continue
+        scale = row["calibration"] / old["calibration"]
+        expected = old["ops_per_sec"] * scale
+        if row["ops_per_sec"] < expected * (1 - threshold):
+            regressions.append(f"{key}: {row['ops_per_sec']:.0f} ops/sec, baseline {expected:.0f} "
+                               f"({old['ops_per_sec']:.0f} recorded, calibrated x{scale:.2f})")
+        if same_python and row["peak_bytes"] > old["peak_bytes"] * (1 + threshold):
+            regressions.append(f"{key}: peak {row['peak_bytes']} bytes, baseline {old['peak_bytes']}")
+        if row["replans"] > old["replans"]:
+            regressions.append(f"{key}: {row['replans']} replans, baseline {old['replans']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as file:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(), "cases": results}, file,
+                  indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduler benchmark suite.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--cases", nargs="+", default=None, help="case name prefixes, e.g. find_time/oven")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown or memory growth")
+    parser.add_argument("--save", action="store_true",
+                        help="write the results as the new baseline (done anyway when there is none)")
+    parser.add_argument("--tables", action="store_true", help="print the comparison tables instead")
+    parser.add_argument("--profile", choices=["cpu", "memory"], default=None,
+                        help="print a cProfile (with memory: also tracemalloc) report per case instead")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure import time and RSS; fails if the core loads plotting or numpy")
+    args = parser.parse_args()
+
+    if args.startup:
+        failed = print_startup()
+        if failed:
+            print(f"Core modules loading heavy dependencies: {', '.join(failed)}")
+        sys.exit(1 if failed else 0)
+    if args.tables:
+        print_tables()
+        sys.exit()
+    if args.profile:
+        profile_suite(args.sizes, args.cases, memory=args.profile == "memory")
+        sys.exit()
+
+    print(f"{'case':<34} {'ops/sec':>12} {'peak, MB':>9} {'replans':>8}")
+    results = run_suite(args.sizes, args.cases, args.repeat)
+    if args.save or not os.path.exists(args.baseline):
+        save_baseline(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+    else:
+        regressions = compare(results, load_baseline(args.baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions past {args.threshold:.0%} against {args.baseline}")
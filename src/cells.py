@@ -0,0 +1,180 @@
+import argparse
+import math
+import multiprocessing
+from itertools import islice
+from timeit import default_timer as timer
+
+import resources as resource_sets
+from service import SchedulingService, day_orders
+from simulation import build_scheduler
+from timeline import compact_schedule
+
+
+class Cell:
+    # router-side view of a cell: its last reported load and what was routed to it since
+    __slots__ = ("index", "ovens", "total_time", "pending", "orders")
+
+    def __init__(self, index, ovens):
+        self.index = index
+        self.ovens = ovens
+        self.total_time = 0  # max get_total_time of its resources after the last round
+        self.pending = 0  # oven seconds routed to it in the current round
+        self.orders = 0
+
+
+# Routing policies: policy(cells, order) -> index of the cell that gets the order
+
+def least_loaded(cells, order):
+    # the cell expected to be free first: its reported get_total_time (or the order start, if
+    # later) plus the oven time routed to it this round, spread over its ovens
+    return min(cells, key=lambda cell: (max(cell.total_time, order["start_time"]) + cell.pending / cell.ovens,
+                                        cell.index)).index
+
+
+def round_robin(cells, order):
+    return min(cells, key=lambda cell: (cell.orders, cell.index)).index
+
+
+POLICIES = {"least_loaded": least_loaded, "round_robin": round_robin}
+
+
+def _serve(connection, oven, evict_every, settings):
+    # worker process of one cell; every request gets one (error, value) reply
+    service = SchedulingService(build_scheduler(oven, **settings), oven, evict_every)
+    scheduler = service.scheduler
+    while True:
+        (command, payload) = connection.recv()
+        try:
+            if command == "orders":
+                placed = [(order["order"], service.assign(order)) for order in payload]
+                value = (placed, max(r.get_total_time() for r in scheduler.resources.values()))
+            elif command == "schedule":
+                value = compact_schedule(scheduler.resources)
+            elif command == "report":
+                value = (service.report(), scheduler.resource_utilization(service.counters["orders"], payload))
+            elif command == "close":
+                connection.close()
+                return
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except Exception as error:
+            connection.send((error, None))
+        else:
+            connection.send((None, value))
+
+
+class ShardedScheduler:
+    """Orders spread over independent cells, each with its own Scheduler in a worker process.
+
+    schedule() routes orders in rounds of up to chunk orders per cell: policy(cells, order)
+    picks a cell for every order from the loads reported after the previous round plus what
+    was routed this round, then every cell gets its share in one message and schedules it in
+    parallel with the others. Cells share no resources, so each one schedules exactly what a
+    single Scheduler given its orders would. Worker errors are raised in the caller.
+    """
+
+    def __init__(self, count, oven, policy=least_loaded, chunk=64, evict_every=None, **settings):
+        # settings go to build_scheduler; evict_every=None keeps every task for resources()
+        self.policy = policy
+        self.chunk = chunk
+        self.cells = [Cell(index, len(oven)) for index in range(count)]
+        self.connections = []
+        self.processes = []
+        context = multiprocessing.get_context()
+        for _ in range(count):
+            (here, there) = context.Pipe()
+            process = context.Process(target=_serve, daemon=True,
+                                      args=(there, oven, evict_every or math.inf, settings))
+            process.start()
+            there.close()
+            self.connections.append(here)
+            self.processes.append(process)
+
+    def _ask(self, requests):
+        # Sends (cell index, command, payload) requests, then collects the replies in order.
+        # Every reply is received before the first error is raised, so no reply is left in a
+        # pipe to be taken for the answer to a later request.
+        for (index, command, payload) in requests:
+            self.connections[index].send((command, payload))
+        replies = [self.connections[index].recv() for (index, _, _) in requests]
+        for (error, _) in replies:
+            if error is not None:
+                raise error
+        return [value for (_, value) in replies]
+
+    def schedule(self, orders):
+        # order -> (cell index, [(resource name, start, end)]) for every order
+        assigned = {}
+        orders = iter(orders)
+        while batch := list(islice(orders, self.chunk * len(self.cells))):
+            shares = [[] for _ in self.cells]
+            for order in batch:
+                cell = self.cells[self.policy(self.cells, order)]
+                cell.pending += order["cook_time"]
+                cell.orders += 1
+                shares[cell.index].append(order)
+            requests = [(index, "orders", share) for (index, share) in enumerate(shares) if share]
+            for ((index, _, _), (placed, total_time)) in zip(requests, self._ask(requests)):
+                (self.cells[index].total_time, self.cells[index].pending) = (total_time, 0)
+                for (order_id, tasks) in placed:
+                    assigned[order_id] = (index, tasks)
+        return assigned
+
+    def resources(self):
+        # one merged view, "cell/resource" -> CompactTimeline, for reporting and plot_schedule
+        merged = {}
+        schedules = self._ask([(index, "schedule", None) for index in range(len(self.cells))])
+        for (index, timelines) in enumerate(schedules):
+            for (name, timeline) in timelines.items():
+                timeline.name = f"{index}/{name}"
+                merged[timeline.name] = timeline
+        return merged
+
+    def report(self, pickup_emulation_time=None):
+        # per cell: the service report and resource_utilization over the orders it got
+        return self._ask([(index, "report", pickup_emulation_time) for index in range(len(self.cells))])
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schedule a multi-day order stream on several independent cells.")
+    parser.add_argument("--cells", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--volume", type=int, default=1, help="copies of the day profile arriving together")
+    parser.add_argument("--oven", default="OVEN2")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="least_loaded")
+    parser.add_argument("--seed", type=int, default=123)
+    args = parser.parse_args()
+
+    oven = getattr(resource_sets, args.oven)
+    settings = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                    cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+    orders = []
+    for copy in range(args.volume):
+        for order in list(day_orders(args.days, args.seed + copy, **settings)):
+            order["order"] = f"{order['order']}/{copy}"
+            orders.append(order)
+    orders.sort(key=lambda order: order["start_time"])
+
+    with ShardedScheduler(args.cells, oven, POLICIES[args.policy], evict_every=3600) as sharded:
+        started = timer()
+        assigned = sharded.schedule(orders)
+        elapsed = timer() - started
+        print(f"{len(assigned)} orders on {args.cells} cells in {elapsed:.2f}s ({len(assigned) / elapsed:.0f}/s)")
+        print(f"{'cell':>4} {'orders':>7} {'shifted':>8} {'avg shift, s':>12} {'live tasks':>10}")
+        for (index, (report, _)) in enumerate(sharded.report()):
+            print(f"{index:>4} {report['orders']:>7} {report['shifted']:>8} {report['avg_shift']:>12.1f} "
+                  f"{report['live_tasks']:>10}")
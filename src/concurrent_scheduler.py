@@ -0,0 +1,277 @@
+import argparse
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+import resources as resource_sets
+from groups import GROUP_MIN_SIZE
+from scheduler import Scheduler
+
+
+class ConcurrentScheduler(Scheduler):
+    """Scheduler shared by threads placing orders at the same time.
+
+    schedule_forward plans optimistically: the candidates of a step are locked only while
+    they are queried, and the version each resource had when it was first read is kept.
+    The plan is committed under the locks of every resource it read, taken in one global
+    order, if none of their versions changed since; otherwise it is planned again. A commit
+    is the serial schedule_forward at that moment, and orders that read disjoint sets of
+    resources never wait for each other.
+
+    A task that does not fit its gap pushes others, and that cascade can reach any
+    resource through the product chains; such commits take every lock. insert_sequence
+    commits the same way when none of its steps push and no resource repeats, and takes
+    every lock otherwise, as do schedule_backward, insert_sequences and evict. Snapshots,
+    stats, usage metering, the slot cache and invariant checks keep state shared by all
+    resources and are refused.
+    """
+
+    def __init__(self, resources, group_min_size=GROUP_MIN_SIZE):
+        super().__init__(resources, group_min_size)
+        self.locks = {resource: threading.RLock() for resource in resources.values()}
+        self.ranks = {resource: rank for (rank, resource) in enumerate(resources.values())}
+        self.counts = Counter()
+        self.commits = []  # (method, arguments) in the order they took effect
+        self._counts_lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def locked(self, resources):
+        ordered = sorted(set(resources), key=self.ranks.__getitem__)
+        for resource in ordered:
+            self.locks[resource].acquire()
+        try:
+            yield
+        finally:
+            for resource in reversed(ordered):
+                self.locks[resource].release()
+
+    def exclusive(self):
+        # every lock, for anything else that changes the timelines
+        return self.locked(self.resources.values())
+
+    def _count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def _check_shared(self):
+        if any(feature is not None for feature in (self.journal, self.perf, self.usage, self.cache, self.checker)):
+            raise RuntimeError("snapshots, stats, usage, the slot cache and invariant checks are single-threaded")
+
+    def _read(self, resources):
+        reads = getattr(self._local, "reads", None)
+        if reads is not None:
+            for resource in resources:
+                reads.setdefault(resource, resource.version)
+
+    @staticmethod
+    def _unchanged(reads):
+        return all(resource.version == version for (resource, version) in reads.items())
+
+    def evaluate_resources(self, task_data, start_time, product_id):
+        members = [self.resources[name] for name in task_data['resource']]
+        with self.locked(members):
+            self._read(members)
+            return super().evaluate_resources(task_data, start_time, product_id)
+
+    def find_resource_to_insert(self, task_data, start_time, product_id):
+        members = [self.resources[name] for name in task_data['resource']]
+        with self.locked(members):
+            self._read(members)
+            return super().find_resource_to_insert(task_data, start_time, product_id)
+
+    def schedule_forward(self, sequence, product_id, start_time=0):
+        self._check_shared()
+        while True:
+            self._local.reads = reads = {}
+            try:
+                planned = self.plan_forward(sequence, product_id, start_time)
+            finally:
+                self._local.reads = None
+            with self.locked(reads):
+                if not self._unchanged(reads):
+                    self._count("conflicts")
+                    continue
+                if not any(resource.pushes(task) for (resource, task) in planned):
+                    return self._commit_forward(sequence, product_id, start_time, planned)
+            with self.exclusive():
+                if self._unchanged(reads):
+                    self._count("exclusive")
+                    return self._commit_forward(sequence, product_id, start_time, planned)
+            self._count("conflicts")
+
+    def _commit_forward(self, sequence, product_id, start_time, planned):
+        if self.recorder is not None:
+            self.recorder.forward(sequence, product_id, start_time, planned)
+        self.commit_plan(planned, start_time)
+        self.commits.append(("schedule_forward", (sequence, product_id, start_time)))
+        self._count("commits")
+        return [task for (_, task) in planned]
+
+    def insert_sequence(self, sequence, start_time, product_id):
+        self._check_shared()
+        while True:
+            self._local.reads = reads = {}
+            try:
+                planned = []  # (resource, task, index)
+                prev_task = None
+                for step in sequence:
+                    start = start_time if prev_task is None else prev_task.end
+                    (resource, task, index) = self.find_resource_to_insert(step, start, product_id)
+                    task.prev_task = prev_task
+                    if prev_task:
+                        prev_task.next_task = task
+                    planned.append((resource, task, index))
+                    prev_task = task
+            finally:
+                self._local.reads = None
+            # a step on a resource an earlier step was placed on sees the timeline with it
+            separate = len({resource for (resource, _, _) in planned}) == len(planned)
+            with self.locked(reads):
+                if not self._unchanged(reads):
+                    self._count("conflicts")
+                    continue
+                if separate and not any(resource.pushes(task, index) for (resource, task, index) in planned):
+                    for (resource, task, index) in planned:
+                        resource.insert_task(task, index)
+                    if self.recorder is not None:
+                        self.recorder.inserted(sequence, start_time, product_id,
+                                               [(resource, task.start, index) for (resource, task, index) in planned])
+                    self.commits.append(("insert_sequence", (sequence, start_time, product_id)))
+                    self._count("commits")
+                    return planned[0][1].start, planned[-1][1].end
+            with self.exclusive():
+                self._count("exclusive")
+                self.commits.append(("insert_sequence", (sequence, start_time, product_id)))
+                self._count("commits")
+                return super().insert_sequence(sequence, start_time, product_id)
+
+    def schedule_backward(self, sequence, product_id, end_time, start_time=None):
+        self._check_shared()
+        with self.exclusive():
+            self.commits.append(("schedule_backward", (sequence, product_id, end_time, start_time)))
+            self._count("commits")
+            return super().schedule_backward(sequence, product_id, end_time, start_time)
+
+    def insert_sequences(self, items):
+        self._check_shared()
+        with self.exclusive():
+            self.commits.append(("insert_sequences", (items,)))
+            self._count("commits")
+            return super().insert_sequences(items)
+
+    def evict(self, now):
+        with self.exclusive():
+            return super().evict(now)
+
+
+def line_resources(oven, lines):
+    # the resources of build_scheduler once per line, named "line/name"
+    from simulation import build_scheduler
+
+    resources = {}
+    for line in range(lines):
+        for resource in build_scheduler(oven).resources.values():
+            resource.name = f"{line}/{resource.name}"
+            resources[resource.name] = resource
+    return resources
+
+
+def line_sequence(sequence, prefix):
+    return [dict(step, resource=[prefix + name for name in step["resource"]]) for step in sequence]
+
+
+def timelines(scheduler):
+    return {name: [(task.start, task.end, task.product_id) for task in resource.tasks]
+            for (name, resource) in scheduler.resources.items()}
+
+
+def stress(threads, count, oven, lines, pickups=0.0, seed=0, shared=True):
+    # threads place count orders each, on lines independent copies of the resources (1:
+    # every thread on the same ones), with a share of pickups inserted after them. shared
+    # runs them on one ConcurrentScheduler, else on a Scheduler behind one global lock.
+    # Returns the scheduler, elapsed seconds and the problems found: overlapping tasks that
+    # placing the committed calls one by one on a fresh Scheduler does not produce as well
+    # (pickup cascades can overlap there too), and any other difference from it.
+    # numpy (order generation) is only imported for the stress run
+    from data_generator import init_seed, generate_orders
+    from simulation import generate_order_sequence, generate_pickup_sequence
+
+    if shared:
+        scheduler = ConcurrentScheduler(line_resources(oven, lines))
+        call = lambda method, *arguments: getattr(scheduler, method)(*arguments)
+    else:
+        scheduler = Scheduler(line_resources(oven, lines))
+        scheduler.commits = []
+        lock = threading.Lock()
+
+        def call(method, *arguments):
+            with lock:
+                scheduler.commits.append((method, arguments))
+                return getattr(scheduler, method)(*arguments)
+
+    init_seed(seed)
+    orders = generate_orders(count=count * threads, cook_time_base=7 * 60, cook_time_scale=30,
+                             cook_min_time=6 * 60, cook_max_time=8 * 60, pickup_max_time=10 * 60)
+    errors = []
+
+    def work(index):
+        rnd = random.Random(seed + index)
+        prefix = f"{index % lines}/"
+        try:
+            for order in orders[index::threads]:
+                product_id = f"{index}.{order['order']}"
+                sequence = line_sequence(generate_order_sequence(oven, order["cook_time"]), prefix)
+                tasks = call("schedule_forward", sequence, product_id, order["start_time"] + rnd.randrange(600))
+                if rnd.random() < pickups:
+                    call("insert_sequence", line_sequence(generate_pickup_sequence(), prefix),
+                         tasks[-1].end + order["pickup_timeout"], product_id)
+        except Exception as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    started = timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = timer() - started
+    if errors:
+        raise errors[0]
+
+    serial = Scheduler(line_resources(oven, lines))
+    for (method, arguments) in scheduler.commits:
+        getattr(serial, method)(*arguments)
+    problems = [f"overlap on {resource.name} at {resource.validate_timeline()[0]}"
+                for resource in scheduler.resources.values()
+                if resource.validate_timeline()[0] is not None
+                and serial.resources[resource.name].validate_timeline()[0] is None]
+    if timelines(serial) != timelines(scheduler):
+        problems.append("differs from the committed calls placed one by one")
+    return scheduler, elapsed, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Place orders from several threads on one ConcurrentScheduler "
+                                                 "and check the result.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=200, help="orders per thread")
+    parser.add_argument("--oven", default="OVEN2")
+    parser.add_argument("--pickups", type=float, default=0.2, help="share of orders with a pickup")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    oven = getattr(resource_sets, args.oven)
+    failed = False
+    print(f"{'resources':<10} {'locking':<8} {'calls':>6} {'time, s':>8} {'conflicts':>9} {'exclusive':>9}  check")
+    for (name, lines) in (("shared", 1), ("lines", args.threads)):
+        for shared in (False, True):
+            (scheduler, elapsed, problems) = stress(args.threads, args.orders, oven, lines, args.pickups, args.seed,
+                                                    shared)
+            counts = scheduler.counts if shared else {"conflicts": "-", "exclusive": "-"}
+            print(f"{name:<10} {'versions' if shared else 'global':<8} {len(scheduler.commits):>6} {elapsed:>8.2f} "
+                  f"{counts['conflicts']:>9} {counts['exclusive']:>9}  {'; '.join(problems) or 'ok'}")
+            failed = failed or bool(problems)
+    raise SystemExit(1 if failed else 0)
@@ -19,37 +19,107 @@ bus_time = [
 ]
 
 
-def generate_order_distribution(bus_time, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, cook_extra_time, pickup_max_time):
-    tmd = [i for i, bt in enumerate(bus_time) if bt != 0]
-    bus_time = [bt for bt in bus_time if bt != 0]
-
-    result = []
-    for bt, tm in zip(bus_time, tmd):
-        ords = list(range(1, bt + 1))
-        cook = generate_cook_times(bt, cook_time_base, cook_time_scale, cook_min_time, cook_max_time)
-        wait = generate_pickup_timeouts(bt, pickup_max_time)
-        start = random.sample(seconds_in_hour, bt)
-        start.sort()
-
-        for i in range(bt):
-            order_num = f"{tm}.{ords[i]}"
-            cook_time = cook[i]
-            wait_time = int(wait[i])
-            start_time = int(start[i])
-            end_time = start_time + cook_time + cook_extra_time
-            pickup_timeout = wait_time
-            result.append({
-                'order': order_num,
-                'hour': tm,
-                'cook_time': cook_time,
-                'start_time': start_time + 3600 * tm,
-                'end_time': end_time + 3600 * tm,
-                'pickup_timeout': pickup_timeout
-            })
-
-    print("Orders distribution:")
-    for row in result[:]:
-        print(row)
+# One order per row; order ids are f"{hour}.{number}" for bus_time orders and f"order.{number}" otherwise
+ORDER_DTYPE = np.dtype([
+    ("day", "i4"),
+    ("hour", "i4"),
+    ("number", "i4"),
+    ("cook_time", "i4"),
+    ("start_time", "i8"),
+    ("end_time", "i8"),
+    ("pickup_timeout", "f8"),
+])
+
+
+def order_batches(bus_time, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, cook_extra_time,
+                  pickup_max_time, days=1, chunk_days=1, exact=False):
+    # Orders of generate_order_distribution for days days as ORDER_DTYPE arrays of chunk_days days
+    # each; start times continue by 86400 per day. Draws come from the generators init_seed
+    # seeds: a whole chunk at once, or with exact=True hour by hour in the order
+    # generate_order_distribution draws them, so day 0 equals it and every next day equals
+    # calling it again.
+    hours = [(tm, bt) for tm, bt in enumerate(bus_time) if bt != 0]
+    per_day = sum(bt for (_, bt) in hours)
+    for first_day in range(0, days, chunk_days):
+        batch_days = range(first_day, min(first_day + chunk_days, days))
+        batch = np.empty(per_day * len(batch_days), ORDER_DTYPE)
+        draw = _draw_hour_by_hour if exact else _draw_chunk
+        draw(batch, hours, batch_days, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, pickup_max_time)
+        batch["end_time"] = batch["start_time"] + batch["cook_time"] + cook_extra_time
+        yield batch
+
+
+def _draw_hour_by_hour(batch, hours, days, cook_time_base, cook_time_scale, cook_min_time, cook_max_time,
+                       pickup_max_time):
+    at = 0
+    for day in days:
+        for (tm, bt) in hours:
+            rows = batch[at:at + bt]
+            rows["day"] = day
+            rows["hour"] = tm
+            rows["number"] = np.arange(1, bt + 1)
+            rows["cook_time"] = cook_time_array(bt, cook_time_base, cook_time_scale, cook_min_time, cook_max_time)
+            rows["pickup_timeout"] = generate_pickup_timeouts(bt, pickup_max_time).astype(np.int64)
+            start = random.sample(seconds_in_hour, bt)
+            start.sort()
+            rows["start_time"] = np.array(start) + 3600 * tm + 86400 * day
+            at += bt
+
+
+def _draw_chunk(batch, hours, days, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, pickup_max_time):
+    counts = np.tile([bt for (_, bt) in hours], len(days))
+    slots = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    batch["day"] = np.repeat(np.asarray(days), len(hours))[slots]
+    batch["hour"] = np.tile([tm for (tm, _) in hours], len(days))[slots]
+    batch["number"] = np.arange(len(batch)) - first[slots] + 1
+    batch["cook_time"] = cook_time_array(len(batch), cook_time_base, cook_time_scale, cook_min_time, cook_max_time)
+    batch["pickup_timeout"] = generate_pickup_timeouts(len(batch), pickup_max_time).astype(np.int64)
+
+    # distinct seconds within every hour: redraw repeated ones until none are left
+    seconds = np.random.randint(0, 3600, len(batch))
+    while True:
+        keys = np.sort(slots * 3600 + seconds)
+        repeated = np.flatnonzero(keys[1:] == keys[:-1]) + 1
+        if not len(repeated):
+            break
+        seconds = keys - slots * 3600
+        seconds[repeated] = np.random.randint(0, 3600, len(repeated))
+    batch["start_time"] = keys - slots * 3600 + 3600 * batch["hour"] + 86400 * batch["day"]
+
+
+def count_batches(count, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, pickup_max_time,
+                  chunk=1000000):
+    # Orders of generate_orders as ORDER_DTYPE arrays of up to chunk orders; equal to it while
+    # count <= chunk
+    for first in range(0, count, chunk):
+        size = min(chunk, count - first)
+        batch = np.zeros(size, ORDER_DTYPE)
+        batch["number"] = np.arange(first, first + size)
+        batch["cook_time"] = cook_time_array(size, cook_time_base, cook_time_scale, cook_min_time, cook_max_time)
+        batch["pickup_timeout"] = generate_pickup_timeouts(size, pickup_max_time)
+        yield batch
+
+
+def generate_order_distribution(bus_time, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, cook_extra_time, pickup_max_time,
+                                verbose=True):
+    (batch,) = order_batches(bus_time, cook_time_base, cook_time_scale, cook_min_time, cook_max_time, cook_extra_time,
+                             pickup_max_time, exact=True)
+    result = [
+        {
+            'order': f"{hour}.{number}",
+            'hour': hour,
+            'cook_time': cook_time,
+            'start_time': start_time,
+            'end_time': end_time,
+            'pickup_timeout': int(pickup_timeout)
+        } for (_, hour, number, cook_time, start_time, end_time, pickup_timeout) in batch.tolist()
+    ]
+
+    if verbose:
+        print("Orders distribution:")
+        for row in result[:]:
+            print(row)
 
     return result
 
@@ -80,7 +150,11 @@ def generate_pickup_timeouts(count, max_timeout):
     return timeouts
 
 
-def generate_cook_times(count, base_cook_time, scale, min_time, max_time):
+def cook_time_array(count, base_cook_time, scale, min_time, max_time):
     cook_times = np.random.normal(loc=base_cook_time, scale=scale, size=count)
-    return [min_time if cook_time <= min_time else (
-        max_time if cook_time >= max_time else int(round_choose(cook_time, 30, 0))) for cook_time in cook_times]
+    rounded = cook_times - np.mod(cook_times, 30)
+    return np.where(cook_times <= min_time, min_time, np.where(cook_times >= max_time, max_time, rounded)).astype(np.int64)
+
+
+def generate_cook_times(count, base_cook_time, scale, min_time, max_time):
+    return cook_time_array(count, base_cook_time, scale, min_time, max_time).tolist()
@@ -0,0 +1,129 @@
+import json
+from collections import deque
+from typing import NamedTuple, Any
+
+DEBUG = 10
+INFO = 20
+OFF = 100
+
+
+# Events are only built when a sink listens at their level: call sites check
+# `tracer.level <= Event.level` first, so a run without sinks formats nothing.
+
+class CandidateEvaluated(NamedTuple):
+    product_id: Any
+    resource: str
+    start: float
+    distance: float
+    level = DEBUG
+
+    def message(self):
+        return (f"Planning {self.product_id}: candidate resource {self.resource} "
+                f"with time slot started at {self.start}, distance = {self.distance}")
+
+
+class InsertCandidateEvaluated(NamedTuple):
+    product_id: Any
+    resource: str
+    start: float
+    index: int
+    level = DEBUG
+
+    def message(self):
+        return (f"Inserting for {self.product_id}: candidate resource {self.resource} "
+                f"with time slot started at {self.start} at index {self.index}")
+
+
+class StepPlanned(NamedTuple):
+    product_id: Any
+    resource: str
+    desired_start: float
+    start: float
+    level = DEBUG
+
+    def message(self):
+        return (f"Planning {self.product_id}: found resource {self.resource} with time slot started at {self.start}, "
+                f"desired start time = {self.desired_start}")
+
+
+class Replan(NamedTuple):
+    product_id: Any
+    base_start_time: float
+    delta: float
+    level = INFO
+
+    def message(self):
+        return (f"Planning {self.product_id}: schedule shift detected {self.delta}. "
+                f"Replanning from base_start_time = {self.base_start_time}...")
+
+
+class Inserted(NamedTuple):
+    resource: str
+    product_id: Any
+    start: float
+    index: int
+    level = INFO
+
+    def message(self):
+        return f"Resource {self.resource}: inserted {self.product_id} with start {self.start} at index {self.index}"
+
+
+class Shifted(NamedTuple):
+    resource: str
+    product_id: Any
+    index: int
+    start: float
+    delta: float
+    level = DEBUG
+
+    def message(self):
+        return f"Resource {self.resource}: shifting task {self.product_id} at {self.index} in {self.start} for {self.delta}"
+
+
+class Tracer:
+    def __init__(self):
+        self.level = OFF
+        self.sinks = []
+
+    def add_sink(self, sink, level=DEBUG):
+        self.sinks.append((sink, level))
+        self.level = min(self.level, level)
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks = [(s, level) for (s, level) in self.sinks if s is not sink]
+        self.level = min((level for (_, level) in self.sinks), default=OFF)
+
+    def emit(self, event):
+        for (sink, level) in self.sinks:
+            if event.level >= level:
+                sink(event)
+
+
+class RingBufferSink:
+    def __init__(self, capacity=10000):
+        self.events = deque(maxlen=capacity)
+
+    def __call__(self, event):
+        self.events.append(event)
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def __call__(self, event):
+        record = {"event": type(event).__name__}
+        record.update(event._asdict())
+        self.file.write(json.dumps(record, default=str) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class PrintSink:
+    def __call__(self, event):
+        print(event.message())
+
+
+tracer = Tracer()
@@ -0,0 +1,338 @@
+import math
+
+INF = math.inf
+# slack for pruning on aggregated gaps: the exact comparison is done per pair
+EPS = 1e-6
+
+# leaves hold up to LEAF_SIZE tasks, branches up to FANOUT blocks; both split in half
+LEAF_SIZE = 64
+FANOUT = 32
+
+
+class _Block:
+    # A leaf (tasks, with its neighbouring leaves in prev/next) or a branch (children). The
+    # aggregates cover the pairs that start in the block; a leaf's last pair ends on the
+    # first task of the next leaf.
+    __slots__ = ("tasks", "children", "parent", "prev", "next", "size",
+                 "max_gap", "max_end", "min_end", "hack_next", "hack_prev", "hack_second", "dirty")
+
+    def __init__(self, tasks=None, children=None):
+        self.tasks = tasks
+        self.children = children
+        self.parent = None
+        self.prev = None
+        self.next = None
+        self.size = len(tasks) if children is None else sum(child.size for child in children)
+        self.max_gap = -INF
+        self.max_end = -INF
+        self.min_end = INF
+        self.hack_next = INF
+        self.hack_prev = None
+        self.hack_second = INF
+        self.dirty = False
+
+    def after(self, task):
+        # the task after task (one of this leaf's) on its timeline, or None
+        tasks = self.tasks
+        index = tasks.index(task) + 1
+        if index < len(tasks):
+            return tasks[index]
+        # leaves are never empty
+        return self.next.tasks[0] if self.next is not None else None
+
+    def before(self, task):
+        # the task before task on its timeline, or None
+        tasks = self.tasks
+        index = tasks.index(task)
+        if index > 0:
+            return tasks[index - 1]
+        return self.prev.tasks[-1] if self.prev is not None else None
+
+
+class GapIndex:
+    """Ordered index of a resource timeline.
+
+    Position i stands for the pair (tasks[i], tasks[i + 1]) and the free gap between them.
+    The tasks sit in leaves of a B-tree kept in timeline order; every block keeps the
+    largest gap, the end range and the two smallest "next" priorities with distinct "prev"
+    priority, so the earliest pair matching a fit or priority rule is found in O(log n)
+    blocks with first(), the latest one with last(). A task only points to its leaf
+    (task._node): there is no per-task node.
+
+    Shifts only mark the path to the root dirty; aggregates are repaired before the
+    next query, so a cascade moving k tasks pays for the leaves it touched.
+    """
+
+    def __init__(self):
+        self.root = _Block([])
+
+    def __len__(self):
+        return self.root.size
+
+    def min_next_priority(self):
+        # smallest priority of a task that follows another one
+        self._clean(self.root)
+        return self.root.hack_next
+
+    def insert(self, index, task):
+        leaf = self.root
+        while leaf.children is not None:
+            for child in leaf.children:
+                if index < child.size or child is leaf.children[-1]:
+                    break
+                index -= child.size
+            leaf = child
+        leaf.tasks.insert(index, task)
+        task._node = leaf
+        self._grow(leaf, 1)
+        self._mark(leaf)
+        if index == 0 and leaf.prev is not None:
+            self._mark(leaf.prev)
+        if len(leaf.tasks) > LEAF_SIZE:
+            self._split(leaf, len(leaf.tasks) // 2)
+
+    def extend(self, tasks):
+        # Appends tasks, sorted by start, after the last one in O(len(tasks)); leaves are
+        # filled up before they split, and are left dirty for one _clean.
+        leaf = self.root
+        while leaf.children is not None:
+            leaf = leaf.children[-1]
+        self._mark(leaf)
+        for task in tasks:
+            leaf.tasks.append(task)
+            task._node = leaf
+            self._grow(leaf, 1)
+            if len(leaf.tasks) > LEAF_SIZE:
+                leaf = self._split(leaf, LEAF_SIZE)
+
+    def remove(self, task):
+        leaf = task._node
+        tasks = leaf.tasks
+        index = tasks.index(task)
+        del tasks[index]
+        task._node = None
+        self._grow(leaf, -1)
+        if index == 0 and leaf.prev is not None:
+            self._mark(leaf.prev)
+        if tasks or leaf is self.root:
+            self._mark(leaf)
+        else:
+            self._unlink(leaf)
+
+    def moved(self, task):
+        # task start/end changed: refresh its own gap and the gap of its predecessor
+        leaf = task._node
+        self._mark(leaf)
+        if leaf.prev is not None and leaf.tasks[0] is task:
+            self._mark(leaf.prev)
+
+    def position(self, task):
+        block = task._node
+        index = block.tasks.index(task)
+        while block.parent is not None:
+            for sibling in block.parent.children:
+                if sibling is block:
+                    break
+                index += sibling.size
+            block = block.parent
+        return index
+
+    def first(self, lo, tree_ok, pair_ok):
+        # first (position, task) at or after lo whose pair pair_ok(task, next task or None)
+        # accepts; blocks rejected by tree_ok are skipped
+        self._clean(self.root)
+        return self._first(self.root, lo, 0, tree_ok, pair_ok)
+
+    def _first(self, block, lo, offset, tree_ok, pair_ok):
+        if not tree_ok(block):
+            return None
+        if block.children is None:
+            tasks = block.tasks
+            last = len(tasks) - 1
+            for index in range(max(lo - offset, 0), last):
+                if pair_ok(tasks[index], tasks[index + 1]):
+                    return offset + index, tasks[index]
+            if 0 <= last and lo - offset <= last:
+                following = block.next.tasks[0] if block.next is not None else None
+                if pair_ok(tasks[last], following):
+                    return offset + last, tasks[last]
+            return None
+        for child in block.children:
+            if offset + child.size > lo:
+                found = self._first(child, lo, offset, tree_ok, pair_ok)
+                if found is not None:
+                    return found
+            offset += child.size
+        return None
+
+    def last(self, hi, tree_ok, pair_ok):
+        # last (position, task) at or before hi accepted by pair_ok, the mirror of first()
+        self._clean(self.root)
+        return self._last(self.root, hi, 0, tree_ok, pair_ok)
+
+    def _last(self, block, hi, offset, tree_ok, pair_ok):
+        if not tree_ok(block):
+            return None
+        if block.children is None:
+            tasks = block.tasks
+            index = min(hi - offset, len(tasks) - 1)
+            if index == len(tasks) - 1 and index >= 0:
+                following = block.next.tasks[0] if block.next is not None else None
+                if pair_ok(tasks[index], following):
+                    return offset + index, tasks[index]
+                index -= 1
+            while index >= 0:
+                if pair_ok(tasks[index], tasks[index + 1]):
+                    return offset + index, tasks[index]
+                index -= 1
+            return None
+        end = offset + block.size
+        for child in reversed(block.children):
+            end -= child.size
+            if end <= hi:
+                found = self._last(child, hi, end, tree_ok, pair_ok)
+                if found is not None:
+                    return found
+        return None
+
+    @staticmethod
+    def _grow(block, delta):
+        while block is not None:
+            block.size += delta
+            block = block.parent
+
+    @staticmethod
+    def _mark(block):
+        while block is not None and not block.dirty:
+            block.dirty = True
+            block = block.parent
+
+    def _split(self, block, at):
+        # moves the items of block from at on into a new block right after it; returns it
+        if block.children is None:
+            right = _Block(block.tasks[at:])
+            del block.tasks[at:]
+            for task in right.tasks:
+                task._node = right
+            (right.prev, right.next) = (block, block.next)
+            if block.next is not None:
+                block.next.prev = right
+            block.next = right
+        else:
+            right = _Block(children=block.children[at:])
+            del block.children[at:]
+            for child in right.children:
+                child.parent = right
+        block.size -= right.size
+
+        parent = block.parent
+        if parent is None:
+            parent = self.root = _Block(children=[block])
+            parent.size += right.size
+            block.parent = parent
+        parent.children.insert(parent.children.index(block) + 1, right)
+        right.parent = parent
+        self._mark(block)
+        self._mark(right)
+        if len(parent.children) > FANOUT:
+            self._split(parent, len(parent.children) // 2)
+        return right
+
+    def _unlink(self, block):
+        # drops an empty block from its parent, and the parent once it is empty too
+        if block.children is None:
+            (prev_leaf, next_leaf) = (block.prev, block.next)
+            if prev_leaf is not None:
+                prev_leaf.next = next_leaf
+                self._mark(prev_leaf)
+            if next_leaf is not None:
+                next_leaf.prev = prev_leaf
+        parent = block.parent
+        parent.children.remove(block)
+        block.parent = None
+        if parent.children:
+            self._mark(parent)
+        elif parent is self.root:
+            self.root = _Block([])
+        else:
+            self._unlink(parent)
+        root = self.root
+        while root.children is not None and len(root.children) == 1:
+            root = self.root = root.children[0]
+            root.parent = None
+
+    def _clean(self, block):
+        if not block.dirty:
+            return
+        if block.children is None:
+            self._pull_leaf(block)
+        else:
+            for child in block.children:
+                self._clean(child)
+            self._pull(block)
+        block.dirty = False
+
+    @staticmethod
+    def _pull_leaf(leaf):
+        tasks = leaf.tasks
+        following = leaf.next.tasks[0] if leaf.next is not None else None
+        max_gap = -INF
+        max_end = -INF
+        min_end = INF
+        best_next, best_prev, second = INF, None, INF
+        for index in range(len(tasks) - 1, -1, -1):
+            task = tasks[index]
+            end = task.end
+            if end > max_end:
+                max_end = end
+            if end < min_end:
+                min_end = end
+            if following is not None:
+                if following.start - end > max_gap:
+                    max_gap = following.start - end
+                # the two smallest next priorities with distinct prev priority
+                (next_priority, prev_priority) = (following.priority, task.priority)
+                if next_priority < best_next:
+                    if prev_priority != best_prev:
+                        second = best_next
+                    (best_next, best_prev) = (next_priority, prev_priority)
+                elif prev_priority != best_prev and next_priority < second:
+                    second = next_priority
+            following = task
+
+        leaf.max_gap = max_gap
+        leaf.max_end = max_end
+        leaf.min_end = min_end
+        leaf.hack_next = best_next
+        leaf.hack_prev = best_prev
+        leaf.hack_second = second
+
+    @staticmethod
+    def _pull(block):
+        children = block.children
+        max_gap = -INF
+        max_end = -INF
+        min_end = INF
+        best_next, best_prev = INF, None
+        for child in children:
+            if child.max_gap > max_gap:
+                max_gap = child.max_gap
+            if child.max_end > max_end:
+                max_end = child.max_end
+            if child.min_end < min_end:
+                min_end = child.min_end
+            if child.hack_next < best_next:
+                best_next, best_prev = child.hack_next, child.hack_prev
+
+        second = INF
+        for child in children:
+            candidate = child.hack_next if child.hack_prev != best_prev else child.hack_second
+            if candidate < second:
+                second = candidate
+
+        block.max_gap = max_gap
+        block.max_end = max_end
+        block.min_end = min_end
+        block.hack_next = best_next
+        block.hack_prev = best_prev
+        block.hack_second = second
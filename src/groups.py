@@ -0,0 +1,91 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+
+from gap_index import INF
+from resources import OvenResource, CapacityResource
+
+GROUP_MIN_SIZE = 3
+
+
+class ResourceGroup:
+    """Interchangeable resources of one kind that answer find_slot together.
+
+    A member whose last task starts at or before start_time can only offer its tail:
+    start = max(start_time, tail) with tail = last end (+ extra_duration * 2 for ovens),
+    and a distance falling as the tail grows. Of those members only the one with the
+    smallest (tail, position) can win the earlier start / larger distance / earlier
+    position tie-break, and a min-heap keyed that way finds it. Members booked after
+    start_time, the first empty member and members where the load-unload priority hack
+    can apply are still queried; everything else is skipped.
+    """
+
+    def __init__(self, members):
+        if not ResourceGroup.fits(members):
+            raise ValueError("group members must be resources of the same kind")
+        self.members = list(members)
+        self.oven = isinstance(self.members[0], OvenResource)
+        self.pad = self.members[0].extra_duration * 2 if self.oven else 0
+        self.tails = []  # heap of (tail, position, version)
+        self.versions = [0] * len(self.members)
+        self.last_starts = []  # sorted (last start, position) of non-empty members
+        self.last_start = [None] * len(self.members)
+        self.low = [INF] * len(self.members)  # smallest priority following another task
+        self.empty = set()
+        self.dirty = set(range(len(self.members)))
+        for (position, member) in enumerate(self.members):
+            member.groups.append((self, position))
+
+    @staticmethod
+    def fits(members):
+        # capacity resources have no tail a later start has to wait for
+        kinds = {(type(member), getattr(member, "extra_duration", None)) for member in members}
+        return len(kinds) == 1 and not isinstance(members[0], CapacityResource)
+
+    def _refresh(self):
+        for position in self.dirty:
+            member = self.members[position]
+            last_start = self.last_start[position]
+            if last_start is not None:
+                del self.last_starts[bisect_left(self.last_starts, (last_start, position))]
+            self.versions[position] += 1
+            self.empty.discard(position)
+            if member.tasks:
+                last = member.tasks[-1]
+                self.last_start[position] = last.start
+                insort(self.last_starts, (last.start, position))
+                heapq.heappush(self.tails, (last.end + self.pad, position, self.versions[position]))
+                if not self.oven:
+                    self.low[position] = min([member.free_gaps.min_next_priority()] +
+                                             [next_priority for (_, next_priority) in member.past_pairs])
+            else:
+                self.last_start[position] = None
+                self.low[position] = INF
+                self.empty.add(position)
+        self.dirty.clear()
+        if len(self.tails) > 4 * len(self.members):
+            self.tails = [entry for entry in self.tails if entry[2] == self.versions[entry[1]]]
+            heapq.heapify(self.tails)
+
+    def candidates(self, start_time, priority):
+        # members that can win for a step desired at start_time, in group order
+        self._refresh()
+        chosen = {position for (_, position) in self.last_starts[bisect_right(self.last_starts, (start_time, INF)):]}
+        if not self.oven:
+            chosen.update(position for (position, low) in enumerate(self.low) if low < priority)
+
+        skipped = []
+        while self.tails:
+            (_, position, version) = self.tails[0]
+            if version != self.versions[position]:
+                heapq.heappop(self.tails)
+            elif position in chosen:
+                skipped.append(heapq.heappop(self.tails))
+            else:
+                chosen.add(position)
+                break
+        for entry in skipped:
+            heapq.heappush(self.tails, entry)
+
+        if self.empty:
+            chosen.add(min(self.empty))
+        return [self.members[position] for position in sorted(chosen)]
@@ -0,0 +1,150 @@
+import math
+import random
+from collections import Counter
+from timeit import default_timer as timer
+
+
+class Placement:
+    # an order as schedule_forward placed it, with the tasks it got
+    __slots__ = ("product_id", "sequence", "start_time", "tasks")
+
+    def __init__(self, product_id, sequence, start_time, tasks):
+        self.product_id = product_id
+        self.sequence = sequence
+        self.start_time = start_time
+        self.tasks = tasks
+
+
+def makespan(scheduler):
+    # latest end of a non-PICKUP task, the total time of resource_utilization
+    return max(resource.get_total_time() for resource in scheduler.resources.values())
+
+
+class LocalSearch:
+    """Improves a finished schedule by placing orders again in a different order.
+
+    A move takes 2 to `window` orders that are neighbours in request time off the timelines
+    and places them again with schedule_forward: "swap" exchanges the first and the last,
+    "rotate" moves the first behind the others. Every candidate is applied inside
+    Scheduler.fork() and rolled back through the journal unless it is accepted. Its cost
+    comes from the UsageMeter's running shift total and the resource tails, so a candidate
+    costs the orders it moves and the cascades they cause, not a rebuild of the schedule.
+    Those cascades bound the throughput: on 1000 orders released at once (bench_local_search)
+    it is a few hundred candidates a second, not thousands.
+
+    cost = makespan_weight * makespan + shift_weight * total start shift. Candidates that
+    lower the cost are kept; with a temperature, worse ones are kept with probability
+    exp(-increase / temperature) (simulated annealing, cooled linearly to 0 over a run), and
+    the run ends on the cheapest schedule it saw. The acceptance limit is drawn before a
+    candidate is placed, so a candidate is cut off at the first order that takes the cost
+    past it.
+    """
+
+    def __init__(self, scheduler, placements, makespan_weight=1.0, shift_weight=1.0, window=3, seed=0):
+        if len(placements) < 2:
+            raise ValueError("local search needs at least two orders")
+        self.scheduler = scheduler
+        self.placements = sorted(placements, key=lambda placement: placement.start_time)
+        self.makespan_weight = makespan_weight
+        self.shift_weight = shift_weight
+        self.window = max(window, 2)
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.replaced = []
+
+        # orders placed before the meter was on are not known to it yet
+        self.usage = scheduler.usage if scheduler.usage is not None else scheduler.enable_usage()
+        for placement in self.placements:
+            if placement.tasks[0] not in self.usage.heads:
+                self.usage.order(placement.start_time, placement.tasks)
+        self.current = self.cost()
+
+    def cost(self):
+        return self.makespan_weight * makespan(self.scheduler) + self.shift_weight * self.usage.shifts.total
+
+    def propose(self):
+        # (kind, placement indices in the order they are placed again)
+        first = self.random.randrange(len(self.placements) - 1)
+        last = min(first + self.random.randint(1, self.window - 1), len(self.placements) - 1)
+        indices = list(range(first, last + 1))
+        if self.random.random() < 0.5:
+            (indices[0], indices[-1]) = (indices[-1], indices[0])
+            return "swap", indices
+        return "rotate", indices[1:] + indices[:1]
+
+    def _apply(self, indices, limit=math.inf):
+        # Takes the orders at indices off the timelines and places them again in that order;
+        # returns their tasks, or None once the cost reaches limit. Placing an order only adds
+        # shift and pushes tasks later, so the cost cannot come back under limit.
+        for index in indices:
+            for task in self.placements[index].tasks:
+                task.resource.remove_task(task)
+        placed = []
+        for index in indices:
+            placement = self.placements[index]
+            placed.append(self.scheduler.schedule_forward(placement.sequence, placement.product_id,
+                                                          placement.start_time))
+            if self.cost() >= limit:
+                return None
+        return placed
+
+    def step(self, temperature=0.0):
+        # Evaluates one candidate; returns the change of cost if it was kept, else None. It
+        # is kept if the change is below limit: 0 without a temperature, else
+        # -temperature * ln(u), which keeps an increase with probability exp(-increase / temperature).
+        (kind, indices) = self.propose()
+        limit = -temperature * math.log(1 - self.random.random()) if temperature > 0 else 0
+        with self.scheduler.fork() as snapshot:
+            placed = self._apply(indices, self.current + limit)
+            if placed is None:
+                self.counts["cut"] += 1
+                return None
+            delta = self.cost() - self.current
+            self.scheduler.commit(snapshot)
+
+        self.replaced.append([(index, self.placements[index].tasks) for index in indices])
+        for (index, tasks) in zip(indices, placed):
+            self.placements[index].tasks = tasks
+        self.current += delta
+        self.counts[kind] += 1
+        return delta
+
+    def run(self, iterations, temperature=0.0):
+        # Runs iterations candidates and ends on the cheapest schedule seen: the run is one
+        # snapshot, and kept candidates after the best one are undone through the journal.
+        started = timer()
+        before = (self.current, makespan(self.scheduler), self.usage.shifts.total)
+        self.replaced = []  # per kept candidate: (placement index, tasks it had) of its orders
+        snapshot = self.scheduler.snapshot()
+        best = (self.current, len(self.scheduler.journal.entries), 0)
+        try:
+            for iteration in range(iterations):
+                if self.step(temperature * (1 - iteration / iterations)) is not None and self.current < best[0]:
+                    best = (self.current, len(self.scheduler.journal.entries), len(self.replaced))
+        except BaseException:
+            self.scheduler.rollback(snapshot)
+            for (index, tasks) in (entry for step in reversed(self.replaced) for entry in step):
+                self.placements[index].tasks = tasks
+            self.current = before[0]
+            raise
+
+        (self.current, position, kept) = best
+        self.scheduler.journal.undo_to(position)
+        for (index, tasks) in (entry for step in reversed(self.replaced[kept:]) for entry in step):
+            self.placements[index].tasks = tasks
+        self.scheduler.commit(snapshot)
+        # tasks replaced up to the best schedule are gone for good
+        for (_, tasks) in (entry for step in self.replaced[:kept] for entry in step):
+            for task in tasks:
+                self.usage.forget(task)
+        elapsed = timer() - started
+        self.counts["candidates"] += iterations
+        self.counts["kept"] += kept
+        return {
+            "candidates": iterations,
+            "kept": kept,
+            "per_second": iterations / elapsed if elapsed else math.inf,
+            "cost": (before[0], self.current),
+            "makespan": (before[1], makespan(self.scheduler)),
+            "shift": (before[2], self.usage.shifts.total),
+        }
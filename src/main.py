@@ -1,174 +1,183 @@
+import argparse
+import json
 from datetime import timedelta
-from timeit import default_timer as timer
-from itertools import cycle
-
-from resources import OPERATION_TYPE, MANIPULATOR_COLD, MANIPULATOR_WARM, OVEN1, OVEN2, OVEN3, OVEN4, WARM_ROOM_15, \
-    WARM_ROOM_30, Resource, OvenResource
-from scheduler import Scheduler
-from plot_schedule import plot_schedule
-from data_generator import generate_order_distribution, init_seed, generate_orders
-
-
-def median(data):
-    # Sort the list
-    data.sort()
-    # Calculate the median
-    n = len(data)
-    if n % 2 == 1:
-        # If odd, the median is the middle element
-        return data[n // 2]
-    else:
-        # If even, the median is the average of the two middle elements
-        return (data[n // 2 - 1] + data[n // 2]) / 2
-
-
-def generate_order_sequence(oven_time, warm_room, warm_time):
-    return [
-        {
-            "resource": MANIPULATOR_COLD,
-            "type": OPERATION_TYPE["UNLOAD"],
-            "duration": 30,
-            "priority": 5
-        },
-        {
-            "resource": MANIPULATOR_WARM,
-            "type": OPERATION_TYPE["LOAD"],
-            "duration": 30,
-            "priority": 7
-        },
-        {
-            "resource": OVEN,
-            "type": OPERATION_TYPE["OVEN"],
-            "duration": oven_time,
-            "priority": 5
-        },
-        {
-            "resource": MANIPULATOR_WARM,
-            "type": OPERATION_TYPE["UNLOAD"],
-            "duration": 30,
-            "priority": 5
-        },
-        # {
-        #     "resource": warm_room,
-        #     "type": OPERATION_TYPE["STORE"],
-        #     "duration": warm_time,
-        #     "priority": 5
-        # },
-    ]
-
-
-def generate_pickup_sequence():
-    return [
-        {
-            "resource": MANIPULATOR_WARM,
-            "type": OPERATION_TYPE["PICKUP"],
-            "duration": 30,
-            "priority": 5
-        },
-    ]
-
-
-init_seed(123)
-
-COUNT = 100
-
-COOK_TIME_BASE = 7 * 60
-COOK_TIME_SCALE = 0#0.5 * 60
-COOK_MIN_TIME = 6 * 60
-COOK_MAX_TIME = 8 * 60
-# COOK_EXTRA_TIME = 30 * 3
-PICKUP_MAX_TIME = 10 * 60
-OVEN = OVEN2
-
-order_distribution = generate_orders(count=COUNT, cook_time_base=COOK_TIME_BASE, cook_time_scale=COOK_TIME_SCALE,
-                                     cook_min_time=COOK_MIN_TIME, cook_max_time=COOK_MAX_TIME,
-                                     pickup_max_time=PICKUP_MAX_TIME)
-
-# bus_time = [
-#     1, 0, 0, 0, 0, 0, 0, 0, 6, 13, 11, 8, 16, 14, 9, 6, 6, 7, 13, 15, 12, 8, 6, 0
-# ]
-# bus_time = [
-#     21
-# ]
-# order_distribution = generate_order_distribution(bus_time=bus_time, cook_time_base=COOK_TIME_BASE,
-#                                                  cook_time_scale=COOK_TIME_SCALE,
-#                                                  cook_min_time=COOK_MIN_TIME, cook_max_time=COOK_MAX_TIME,
-#                                                  cook_extra_time=COOK_EXTRA_TIME, pickup_max_time=PICKUP_MAX_TIME)
-
-# Resources
-resources = {}
-for r in MANIPULATOR_COLD + MANIPULATOR_WARM + OVEN:
-    resources[r] = Resource(r) if r not in OVEN else OvenResource(r, 30)
-scheduler = Scheduler(resources)
-
-# Calculate
-
-tasks = {}
-
-start = timer()
-# Schedule orders
-for order in order_distribution:
-    order_tasks = scheduler.schedule_forward(
-        sequence=generate_order_sequence(order["cook_time"], WARM_ROOM_30, 7200),
-        product_id=order["order"],
-        start_time=order["start_time"])
-    tasks[order["order"]] = order_tasks
-end = timer()
-
-# Schedule pickups
-# for order in order_distribution:
-#     if order["pickup_timeout"]:
-#         order_tasks = tasks[order["order"]]
-#         actual_end = order_tasks[-1].end
-#         (start, end) = scheduler.insert_sequence(
-#             sequence=generate_pickup_sequence(),
-#             product_id=order["order"],
-#             start_time=actual_end + order["pickup_timeout"])
-
-print("===================================================================")
-print(f"Ovens: {len(OVEN)}")
-print(f"Oven time: {COOK_TIME_BASE}")
-print(f"Orders: {len(order_distribution)}")
-
-scheduler.print_resource_utilization(len(order_distribution), 30)
-
-# Print shifted orders
-diffs = []
-max_diff = 0
-max_diff_order = None
-for order in order_distribution:
-    # if order["start_time"]:
-    order_tasks = tasks[order["order"]]
-    actual_start = order_tasks[0].start
-    actual_end = order_tasks[-1].end
-    diff_start = actual_start - order["start_time"]
-    if diff_start != 0:
-        diffs.append(diff_start)
-        if diff_start > max_diff:
-            max_diff = diff_start
-            max_diff_order = order
-        # print(f"Order {order["order"]} shifted: {diff_start}s ({timedelta(seconds=diff_start)})")
-
-print(f"Total shifted: {len(diffs)}")
-avg_diff = int(sum(diffs) / len(diffs)) if diffs else 0
-print(f"Average shift: {avg_diff}s ({timedelta(seconds=avg_diff)})")
-med_diffs = int(median(diffs)) if diffs else 0
-print(f"Median shift: {med_diffs}s ({timedelta(seconds=med_diffs)})")
-if max_diff_order:
-    print(f"Maximum shift (order {max_diff_order["order"]}): {max_diff}s ({timedelta(seconds=max_diff)})")
-
-### Validate timeline
-for r in scheduler.resources.values():
-    index, invalid_end = r.validate_timeline()
-    if index is not None:
-        print(f"Invalid timeline {r.name} at {index} in {invalid_end}:")
-        for t in r.tasks:
-            print(t)
-
-### Deadlock detection
-anomalies = scheduler.resources['WARM_HAND'].detect_unload_anomaly()
-print(f"Anomalies: {len(anomalies)}")
-for a in anomalies:
-    print(a)
-
-plot_schedule(resources)
+
+import resources as resource_sets
+from simulation import generate_order_sequence, build_scheduler, make_orders, simulate, place_pickups, \
+    shift_statistics
+from local_search import LocalSearch, Placement
+
+# Settings of a run; a JSON file given with --config overrides any of them.
+# bus_time: orders per hour of a day for generate_order_distribution, e.g.
+#     [1, 0, 0, 0, 0, 0, 0, 0, 6, 13, 11, 8, 16, 14, 9, 6, 6, 7, 13, 15, 12, 8, 6, 0]
+# or null for count orders released at once.
+# optimize: local search candidates tried on the finished schedule before pickups (see
+# local_search.LocalSearch), with the annealing temperature.
+# mode: "forward" places every order as early as possible, "mixed" just in time for its
+# pickup (Scheduler.schedule_mixed, simulation.due_time) with pickups at the due time.
+# trace: file to record the scheduling decisions in (Scheduler.record), for
+# `python recording.py replay|diff PATH`; local search cannot be recorded.
+# plot: show the schedule in plotly, which needs requirements-plot.txt.
+DEFAULTS = {
+    "seed": 123,
+    "count": 100,
+    "bus_time": None,
+    "cook_time_base": 7 * 60,
+    "cook_time_scale": 0,
+    "cook_min_time": 6 * 60,
+    "cook_max_time": 8 * 60,
+    "cook_extra_time": 30 * 3,
+    "pickup_max_time": 10 * 60,
+    "oven": "OVEN2",
+    "mode": "forward",  # or "mixed": experimental, leaves far more orders late than forward
+    "pickups": False,
+    "optimize": 0,
+    "temperature": 0,
+    "plot": False,
+    "trace": None,
+}
+
+
+# the JSON types every setting takes; true and false are not numbers here
+TYPES = {"seed": (int,), "count": (int,), "bus_time": (list, None), "cook_time_base": (int, float),
+         "cook_time_scale": (int, float), "cook_min_time": (int, float), "cook_max_time": (int, float),
+         "cook_extra_time": (int, float), "pickup_max_time": (int, float), "oven": (str,), "mode": (str,),
+         "pickups": (bool,), "optimize": (int,), "temperature": (int, float), "plot": (bool,), "trace": (str, None)}
+TYPE_NAMES = {int: "an integer", float: "a number", bool: "true or false", str: "a string", list: "a list",
+              None: "null"}
+
+
+def _valid(value, kinds):
+    if value is None or isinstance(value, bool):
+        return (None if value is None else bool) in kinds
+    return any(kind not in (None, bool) and isinstance(value, kind) for kind in kinds)
+
+
+def load_config(path=None, **overrides):
+    config = dict(DEFAULTS)
+    if path is not None:
+        with open(path) as file:
+            config.update(json.load(file))
+    config.update({key: value for (key, value) in overrides.items() if value is not None})
+    unknown = sorted(set(config) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(unknown)}")
+    for (key, value) in config.items():
+        if not _valid(value, TYPES[key]):
+            raise ValueError(f"Setting {key} must be {' or '.join(TYPE_NAMES[kind] for kind in TYPES[key])}, "
+                             f"not {json.dumps(value)}")
+    if config["bus_time"] is not None and not all(_valid(count, (int, float)) for count in config["bus_time"]):
+        raise ValueError("Setting bus_time must be a list of numbers")
+    if not isinstance(getattr(resource_sets, config["oven"], None), list):
+        raise ValueError(f"Unknown oven: {config['oven']}")
+    if config["mode"] not in ("forward", "mixed"):
+        raise ValueError(f"Unknown mode: {config['mode']}")
+    if config["trace"] is not None and config["optimize"]:
+        raise ValueError("a traced run cannot be optimized: local search rolls back what it tries")
+    return config
+
+
+def run(config):
+    # schedules the orders of config with simulation.simulate, runs the local search and
+    # places the pickups; returns the scheduler, orders and order -> tasks
+    oven = getattr(resource_sets, config["oven"])
+    orders = make_orders(config["seed"], count=config["count"], bus_time=config["bus_time"],
+                         cook_time_base=config["cook_time_base"], cook_time_scale=config["cook_time_scale"],
+                         cook_min_time=config["cook_min_time"], cook_max_time=config["cook_max_time"],
+                         cook_extra_time=config["cook_extra_time"], pickup_max_time=config["pickup_max_time"])
+    scheduler = build_scheduler(oven)
+    scheduler.enable_usage()
+    if config["trace"] is not None:
+        scheduler.record(config["trace"])
+    tasks = simulate(scheduler, orders, oven, mode=config["mode"])
+
+    if config["optimize"] and len(orders) > 1:
+        placements = [Placement(order["order"], generate_order_sequence(oven, order["cook_time"]),
+                                order["start_time"], tasks[order["order"]]) for order in orders]
+        result = LocalSearch(scheduler, placements).run(config["optimize"], config["temperature"])
+        print(f"Local search: {result['kept']} of {result['candidates']} candidates kept "
+              f"({result['per_second']:.0f}/s), makespan {result['makespan'][0]} -> {result['makespan'][1]}, "
+              f"total shift {result['shift'][0]} -> {result['shift'][1]}")
+        tasks = {placement.product_id: placement.tasks for placement in placements}
+
+    if config["pickups"]:
+        place_pickups(scheduler, orders, tasks, config["mode"])
+    scheduler.record(None)
+    return scheduler, orders, tasks
+
+
+def print_report(config, scheduler, orders, tasks):
+    print("===================================================================")
+    print(f"Ovens: {len(getattr(resource_sets, config['oven']))}")
+    print(f"Oven time: {config['cook_time_base']}")
+    print(f"Orders: {len(orders)}")
+
+    scheduler.print_resource_utilization(len(orders), 30)
+
+    # Print shifted orders: exact over the final tasks, the percentiles from the usage meter
+    usage = scheduler.usage
+    statistics = shift_statistics(orders, tasks)
+    shifts = usage.shift_summary()
+    print(f"Total shifted: {statistics['shifted']}")
+    for (name, shift) in (("Average", statistics["avg_shift"]), ("Median", statistics["median_shift"]),
+                          ("95th percentile", shifts["p95"]), ("99th percentile", shifts["p99"])):
+        shift = int(shift)
+        print(f"{name} shift: {shift}s ({timedelta(seconds=shift)})")
+    if statistics["max_shift"] > 0:
+        shift = statistics["max_shift"]
+        order = next(order for order in orders if tasks[order["order"]][0].start - order["start_time"] == shift)
+        print(f"Maximum shift (order {order['order']}): {shift}s ({timedelta(seconds=shift)})")
+
+    # Per-hour utilization and finished orders
+    for row in usage.report():
+        busiest = max(row["utilization"].items(), key=lambda item: item[1])
+        print(f"Hour {row['window']}: {row['throughput']} orders, busiest {busiest[0]} {busiest[1]:.0%}")
+
+    ### Validate timeline
+    for r in scheduler.resources.values():
+        index, invalid_end = r.validate_timeline()
+        if index is not None:
+            print(f"Invalid timeline {r.name} at {index} in {invalid_end}:")
+            for t in r.tasks:
+                print(t)
+
+    ### Deadlock detection
+    anomalies = scheduler.resources['WARM_HAND'].detect_unload_anomaly()
+    print(f"Anomalies: {len(anomalies)}")
+    for a in anomalies:
+        print(a)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule one batch of orders and report on the schedule.")
+    parser.add_argument("--config", default=None, help="JSON file with any of the settings in main.DEFAULTS")
+    parser.add_argument("--count", type=int, default=None)
+    parser.add_argument("--oven", default=None, help="resource set name, e.g. OVEN4")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--mode", choices=("forward", "mixed"), default=None,
+                        help="mixed (just in time for the pickup) is experimental: it leaves far more orders late")
+    parser.add_argument("--pickups", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--optimize", type=int, default=None, help="local search candidates to try")
+    parser.add_argument("--plot", action=argparse.BooleanOptionalAction, default=None,
+                        help="show the schedule in plotly (needs requirements-plot.txt)")
+    parser.add_argument("--trace", default=None, help="record the scheduling decisions to this file")
+    args = parser.parse_args(argv)
+    try:
+        config = load_config(args.config, count=args.count, oven=args.oven, seed=args.seed, mode=args.mode,
+                             pickups=args.pickups, optimize=args.optimize, plot=args.plot, trace=args.trace)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    (scheduler, orders, tasks) = run(config)
+    print_report(config, scheduler, orders, tasks)
+    if config["plot"]:
+        # plotly and pandas are only imported for the plot
+        try:
+            from plot_schedule import plot_schedule
+            plot_schedule(scheduler.resources)
+        except ImportError as error:
+            print(f"No plot: {error}; install requirements-plot.txt for --plot")
+
+
+if __name__ == "__main__":
+    main()
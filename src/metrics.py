@@ -0,0 +1,301 @@
+import cProfile
+import io
+import math
+import pstats
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+class Histogram:
+    """Log-bucketed histogram of non-negative values.
+
+    Memory depends on the value range, not on the number of values. Percentiles are
+    reported as bucket upper bounds, within 2 ** (1 / buckets_per_octave) of the value.
+
+    With exact, every bucket also counts its distinct values: percentiles are then exact,
+    and remove() can take a value back and still report the right min and max. Memory
+    then grows with the number of distinct values.
+    """
+
+    def __init__(self, buckets_per_octave=16, exact=False):
+        self.buckets_per_octave = buckets_per_octave
+        self.buckets = {}
+        self.values = {} if exact else None  # bucket -> Counter of its values
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value):
+        return math.floor(math.log2(value) * self.buckets_per_octave) if value > 0 else None
+
+    def add(self, value):
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        if self.values is not None:
+            self.values.setdefault(bucket, Counter())[value] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda key: -math.inf if key is None else key):
+            if seen + self.buckets[bucket] >= rank:
+                if self.values is not None:
+                    for value in sorted(self.values[bucket]):
+                        seen += self.values[bucket][value]
+                        if seen >= rank:
+                            return value
+                return 0 if bucket is None else min(2 ** ((bucket + 1) / self.buckets_per_octave), self.max)
+            seen += self.buckets[bucket]
+        return self.max
+
+    def remove(self, value):
+        # takes back one add(value); needs exact to find the new min or max
+        if self.values is None:
+            raise ValueError("remove needs a Histogram(exact=True)")
+        bucket = self._bucket(value)
+        values = self.values[bucket]
+        if values[value] > 1:
+            values[value] -= 1
+        else:
+            del values[value]
+        count = self.buckets[bucket] - 1
+        if count:
+            self.buckets[bucket] = count
+        else:
+            del self.buckets[bucket]
+            del self.values[bucket]
+        self.count -= 1
+        self.total -= value
+        # the removed value was the last one at an edge: the new edge is in the edge bucket
+        if value == self.min and value not in values:
+            self.min = min(self._edge(min), default=math.inf)
+        if value == self.max and value not in values:
+            self.max = max(self._edge(max), default=-math.inf)
+
+    def _edge(self, pick):
+        # the values of the lowest (pick=min) or highest (pick=max) bucket
+        if not self.buckets:
+            return ()
+        if None in self.buckets and (pick is min or len(self.buckets) == 1):
+            return self.values[None]
+        return self.values[pick(key for key in self.buckets if key is not None)]
+
+    def merge(self, other):
+        if self.values is not None and other.values is None:
+            raise ValueError("an exact Histogram can only merge exact ones")
+        for (bucket, count) in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+            if self.values is not None:
+                self.values.setdefault(bucket, Counter()).update(other.values[bucket])
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean(), "p50": self.percentile(50), "p95": self.percentile(95),
+                "p99": self.percentile(99), "max": self.max if self.count else 0}
+
+
+class PerfCounters:
+    """Call counts and per-call histograms of a Scheduler and its resources.
+
+    Filled only while enabled, see Scheduler.enable_stats; timings are in seconds.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.histograms = defaultdict(Histogram)
+
+    def observe(self, name, value):
+        self.histograms[name].add(value)
+
+    def record_cascade(self, seconds, moved, depth):
+        self.counts["align_tasks"] += 1
+        self.counts["moved"] += moved
+        self.observe("align_tasks", seconds)
+        self.observe("align_moved", moved)
+        self.observe("align_depth", depth)
+
+    def snapshot(self):
+        return {"counts": dict(self.counts),
+                "histograms": {name: histogram.summary() for (name, histogram) in sorted(self.histograms.items())}}
+
+
+class UsageMeter:
+    """Running busy time and order shifts of a Scheduler, by time window.
+
+    Resources report every task placed, shifted and removed, and Journal.undo_to reports
+    what a rollback takes back, so each query costs O(1) or O(windows) instead of a scan
+    of the timelines. Evicted tasks stay counted. A task is counted in every window it
+    overlaps, for the part it overlaps.
+
+    Orders are the sequences schedule_forward places: the shift of an order is the start
+    of its first task minus the requested start, and it is done in the window its last
+    task ends in. Both follow the tasks as cascades move them.
+    """
+
+    def __init__(self, window=3600):
+        self.window = window
+        self.busy = defaultdict(lambda: defaultdict(int))  # resource name -> window -> busy time
+        self.total = Counter()  # resource name -> busy time
+        self.capacity = {}
+        self.done = Counter()  # window -> orders whose last task ends in it
+        self.heads = {}  # first task -> requested start
+        self.tails = set()
+        self.parked = {}  # removed first task -> requested start, until it is restored
+        self.shifts = Histogram(exact=True)  # positive shifts
+        self.window_shifts = defaultdict(lambda: Histogram(exact=True))  # by the window of the requested start
+        self.orders = 0
+
+    def _busy(self, resource, start, end, sign):
+        busy = self.busy[resource.name]
+        self.total[resource.name] += sign * (end - start)
+        window = self.window
+        index = math.floor(start / window)
+        while start < end:
+            edge = (index + 1) * window
+            busy[index] += sign * (min(end, edge) - start)
+            (start, index) = (edge, index + 1)
+
+    def _shift(self, task, requested, sign):
+        shift = task.start - requested
+        if shift > 0:
+            histograms = (self.shifts, self.window_shifts[math.floor(requested / self.window)])
+            for histogram in histograms:
+                if sign > 0:
+                    histogram.add(shift)
+                else:
+                    histogram.remove(shift)
+
+    def placed(self, resource, task):
+        if resource.name not in self.capacity:
+            self.capacity[resource.name] = getattr(resource, "capacity", 1)
+        self._busy(resource, task.start, task.end, 1)
+        requested = self.parked.pop(task, None)
+        if requested is not None:
+            self.heads[task] = requested
+            self._shift(task, requested, 1)
+            self.orders += 1
+        if task in self.tails:
+            self.done[math.floor(task.end / self.window)] += 1
+
+    def removed(self, resource, task, forget=False):
+        # forget: the task is gone for good (its placement was rolled back)
+        self._busy(resource, task.start, task.end, -1)
+        requested = self.heads.pop(task, None)
+        if requested is not None:
+            self._shift(task, requested, -1)
+            self.orders -= 1
+            if not forget:
+                self.parked[task] = requested
+        if task in self.tails:
+            self.done[math.floor(task.end / self.window)] -= 1
+            if forget:
+                self.tails.discard(task)
+        if forget:
+            self.parked.pop(task, None)
+
+    def moved(self, resource, task, old_start, old_end):
+        self._busy(resource, old_start, old_end, -1)
+        self._busy(resource, task.start, task.end, 1)
+        requested = self.heads.get(task)
+        if requested is not None:
+            shift = old_start - requested
+            if shift > 0:
+                for histogram in (self.shifts, self.window_shifts[math.floor(requested / self.window)]):
+                    histogram.remove(shift)
+            self._shift(task, requested, 1)
+        if task in self.tails:
+            self.done[math.floor(old_end / self.window)] -= 1
+            self.done[math.floor(task.end / self.window)] += 1
+
+    def order(self, requested, tasks):
+        (head, tail) = (tasks[0], tasks[-1])
+        self.heads[head] = requested
+        self._shift(head, requested, 1)
+        self.tails.add(tail)
+        self.done[math.floor(tail.end / self.window)] += 1
+        self.orders += 1
+
+    def forget(self, task):
+        # the task is evicted or was removed for good: keep what it counts, drop the references
+        self.heads.pop(task, None)
+        self.tails.discard(task)
+        self.parked.pop(task, None)
+
+    def windows(self):
+        # indices of the windows with busy time or finished orders
+        indices = {index for busy in self.busy.values() for (index, time) in busy.items() if time}
+        indices.update(index for (index, count) in self.done.items() if count)
+        return sorted(indices)
+
+    def utilization(self, index):
+        # busy share of every resource in window index, over its places
+        return {name: busy.get(index, 0) / self.window / self.capacity[name] for (name, busy) in self.busy.items()}
+
+    def throughput(self, index):
+        return self.done.get(index, 0)
+
+    def shift_summary(self, index=None):
+        # shifts of all orders, or of the orders requested in window index; exact percentiles
+        # of the shifted ones
+        histogram = self.shifts if index is None else self.window_shifts.get(index, Histogram(exact=True))
+        summary = histogram.summary()
+        summary["shifted"] = summary.pop("count")
+        summary["total"] = histogram.total
+        if index is None:
+            summary["orders"] = self.orders
+        return summary
+
+    def report(self):
+        return [{"window": index, "start": index * self.window, "throughput": self.throughput(index),
+                 "utilization": self.utilization(index)} for index in self.windows()]
+
+
+class Profile:
+    def __init__(self, cpu, memory):
+        self.cpu = cProfile.Profile() if cpu else None
+        self.memory = memory
+        self.peak_bytes = None
+        self.allocations = None  # tracemalloc.Snapshot taken at the end
+
+    def report(self, limit=20, sort="cumulative"):
+        out = io.StringIO()
+        if self.cpu is not None:
+            pstats.Stats(self.cpu, stream=out).sort_stats(sort).print_stats(limit)
+        if self.allocations is not None:
+            out.write(f"peak traced memory: {self.peak_bytes / 2 ** 20:.1f} MB\n")
+            for stat in self.allocations.statistics("lineno")[:limit]:
+                out.write(f"{stat}\n")
+        return out.getvalue()
+
+
+@contextmanager
+def profiled(cpu=True, memory=False):
+    # cProfile and/or tracemalloc around a block; print(profile.report()) afterwards
+    profile = Profile(cpu, memory)
+    if memory:
+        tracemalloc.start()
+    if cpu:
+        profile.cpu.enable()
+    try:
+        yield profile
+    finally:
+        if cpu:
+            profile.cpu.disable()
+        if memory:
+            profile.peak_bytes = tracemalloc.get_traced_memory()[1]
+            profile.allocations = tracemalloc.take_snapshot()
+            tracemalloc.stop()
@@ -0,0 +1,105 @@
+import math
+from bisect import bisect_left, bisect_right
+
+
+class OccupancySteps:
+    """Occupancy over time as a step function.
+
+    levels[i] is the occupancy on [times[i], times[i + 1]); it is 0 before times[0] and
+    after times[-1]. Neighbouring steps with equal levels are merged, so the size depends
+    on how often the occupancy changes, not on how many intervals were added.
+    """
+
+    def __init__(self):
+        self.times = []
+        self.levels = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def _split(self, time):
+        # index of a breakpoint at time, added with the level already there if missing
+        times = self.times
+        index = bisect_left(times, time)
+        if index == len(times) or times[index] != time:
+            times.insert(index, time)
+            self.levels.insert(index, self.levels[index - 1] if index else 0)
+        return index
+
+    def _merge(self, index):
+        levels = self.levels
+        if index < len(levels) and levels[index] == (levels[index - 1] if index else 0):
+            del self.times[index]
+            del levels[index]
+
+    def add(self, start, end, count):
+        # count is added to the occupancy on [start, end); negative counts remove
+        if end <= start:
+            return
+        first = self._split(start)
+        last = self._split(end)
+        levels = self.levels
+        for index in range(first, last):
+            levels[index] += count
+        self._merge(last)
+        self._merge(first)
+
+    def level(self, time):
+        index = bisect_right(self.times, time) - 1
+        return self.levels[index] if index >= 0 else 0
+
+    def peak(self, start, end):
+        # highest occupancy on [start, end)
+        times = self.times
+        index = bisect_right(times, start) - 1
+        peak = self.levels[index] if index >= 0 else 0
+        index += 1
+        while index < len(times) and times[index] < end:
+            peak = max(peak, self.levels[index])
+            index += 1
+        return peak
+
+    def earliest(self, start, duration, limit):
+        # Earliest time >= start from which the occupancy stays below limit for duration,
+        # with the time the occupancy last changed before it. Only the steps between start
+        # and the answer (plus duration) are visited.
+        (times, levels) = (self.times, self.levels)
+        index = bisect_right(times, start) - 1
+        time = start
+        while True:
+            if index >= 0 and levels[index] >= limit:
+                index += 1
+                time = times[index]
+                continue
+            changed = times[index] if index >= 0 else -math.inf
+            end = time + duration
+            scan = index + 1
+            while scan < len(times) and times[scan] < end and levels[scan] < limit:
+                scan += 1
+            if scan == len(times) or times[scan] >= end:
+                return time, changed
+            index = scan
+            time = times[scan]
+
+    def latest(self, end, duration, limit):
+        # Latest time <= end - duration from which the occupancy stays below limit for
+        # duration, the mirror of earliest(). Only the steps between the answer and end are
+        # visited.
+        (times, levels) = (self.times, self.levels)
+        index = bisect_left(times, end) - 1
+        time = end - duration
+        while True:
+            while index >= 0 and levels[index] < limit and times[index] > time:
+                index -= 1
+            if index < 0 or levels[index] < limit:
+                return time
+            # the window ends where the last step at the limit starts
+            time = times[index] - duration
+            index -= 1
+
+    def trim(self, time):
+        # forgets the steps before the one holding at time
+        index = bisect_right(self.times, time) - 1
+        if index > 0:
+            del self.times[:index]
+            del self.levels[:index]
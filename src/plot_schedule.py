@@ -1,9 +1,14 @@
-import plotly.express as px
-import pandas as pd
+import numpy as np
 import datetime
 
+# plotly and pandas are imported by the functions that draw with plotly; the matplotlib
+# export needs neither
+
 
 def plot_schedule(resources):
+    import plotly.express as px
+    import pandas as pd
+
     tasks = []
 
     for resource_name, resource in resources.items():
@@ -43,3 +48,136 @@ def plot_schedule(resources):
     )
 
     fig.show()
+
+
+def _columns(tasks):
+    count = len(tasks)
+    return (np.fromiter((task.start for task in tasks), np.float64, count),
+            np.fromiter((task.end for task in tasks), np.float64, count))
+
+
+def _occupancy(starts, ends, edges):
+    # busy seconds inside every [edges[i], edges[i + 1]): busy time before e is
+    # sum over starts < e of (e - start) minus sum over ends < e of (e - end)
+    starts = np.sort(starts)
+    ends = np.sort(ends)
+    start_sums = np.concatenate(([0], np.cumsum(starts)))
+    end_sums = np.concatenate(([0], np.cumsum(ends)))
+    started = np.searchsorted(starts, edges)
+    ended = np.searchsorted(ends, edges)
+    before = (started * edges - start_sums[started]) - (ended * edges - end_sums[ended])
+    return np.diff(before)
+
+
+COLUMNS = ["Resource", "Start", "Finish", "Occupancy", "Product", "Type"]
+
+
+def timeline_bars(resources, window=None, max_bars=500):
+    """Bars to draw for a schedule, in blocks of one resource and kind.
+
+    Tasks overlapping window (start, end) are kept one per bar; everything else is merged
+    into at most max_bars occupancy bars per resource, with Occupancy the busy share of the
+    bar: busy time over the bar length times the resource capacity, clipped to [0, 1] for
+    stand-ins that do not know their capacity. Detail bars are clipped to the window, so no
+    busy time is drawn twice. Without a window the whole schedule is merged. Times are in
+    seconds. Each block is a dict of COLUMNS: Resource is a name, Type "BUSY" for merged
+    bars, else a list like Product; Start, Finish and Occupancy are arrays.
+    """
+    columns = {name: _columns(resource.tasks) for (name, resource) in resources.items() if resource.tasks}
+    if not columns:
+        return []
+    low = min(starts.min() for (starts, _) in columns.values())
+    high = max(ends.max() for (_, ends) in columns.values())
+    width = max((high - low) / max_bars, 1)
+    (window_start, window_end) = window if window is not None else (high, high)
+
+    blocks = []
+    for (name, (starts, ends)) in columns.items():
+        capacity = getattr(resources[name], "capacity", 1)
+        for (lo, hi) in ((low, window_start), (window_end, high)):
+            if hi <= lo:
+                continue
+            edges = np.append(np.arange(lo, hi, width), hi)
+            busy = _occupancy(starts, ends, edges)
+            keep = busy > 0
+            blocks.append({
+                "Resource": name,
+                "Start": edges[:-1][keep],
+                "Finish": edges[1:][keep],
+                "Occupancy": np.minimum(busy[keep] / (np.diff(edges)[keep] * capacity), 1),
+                "Product": None,
+                "Type": "BUSY",
+            })
+
+        if window is not None:
+            tasks = resources[name].tasks
+            detail = np.flatnonzero((ends > window_start) & (starts < window_end))
+            blocks.append({
+                "Resource": name,
+                "Start": np.maximum(starts[detail], window_start),
+                "Finish": np.minimum(ends[detail], window_end),
+                "Occupancy": np.ones(len(detail)),
+                "Product": [tasks[i].product_id for i in detail],
+                "Type": [tasks[i].type for i in detail],
+            })
+    return blocks
+
+
+def timeline_frame(resources, window=None, max_bars=500):
+    # timeline_bars as one pandas DataFrame, one row per bar
+    import pandas as pd
+
+    frames = [pd.DataFrame(block) for block in timeline_bars(resources, window, max_bars) if len(block["Start"])]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def export_schedule(resources, path, window=None, max_bars=500, title='Resource Schedule'):
+    # Writes the schedule without a browser: .html through plotly (and pandas), .png/.svg/.pdf
+    # through matplotlib. Returns the number of bars drawn.
+    names = list(resources)
+    if path.endswith(".html"):
+        import plotly.graph_objects as go
+
+        frame = timeline_frame(resources, window, max_bars)
+        figure = go.Figure()
+        busy = frame[frame["Type"] == "BUSY"]
+        figure.add_bar(
+            y=busy["Resource"], base=busy["Start"], x=busy["Finish"] - busy["Start"], orientation="h",
+            name="occupancy", marker=dict(color=busy["Occupancy"], colorscale="Greys", cmin=0, cmax=1),
+            customdata=busy["Occupancy"], hovertemplate="%{base}-%{x} s, occupancy %{customdata:.0%}")
+        for (task_type, tasks) in frame[frame["Type"] != "BUSY"].groupby("Type"):
+            figure.add_bar(y=tasks["Resource"], base=tasks["Start"], x=tasks["Finish"] - tasks["Start"],
+                           orientation="h", name=task_type, customdata=tasks["Product"],
+                           hovertemplate="%{customdata}: %{base} s")
+        figure.update_layout(title=title, barmode="overlay", xaxis_title='Time (seconds)', yaxis_title='Resource',
+                             yaxis=dict(categoryorder="array", categoryarray=names[::-1]))
+        figure.write_html(path, include_plotlyjs="cdn")
+        return len(frame)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot
+
+    (figure, axes) = pyplot.subplots(figsize=(16, 1 + 0.4 * len(names)))
+    rows = {name: index for (index, name) in enumerate(names[::-1])}
+    colors = {}
+    count = 0
+    for block in timeline_bars(resources, window, max_bars):
+        if not len(block["Start"]):
+            continue
+        if block["Type"] == "BUSY":
+            color = [(0, 0, 0, share) for share in block["Occupancy"]]
+        else:
+            color = [colors.setdefault(task_type, f"C{len(colors)}") for task_type in block["Type"]]
+        (starts, finishes) = (block["Start"], block["Finish"])
+        axes.broken_barh(list(zip(starts, finishes - starts)), (rows[block["Resource"]] - 0.4, 0.8),
+                         facecolors=color)
+        count += len(starts)
+    axes.set_yticks(range(len(names)), names[::-1])
+    axes.set_xlabel('Time (seconds)')
+    axes.set_title(title)
+    figure.savefig(path, bbox_inches="tight")
+    pyplot.close(figure)
+    return count
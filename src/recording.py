@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import threading
+from timeit import default_timer as timer
+from typing import Any, NamedTuple, Optional
+
+from resources import Task
+from scheduler import Scheduler
+from timeline import describe_resource, build_resource, save_schedule, load_schedule, _decode_id
+
+TRACE_VERSION = 2
+
+# Trace records, one JSON array per line after the header. Resources are positions in the
+# header's list, sequences numbers of earlier "s" records.
+_SEQUENCE = "s"  # [s, steps]: the next sequence number
+_FORWARD = "f"  # [f, sequence, product_id, start_time, base start, [resource per step]]
+_BACKWARD = "b"  # [b, sequence, product_id, end_time, start_time, base start or null, [resource per step]]
+_INSERT = "i"  # [i, sequence, product_id, start_time, [[resource, start, index] per step]]
+_INSERT_MANY = "m"  # [m, [[sequence, product_id, start_time, [[resource, start, index] per step]] per item]]
+_EVICT = "e"  # [e, now]
+_CALLS = {_FORWARD: "schedule_forward", _BACKWARD: "schedule_backward", _INSERT: "insert_sequence",
+          _INSERT_MANY: "insert_sequences", _EVICT: "evict"}
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+class DecisionTrace:
+    """Append-only file of the calls that changed a Scheduler and what each one decided.
+
+    The first line is a JSON header with the resources, and with a schedule file saved next
+    to the trace when the scheduler already had tasks. Every later line is one record (see
+    above): the arguments of a schedule_forward, schedule_backward, insert_sequence,
+    insert_sequences or evict call and the resource, start and insert index it chose per
+    step. Forward and backward plans are back-to-back, so they keep only the first start;
+    insert_sequences keeps its items in the order it inserted them.
+    Decisions are written before they are committed, the way the search saw them; a trace
+    is enough for replay() to rebuild the timelines without searching and for diff() to
+    search again and compare.
+    """
+
+    def __init__(self, path, scheduler):
+        if scheduler.journal is not None:
+            raise RuntimeError("cannot record while a snapshot is open")
+        self.path = path
+        self.positions = {resource: position for (position, resource) in enumerate(scheduler.resources.values())}
+        self.sequences = {}  # JSON of the steps -> sequence number
+        self.lock = threading.Lock()
+        start = None
+        if any(resource.tasks for resource in scheduler.resources.values()):
+            start = os.path.basename(path) + ".start"
+            save_schedule(scheduler, path + ".start")
+        self.file = open(path, "w")
+        self.file.write(_dumps({"trace": TRACE_VERSION, "group_min_size": scheduler.group_min_size, "start": start,
+                                "resources": [describe_resource(r) for r in scheduler.resources.values()]}) + "\n")
+
+    def _sequence(self, sequence):
+        key = _dumps(sequence)
+        number = self.sequences.get(key)
+        if number is None:
+            number = self.sequences[key] = len(self.sequences)
+            self.file.write(f'["{_SEQUENCE}",{key}]\n')
+        return number
+
+    def _write(self, record):
+        self.file.write(_dumps(record) + "\n")
+
+    def forward(self, sequence, product_id, start_time, tasks):
+        with self.lock:
+            self._write([_FORWARD, self._sequence(sequence), product_id, start_time, tasks[0][1].start,
+                         [self.positions[resource] for (resource, _) in tasks]])
+
+    def backward(self, sequence, product_id, end_time, start_time, tasks):
+        with self.lock:
+            self._write([_BACKWARD, self._sequence(sequence), product_id, end_time, start_time,
+                         tasks[0][1].start if tasks else None,
+                         [self.positions[resource] for (resource, _) in tasks or ()]])
+
+    def inserted(self, sequence, start_time, product_id, placed):
+        with self.lock:
+            self._write([_INSERT, self._sequence(sequence), product_id, start_time,
+                         [[self.positions[resource], start, index] for (resource, start, index) in placed]])
+
+    def inserted_many(self, items):
+        # items: (sequence, start_time, product_id, [(resource, start, index) per step]) as inserted
+        with self.lock:
+            self._write([_INSERT_MANY, [[self._sequence(sequence), product_id, start_time,
+                                         [[self.positions[resource], start, index]
+                                          for (resource, start, index) in placed]]
+                                        for (sequence, start_time, product_id, placed) in items]])
+
+    def evicted(self, now):
+        with self.lock:
+            self._write([_EVICT, now])
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class _Capture(DecisionTrace):
+    # keeps the last record instead of writing it, with the steps in place of sequence numbers
+    def __init__(self, positions):
+        self.positions = positions
+        self.lock = threading.Lock()
+        self.record = None
+
+    def _sequence(self, sequence):
+        return sequence
+
+    def _write(self, record):
+        self.record = record
+
+    def close(self):
+        pass
+
+
+def read_trace(path):
+    # (header, records): the records are decoded lazily, with the steps in place of sequence numbers
+    file = open(path)
+    header = json.loads(file.readline())
+    if header.get("trace") != TRACE_VERSION:
+        file.close()
+        raise ValueError(f"{path} is not a decision trace of version {TRACE_VERSION}")
+
+    def records():
+        sequences = []
+        with file:
+            for line in file:
+                record = json.loads(line)
+                kind = record[0]
+                if kind == _SEQUENCE:
+                    sequences.append(record[1])
+                    continue
+                if kind == _INSERT_MANY:
+                    for item in record[1]:
+                        item[0] = sequences[item[0]]
+                elif kind != _EVICT:
+                    record[1] = sequences[record[1]]
+                yield record
+
+    return header, records()
+
+
+def trace_scheduler(path, header):
+    # the scheduler as it was when the trace at path started
+    if header["start"] is not None:
+        return load_schedule(os.path.join(os.path.dirname(path), header["start"]))
+    return Scheduler({entry["name"]: build_resource(entry) for entry in header["resources"]}, header["group_min_size"])
+
+
+def _steps(sequence, record):
+    # (resource position, start) per step of a record as it was decided
+    kind = record[0]
+    if kind in (_FORWARD, _BACKWARD):
+        # the base start and the resources are the last two fields of both
+        (start, placed) = record[-2:]
+        steps = []
+        for (step, position) in zip(sequence, placed):
+            steps.append((position, start))
+            start += step["duration"]
+        return steps
+    if kind == _INSERT:
+        return [(position, start) for (position, start, _) in record[4]]
+    if kind == _INSERT_MANY:
+        return [(position, start) for item in record[1] for (position, start, _) in item[3]]
+    return []
+
+
+def _chain(sequence, product_id, steps, resources):
+    # linked (resource, task) per step at the given (resource position, start)
+    tasks = []
+    prev_task = None
+    for (step, (position, start)) in zip(sequence, steps):
+        resource = resources[position]
+        task = Task(start, step["duration"], product_id, resource, step["type"], step["priority"])
+        task.prev_task = prev_task
+        if prev_task:
+            prev_task.next_task = task
+        tasks.append((resource, task))
+        prev_task = task
+    return tasks
+
+
+def _insert(sequence, product_id, placed, resources):
+    # the steps of an insert_sequence call where it inserted them
+    tasks = _chain(sequence, _decode_id(product_id), [(position, start) for (position, start, _) in placed], resources)
+    for ((resource, task), (_, _, index)) in zip(tasks, placed):
+        resource.insert_task(task, index)
+
+
+def replay(path, scheduler=None):
+    # Places the decisions of the trace at path again without searching, on scheduler or on
+    # one rebuilt from the trace header; returns the scheduler and the number of calls.
+    (header, records) = read_trace(path)
+    if scheduler is None:
+        scheduler = trace_scheduler(path, header)
+    resources = list(scheduler.resources.values())
+    calls = 0
+    for record in records:
+        calls += 1
+        kind = record[0]
+        if kind == _FORWARD or (kind == _BACKWARD and record[-2] is not None):
+            tasks = _chain(record[1], _decode_id(record[2]), _steps(record[1], record), resources)
+            scheduler.commit_plan(tasks, record[3] if kind == _FORWARD else record[-2])
+        elif kind == _INSERT:
+            _insert(record[1], record[2], record[4], resources)
+        elif kind == _INSERT_MANY:
+            for (sequence, product_id, _, placed) in record[1]:
+                _insert(sequence, product_id, placed, resources)
+        elif kind == _EVICT:
+            scheduler.evict(record[1])
+    return scheduler, calls
+
+
+class Divergence(NamedTuple):
+    call: int  # position of the call in the trace, from 0
+    method: str
+    product_id: Any
+    step: int  # first step placed differently, counted over all items of insert_sequences
+    recorded: Optional[tuple]  # (resource name, start) of that step in the trace, None if it had none
+    found: Optional[tuple]  # ... as the search placed it now
+
+    def message(self):
+        return (f"call {self.call} ({self.method} of {self.product_id!r}): step {self.step} "
+                f"recorded at {self.recorded}, now at {self.found}")
+
+
+def _named(steps, step, resources):
+    if step >= len(steps):
+        return None
+    (position, start) = steps[step]
+    return resources[position].name, start
+
+
+def diff(path, scheduler=None):
+    # Runs the calls of the trace at path again with the search, like replay; returns the
+    # first Divergence from the recorded decisions, or None if every call decided the same.
+    (header, records) = read_trace(path)
+    if scheduler is None:
+        scheduler = trace_scheduler(path, header)
+    resources = list(scheduler.resources.values())
+    capture = _Capture({resource: position for (position, resource) in enumerate(resources)})
+    (recorder, scheduler.recorder) = (scheduler.recorder, capture)
+    try:
+        for (call, record) in enumerate(records):
+            kind = record[0]
+            capture.record = None
+            if kind == _FORWARD:
+                scheduler.schedule_forward(record[1], _decode_id(record[2]), record[3])
+            elif kind == _BACKWARD:
+                scheduler.schedule_backward(record[1], _decode_id(record[2]), record[3], record[4])
+            elif kind == _INSERT:
+                scheduler.insert_sequence(record[1], record[3], _decode_id(record[2]))
+            elif kind == _INSERT_MANY:
+                scheduler.insert_sequences([(sequence, start_time, _decode_id(product_id))
+                                            for (sequence, product_id, start_time, _) in record[1]])
+            elif kind == _EVICT:
+                scheduler.evict(record[1])
+            # through JSON, the way the trace has it
+            found = json.loads(_dumps(capture.record))
+            if found == record:
+                continue
+            sequence = None if kind in (_INSERT_MANY, _EVICT) else record[1]
+            (recorded, found) = (_steps(sequence, record), _steps(sequence, found))
+            step = next((step for (step, (a, b)) in enumerate(zip(recorded, found)) if a != b),
+                        min(len(recorded), len(found)))
+            if kind == _INSERT_MANY:
+                owners = [item[1] for item in record[1] for _ in item[3]]
+                product_id = _decode_id(owners[step]) if step < len(owners) else None
+            else:
+                product_id = None if kind == _EVICT else _decode_id(record[2])
+            return Divergence(call, _CALLS[kind], product_id, step, _named(recorded, step, resources),
+                              _named(found, step, resources))
+    finally:
+        scheduler.recorder = recorder
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a decision trace written by Scheduler.record, or run its "
+                                                 "calls with the search again and report the first divergence.")
+    parser.add_argument("action", choices=("replay", "diff"))
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    started = timer()
+    if args.action == "replay":
+        (scheduler, calls) = replay(args.path)
+        tasks = sum(len(resource.tasks) for resource in scheduler.resources.values())
+        print(f"Replayed {calls} calls, {tasks} tasks in {timer() - started:.3f}s")
+        invalid = [resource.name for resource in scheduler.resources.values()
+                   if resource.validate_timeline()[0] is not None]
+        if invalid:
+            print(f"Invalid timelines: {', '.join(invalid)}")
+    else:
+        divergence = diff(args.path)
+        print(f"Searched again in {timer() - started:.3f}s: "
+              f"{divergence.message() if divergence is not None else 'no divergence'}")
+        raise SystemExit(0 if divergence is None else 1)
@@ -1,11 +1,13 @@
 import math
-from itertools import zip_longest
-
-import plotly.express as px
-import pandas as pd
-import datetime
+from bisect import bisect_left, bisect_right
+from itertools import count, zip_longest
+from typing import NamedTuple, Any
 from timeit import default_timer as timer
 
+from gap_index import GapIndex, EPS
+from occupancy import OccupancySteps
+from events import tracer, Inserted, Shifted
+
 ### Resources
 MANIPULATOR_COLD = ["COLD_HAND"]
 MANIPULATOR_WARM = ["WARM_HAND"]
@@ -17,6 +19,7 @@ OVEN1 = ["OVEN 1"]
 DISPENSER = ["DISP 1", "DISP 2"]
 WARM_ROOM_15 = [f"WR {x}" for x in range(15)]
 WARM_ROOM_30 = [f"WR {x}" for x in range(33)]
+WARM_ROOM = ["WARM ROOM"]  # one CapacityResource standing for the slots of WARM_ROOM_30
 
 ALL_RESOURCES = MANIPULATOR_COLD + MANIPULATOR_WARM + OVEN3 + WARM_ROOM_30
 
@@ -33,7 +36,75 @@ OPERATION_TYPE = {
 WARM_STORAGE_LIMIT = 7200
 
 
+def _task_start(task):
+    return task.start
+
+
+_ALIGN = 0
+_CHAIN = 1
+
+
+def _propagate(stack):
+    # Runs a shift cascade depth-first, in the order recursive align_tasks/shift_all calls
+    # would, without recursion. Frames: [_ALIGN, task, leaf, index] pushes the tasks after
+    # task (tasks[index] of its free-gap index leaf) on its resource; [_CHAIN, task, delta]
+    # shifts task and the rest of its product chain. A cascade only moves tasks, so an
+    # _ALIGN frame walks the leaves without looking its task up again.
+    # Shifts are O(1): the free-gap index only marks the moved leaves and repairs its
+    # aggregates on the next query. Returns how many tasks moved and the deepest stack.
+    moved = 0
+    depth = len(stack)
+    while stack:
+        frame = stack[-1]
+        task = frame[1]
+        if frame[0] == _ALIGN:
+            (leaf, index) = (frame[2], frame[3] + 1)
+            if index == len(leaf.tasks):
+                (leaf, index) = (leaf.next, 0)
+                if leaf is None:
+                    stack.pop()
+                    continue
+            next_task = leaf.tasks[index]
+            shift = task.end - next_task.start
+            if shift <= 0:
+                stack.pop()
+                continue
+
+            if tracer.level <= Shifted.level:
+                resource = next_task.resource
+                tracer.emit(Shifted(resource.name, next_task.product_id, resource.free_gaps.position(next_task),
+                                    next_task.start, shift))
+            next_task.shift(shift)
+            moved += 1
+            (frame[1], frame[2], frame[3]) = (next_task, leaf, index)
+            if next_task.next_task is not None:
+                stack.append([_CHAIN, next_task.next_task, shift])
+                if len(stack) > depth:
+                    depth = len(stack)
+        else:
+            if task is None:
+                stack.pop()
+                continue
+            task.shift(frame[2])
+            moved += 1
+            frame[1] = task.next_task
+            leaf = task._node
+            if leaf is not None and leaf is not POOLED:
+                stack.append(_align_frame(task))
+                if len(stack) > depth:
+                    depth = len(stack)
+    return moved, depth
+
+
+def _align_frame(task):
+    leaf = task._node
+    return [_ALIGN, task, leaf, leaf.tasks.index(task)]
+
+
 class Task:
+    __slots__ = ("start", "end", "duration", "product_id", "resource", "prev_task", "next_task", "type", "priority",
+                 "_node")
+
     def __init__(self, start, duration, product_id, resource, task_type, priority):
         self.start = start
         self.end = start + duration
@@ -44,32 +115,316 @@ class Task:
         self.next_task = None
         self.type = task_type
         self.priority = priority
+        self._node = None
 
     def __repr__(self):
         return f'Task(start={self.start}, end={self.end}, duration={self.duration}, product_id={self.product_id}, resource_name={self.resource.name}, type={self.type})'
 
     def shift(self, delta):
+        (start, end) = (self.start, self.end)
         self.start += delta
         self.end += delta
+        if self._node is not None:
+            self.resource.moved(self, start, end)
 
     def shift_all(self, delta):
         self.shift(delta)
-
-        next_task = self.next_task
-        while next_task:
-            next_task.shift(delta)
-            next_task.resource.align_tasks(start_task=next_task)
-            next_task = next_task.next_task
+        _propagate([[_CHAIN, self.next_task, delta]])
+        if self.resource is not None and self.resource.checker is not None:
+            self.resource.checker.check()
+
+
+def _unload_anomaly(first, second):
+    # a LOAD followed by another product's UNLOAD coming from the resource the LOAD feeds
+    if first.product_id != second.product_id:
+        if first.type == OPERATION_TYPE["LOAD"] and second.type == OPERATION_TYPE["UNLOAD"]:
+            load_resource = first.next_task.resource.name if first.next_task else None
+            unload_resource = second.prev_task.resource.name if first.prev_task else None
+            if load_resource and load_resource == unload_resource:
+                return True
+    return False
+
+
+class _Pooled:
+    # leaf of the tasks of a CapacityResource: they have no neighbours to align
+    __slots__ = ()
+
+
+POOLED = _Pooled()
+
+
+class Violation(NamedTuple):
+    kind: str  # "overlap", "unload_anomaly" or "over_capacity"
+    resource: str
+    index: int
+    first: Any
+    second: Any
+
+    def message(self):
+        if self.kind == "overlap":
+            return f"Invalid timeline {self.resource} at {self.index} in {self.first.end}"
+        if self.kind == "over_capacity":
+            return f"Over capacity {self.resource} at {self.index}: {self.first}"
+        return f"Unload anomaly {self.resource} at {self.index}: {self.first} before {self.second}"
+
+
+class InvariantViolation(Exception):
+    # every violation one operation caused; violation is the first of them
+    def __init__(self, violations):
+        message = violations[0].message()
+        if len(violations) > 1:
+            message += f" (and {len(violations) - 1} more)"
+        super().__init__(message)
+        self.violations = violations
+        self.violation = violations[0]
+
+
+class InvariantChecker:
+    """Checks timeline invariants where they change, see Scheduler.check_invariants.
+
+    Resources report the tasks they place, move or uncover; check() runs once an operation
+    has finished (a cascade passes through overlaps on its way) and looks only at the pairs
+    around those tasks: no overlap, and no LOAD followed by another product's UNLOAD that
+    detect_unload_anomaly would report. Tasks of a CapacityResource are checked against its
+    capacity instead. Each violating pair is reported once. In "raise" mode, every pair
+    around the touched tasks is checked before the violations found are raised together.
+    """
+
+    def __init__(self, mode="raise"):
+        if mode not in ("raise", "collect"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.mode = mode
+        self.touched = []
+        self.violations = []
+        self.reported = set()
+
+    def check(self):
+        touched = self.touched
+        self.touched = []
+        found = len(self.violations)
+        seen = set()
+        for task in touched:
+            node = task._node
+            if node is None or id(task) in seen:
+                continue
+            seen.add(id(task))
+            if node is POOLED:
+                if task.resource.over_capacity(task):
+                    self._report("over_capacity", task.resource, task, None)
+                continue
+            before = node.before(task)
+            if before is not None:
+                self._check_pair(task.resource, before, task)
+            after = node.after(task)
+            if after is not None:
+                self._check_pair(task.resource, task, after)
+        if self.mode == "raise" and len(self.violations) > found:
+            raise InvariantViolation(self.violations[found:])
+
+    def _check_pair(self, resource, first, second):
+        if first.end > second.start:
+            self._report("overlap", resource, first, second)
+        if _unload_anomaly(first, second):
+            self._report("unload_anomaly", resource, first, second)
+
+    def _report(self, kind, resource, first, second):
+        key = (kind, id(first), id(second))
+        if key in self.reported:
+            return
+        self.reported.add(key)
+        violation = Violation(kind, resource.name, resource.position(first), first, second)
+        self.violations.append(violation)
+
+
+_PLACED = 0
+_REMOVED = 1
+_MOVED = 2
+
+# Resource versions: unique over all resources and time, so a version names one state of
+# one timeline
+_versions = count(1)
+
+
+class Journal:
+    """Undo log of timeline changes while a Scheduler snapshot is open.
+
+    Rolling back costs the number of changes made since the snapshot, not the size of
+    the schedule. A cascade can move the same task many times; only its first move
+    since the innermost snapshot is recorded. Undoing gives every resource back the
+    version it had, so slot queries cached before the changes hit again.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.versions = []  # Resource.version before each entry
+        self.open = 0
+        self.moved = set()
+
+    def undo_to(self, position):
+        self.moved.clear()
+        entries = self.entries
+        while len(entries) > position:
+            entry = entries.pop()
+            (kind, resource, task) = entry[:3]
+            if kind == _PLACED:
+                resource._unplace(task)
+                if resource.usage is not None:
+                    resource.usage.removed(resource, task, forget=True)
+            elif kind == _REMOVED:
+                resource._restore(entry[3], task)
+                if resource.usage is not None:
+                    resource.usage.placed(resource, task)
+            else:
+                (start, end) = (task.start, task.end)
+                resource._unmove(task, *entry[3:])
+                if resource.usage is not None:
+                    resource.usage.moved(resource, task, start, end)
+            resource.version = self.versions.pop()
+            resource.changed()
 
 
 class Resource:
     def __init__(self, name):
         self.name = name
         self.tasks = []
+        self.free_gaps = GapIndex()
+        self.journal = None
+        self.checker = None
+        self.perf = None
+        self.usage = None
+        self.cache = None
+        # a new number on every change of the timeline, the number it had on rollback; see SlotCache
+        self.version = 0
+        self.groups = []  # (ResourceGroup, position) this resource belongs to
+        # tasks dropped by evict(): count, busy time and the (prev, next) priority pairs they
+        # formed, each with the end of its first prev task, for the priority hack in find_slot
+        self.evicted = 0
+        self.evicted_busy = 0
+        self.past_pairs = {}
 
     def add_task(self, task):
-        self.tasks.append(task)
-        self._sort_tasks()
+        index = bisect_right(self.tasks, task.start, key=_task_start)
+        self._place(index, task)
+        if self.checker is not None:
+            self.checker.check()
+
+    def _place(self, index, task):
+        self.tasks.insert(index, task)
+        self.free_gaps.insert(index, task)
+        self._record_place(task)
+
+    def _append(self, tasks):
+        # tasks sorted by start after the last one, without journal or checks: restoring saved timelines
+        self.tasks.extend(tasks)
+        self.free_gaps.extend(tasks)
+        self.version = next(_versions)
+        self.changed()
+
+    def _record_place(self, task):
+        if self.journal is not None:
+            self.journal.entries.append((_PLACED, self, task))
+            self.journal.versions.append(self.version)
+        self.version = next(_versions)
+        if self.usage is not None:
+            self.usage.placed(self, task)
+        if self.checker is not None:
+            self.checker.touched.append(task)
+        self.changed()
+
+    def changed(self):
+        for (group, position) in self.groups:
+            group.dirty.add(position)
+
+    def remove_task(self, task):
+        # takes the task off the timeline without moving its neighbours
+        index = self.free_gaps.position(task)
+        del self.tasks[index]
+        self.free_gaps.remove(task)
+        self._record_remove(index, task)
+        return index
+
+    def _record_remove(self, index, task):
+        if self.journal is not None:
+            self.journal.entries.append((_REMOVED, self, task, index))
+            self.journal.versions.append(self.version)
+        self.version = next(_versions)
+        if self.usage is not None:
+            self.usage.removed(self, task)
+        self.changed()
+        if self.checker is not None and 0 < index < len(self.tasks):
+            self.checker.touched.append(self.tasks[index])
+            self.checker.check()
+
+    def moved(self, task, old_start, old_end):
+        self.free_gaps.moved(task)
+        self._record_move(task, old_start, old_end)
+
+    def _record_move(self, task, old_start, old_end):
+        journal = self.journal
+        if journal is not None and task not in journal.moved:
+            journal.moved.add(task)
+            journal.entries.append((_MOVED, self, task, old_start, old_end))
+            journal.versions.append(self.version)
+        self.version = next(_versions)
+        if self.usage is not None:
+            self.usage.moved(self, task, old_start, old_end)
+        if self.checker is not None:
+            self.checker.touched.append(task)
+        if self.groups and self.tasks[-1] is task:
+            self.changed()
+
+    # undo of _place, remove_task and moved for Journal.undo_to
+    def _unplace(self, task):
+        index = self.free_gaps.position(task)
+        del self.tasks[index]
+        self.free_gaps.remove(task)
+        self.version = next(_versions)
+
+    def _restore(self, index, task):
+        self.tasks.insert(index, task)
+        self.free_gaps.insert(index, task)
+        self.version = next(_versions)
+
+    def _unmove(self, task, start, end):
+        (task.start, task.end) = (start, end)
+        self.free_gaps.moved(task)
+        self.version = next(_versions)
+
+    def position(self, task):
+        return self.free_gaps.position(task)
+
+    def evict_margin(self):
+        # how long after its end a task can still affect find_slot for later start times
+        return 0
+
+    def evict(self, now):
+        # Drops tasks that ended before now and can no longer affect scheduling at or after now.
+        # The latest of them stays as the left edge of the first free gap. Dropped tasks are
+        # unlinked from their product chains. Returns how many were dropped.
+        if self.journal is not None:
+            raise RuntimeError("cannot evict while a snapshot is open")
+        tasks = self.tasks
+        limit = now - self.evict_margin()
+        count = 0
+        while count + 1 < len(tasks) and tasks[count + 1].end < limit:
+            count += 1
+        for index in range(count):
+            (task, next_task) = (tasks[index], tasks[index + 1])
+            self.past_pairs.setdefault((task.priority, next_task.priority), task.end)
+            self.evicted_busy += task.duration
+            self.free_gaps.remove(task)
+            if self.usage is not None:
+                self.usage.forget(task)
+            if task.next_task is not None:
+                task.next_task.prev_task = None
+            if task.prev_task is not None:
+                task.prev_task.next_task = None
+            (task.prev_task, task.next_task) = (None, None)
+        del tasks[:count]
+        self.evicted += count
+        self.version = next(_versions)
+        self.changed()
+        return count
 
     def get_total_time(self):
         for task in reversed(self.tasks):
@@ -78,9 +433,6 @@ class Resource:
 
         return 0
 
-    def _sort_tasks(self):
-        self.tasks.sort(key=lambda x: x.start)
-
     def validate_timeline(self):
         pairs = list(zip_longest(self.tasks, self.tasks[1:], fillvalue=None))
         for index, pair in enumerate(pairs):
@@ -96,93 +448,141 @@ class Resource:
         for pair in pairs:
             if pair[1] is None:
                 continue
-            if pair[0].product_id != pair[1].product_id:
-                if pair[0].type == OPERATION_TYPE["LOAD"] and pair[1].type == OPERATION_TYPE["UNLOAD"]:
-                    load_resource = pair[0].next_task.resource.name if pair[0].next_task else None
-                    unload_resource = pair[1].prev_task.resource.name if pair[0].prev_task else None
-                    if load_resource and load_resource == unload_resource:
-                        anomalies.append(pair)
+            if _unload_anomaly(pair[0], pair[1]):
+                anomalies.append(pair)
         return anomalies
 
     def find_time(self, duration, start_time, priority):
-        pairs = list(zip_longest(self.tasks, self.tasks[1:], fillvalue=None))
-        if not pairs:
+        if self.perf is None:
+            (start_time, distance) = self._query_slot(duration, start_time, priority)
+        else:
+            started = timer()
+            (start_time, distance) = self._query_slot(duration, start_time, priority)
+            self.perf.counts["find_time"] += 1
+            self.perf.observe("find_time", timer() - started)
+        return start_time, distance
+
+    def _query_slot(self, duration, start_time, priority):
+        # find_slot, through the SlotCache if there is one
+        if self.cache is None:
+            return self.find_slot(duration, start_time, priority)
+        return self.cache.find_slot(self, duration, start_time, priority)
+
+    # returns: actual_start_time, distance to the previous task
+    def find_slot(self, duration, start_time, priority):
+        tasks = self.tasks
+        if not tasks:
+            return start_time, 0
+        if start_time + duration < tasks[0].start:
+            # insert before the first task
             return start_time, 0
-        for index, pair in enumerate(pairs):
-            if index == 0:
-                if start_time + duration < pair[0].start:
-                    # insert before pair[0]
-                    return start_time, 0
-
-            if pair[1] is None:
-                # insert after pair[0]
-                start_time = max(pair[0].end, start_time)
-                return start_time, start_time - pair[0].end
-
-            # can insert before next
-
-            possibly_start = max(pair[0].end, start_time)
-            if possibly_start + duration <= pair[1].start:
-                return possibly_start, possibly_start - pair[0].end
-
-            # check priority
-            # FIXME: hack to prevent load-unload anomaly
-            if pair[1].priority < priority and pair[0].priority != priority and pair[1].priority != priority:
-                return possibly_start, possibly_start - pair[0].end
 
-        return None
+        # a gap can only fit when the next task starts after start_time + duration
+        lo = max(bisect_left(tasks, start_time + duration, key=_task_start) - 1, 0)
+        found = self.free_gaps.first(
+            lo,
+            lambda block: block.max_gap + EPS >= duration,
+            lambda task, following: following is not None
+            and max(task.end, start_time) + duration <= following.start)
+
+        # FIXME: hack to prevent load-unload anomaly
+        for ((prev_priority, next_priority), prev_end) in self.past_pairs.items():
+            # evicted pairs come before every gap
+            if next_priority < priority and prev_priority != priority:
+                start_time = max(prev_end, start_time)
+                return start_time, start_time - prev_end
+        forced = self.free_gaps.first(
+            0,
+            lambda block: (block.hack_next if block.hack_prev != priority else block.hack_second) < priority,
+            lambda task, following: following is not None
+            and following.priority < priority and task.priority != priority)
+        if forced is not None and (found is None or forced[0] < found[0]):
+            found = forced
+
+        before = found[1] if found is not None else tasks[-1]
+        start_time = max(before.end, start_time)
+        return start_time, start_time - before.end
+
+    def find_time_before(self, duration, end_time, priority):
+        if self.perf is None:
+            return self.find_slot_before(duration, end_time, priority)
+        started = timer()
+        found = self.find_slot_before(duration, end_time, priority)
+        self.perf.counts["find_time"] += 1
+        self.perf.observe("find_time", timer() - started)
+        return found
+
+    # returns: latest start ending by end_time in a free gap and the room left after the task;
+    # the mirror of find_slot, without its load-unload priority hack
+    def find_slot_before(self, duration, end_time, priority):
+        return self._latest_fit(duration, end_time, 0)
+
+    def _latest_fit(self, duration, end_time, pad):
+        # pad is kept free on both sides of the new task
+        tasks = self.tasks
+        latest = end_time - duration
+        if not tasks or tasks[-1].end + pad <= latest:
+            # after the last task
+            return latest, 0
+
+        # only pairs whose first task starts before end_time can hold the task
+        hi = bisect_left(tasks, end_time, key=_task_start) - 1
+        found = self.free_gaps.last(
+            hi,
+            lambda block: block.max_gap + EPS >= duration + pad * 2 and block.min_end + pad <= latest + EPS,
+            lambda task, following: following is not None
+            and task.end + pad <= min(latest, following.start - pad - duration))
+        # before the first task if no gap fits
+        next_start = (tasks[found[0] + 1].start if found is not None else tasks[0].start) - pad
+        start = min(latest, next_start - duration)
+        return start, next_start - (start + duration)
 
     # returns: actual_start_time, index_where_insert, shift for the next tasks
     def find_time_to_insert(self, start_time):
         if not self.tasks:
             return start_time, 0
-        for index, task in enumerate(self.tasks):
+        index = bisect_right(self.tasks, start_time, key=_task_start)
+        if index == 0:
             # insert before task
-            if start_time < task.start:
-                return start_time, index
-
-            # insert after task but before next if any
-            if index + 1 == len(self.tasks) or start_time < self.tasks[index+1].start:
-                return max(task.end, start_time), index + 1
+            return start_time, 0
 
-        return None
+        # insert after task but before next if any
+        return max(self.tasks[index - 1].end, start_time), index
 
     def insert_task(self, task, index):
-        print(f"Resource {self.name}: inserting {task.product_id} with start {task.start} at index {index}...")
-
         if index is None:
             index = self.find_index_by_time(task.start)
 
         # insert task
-        self.tasks.insert(index, task)
+        self._place(index, task)
+        if tracer.level <= Inserted.level:
+            tracer.emit(Inserted(self.name, task.product_id, task.start, index))
 
         # align next tasks
         self.align_tasks(index=index)
-        print(f"Resource {self.name}: inserted {task.product_id}")
 
     def find_index_by_time(self, start_time):
-        for index, task in enumerate(self.tasks):
-            if start_time <= task.start:
-                return index
-        return len(self.tasks)
+        return bisect_left(self.tasks, start_time, key=_task_start)
 
-    def align_tasks(self, start_task=None, index=None):
-        print(f"Resource {self.name}: aligning tasks from {start_task.product_id if start_task else index}...")
+    def pushes(self, task, index=None):
+        # whether insert_task(task, index) would move tasks already on the timeline
+        if index is None:
+            index = self.find_index_by_time(task.start)
+        return index < len(self.tasks) and self.tasks[index].start < task.end
 
-        index = index if index is not None else self.tasks.index(start_task) if start_task is not None else 0
-        prev_end = self.tasks[index].end
+    def align_tasks(self, start_task=None, index=None):
+        if start_task is None:
+            start_task = self.tasks[index if index is not None else 0]
 
         # shift next tasks
-        for i in range(index+1, len(self.tasks)):
-            task = self.tasks[i]
-            shift = prev_end - task.start
-            if shift <= 0:
-                break
-
-            print(f"Resource {self.name}: shifting task {task.product_id} at {i} in {task.start} for {shift}")
-            task.shift_all(shift)
-
-            prev_end = task.end
+        if self.perf is None:
+            _propagate([_align_frame(start_task)])
+        else:
+            started = timer()
+            (moved, depth) = _propagate([_align_frame(start_task)])
+            self.perf.record_cascade(timer() - started, moved, depth)
+        if self.checker is not None:
+            self.checker.check()
 
     def __repr__(self):
         return f'Resource(name={self.name}, tasks={self.tasks})'
@@ -193,28 +593,182 @@ class OvenResource(Resource):
         super().__init__(name)
         self.extra_duration = extra_duration
 
-    def find_time(self, duration, start_time, priority):
-        pairs = list(zip_longest(self.tasks, self.tasks[1:], fillvalue=None))
-        if not pairs:
+    def evict_margin(self):
+        # a gap after a task ending within extra * 2 of start_time is still considered
+        return self.extra_duration * 2
+
+    def find_slot(self, duration, start_time, priority):
+        tasks = self.tasks
+        if not tasks:
             return start_time, 0
 
         extra = self.extra_duration
 
-        for pair in pairs:
-            end0 = pair[0].end + self.extra_duration
+        # a gap after a task ending at or after start_time - extra * 2, padded on both sides
+        after = self.free_gaps.first(
+            0,
+            lambda block: block.max_gap + EPS >= duration + extra * 3 and block.max_end + extra >= start_time - extra,
+            lambda task, following: following is not None and task.end + extra >= start_time - extra
+            and (following.start - extra) - (task.end + extra) >= duration + extra)
+        # start_time inside a gap after a task ending before start_time - extra * 2
+        lo = max(bisect_right(tasks, start_time + duration + extra * 2, key=_task_start) - 1, 0)
+        inside = self.free_gaps.first(
+            lo,
+            lambda block: block.min_end + extra < start_time - extra,
+            lambda task, following: following is not None
+            and task.end + extra < (start_time - extra) < following.start - extra
+            and start_time + duration + extra < following.start - extra)
+
+        if after is not None and (inside is None or after[0] < inside[0]):
+            return after[1].end + extra + extra, 0
+        if inside is not None:
+            return start_time, start_time - (inside[1].end + extra)
+
+        end0 = tasks[-1].end + extra
+        start_time = max(end0 + extra, start_time)
+        return start_time, start_time - end0
+
+    def find_slot_before(self, duration, end_time, priority):
+        # padded like the "after" gaps of find_slot
+        return self._latest_fit(duration, end_time, self.extra_duration * 2)
+
+
+class CapacityResource(Resource):
+    """Resource holding up to capacity tasks at the same time, like the slots of a warm room.
+
+    The occupancy is kept as a step function, so find_slot looks at the occupancy changes
+    after start_time instead of at every slot. Tasks do not push each other: a cascade
+    that moves a task into a full period is left to the invariant checker and
+    validate_timeline to report.
+    """
+
+    def __init__(self, name, capacity):
+        super().__init__(name)
+        self.capacity = capacity
+        self.occupancy = OccupancySteps()
+
+    def _place(self, index, task):
+        # tasks stay sorted by start; index is not used
+        self.tasks.insert(bisect_right(self.tasks, task.start, key=_task_start), task)
+        self.occupancy.add(task.start, task.end, 1)
+        task._node = POOLED
+        self._record_place(task)
+
+    def _append(self, tasks):
+        for task in tasks:
+            self.tasks.append(task)
+            self.occupancy.add(task.start, task.end, 1)
+            task._node = POOLED
+        self.version = next(_versions)
+        self.changed()
+
+    def remove_task(self, task):
+        index = self.position(task)
+        del self.tasks[index]
+        self.occupancy.add(task.start, task.end, -1)
+        task._node = None
+        self._record_remove(index, task)
+        return index
+
+    def moved(self, task, old_start, old_end):
+        self._unplace_interval(task, old_start, old_end)
+        self.tasks.insert(bisect_right(self.tasks, task.start, key=_task_start), task)
+        self.occupancy.add(task.start, task.end, 1)
+        self._record_move(task, old_start, old_end)
+
+    def _unplace_interval(self, task, start, end):
+        self.tasks.remove(task)
+        self.occupancy.add(start, end, -1)
+        self.version = next(_versions)
+
+    def _unplace(self, task):
+        self._unplace_interval(task, task.start, task.end)
+        task._node = None
+
+    def _restore(self, index, task):
+        self.tasks.insert(index, task)
+        self.occupancy.add(task.start, task.end, 1)
+        task._node = POOLED
+        self.version = next(_versions)
+
+    def _unmove(self, task, start, end):
+        self._unplace_interval(task, task.start, task.end)
+        (task.start, task.end) = (start, end)
+        self.tasks.insert(bisect_right(self.tasks, start, key=_task_start), task)
+        self.occupancy.add(start, end, 1)
+
+    def position(self, task):
+        index = bisect_left(self.tasks, task.start, key=_task_start)
+        while self.tasks[index] is not task:
+            index += 1
+        return index
+
+    def over_capacity(self, task):
+        return self.occupancy.peak(task.start, task.end) > self.capacity
+
+    def evict(self, now):
+        # drops tasks that ended before now, with the occupancy steps before now
+        if self.journal is not None:
+            raise RuntimeError("cannot evict while a snapshot is open")
+        kept = []
+        for task in self.tasks:
+            if task.end >= now:
+                kept.append(task)
+                continue
+            self.evicted_busy += task.duration
+            task._node = None
+            if self.usage is not None:
+                self.usage.forget(task)
+            if task.next_task is not None:
+                task.next_task.prev_task = None
+            if task.prev_task is not None:
+                task.prev_task.next_task = None
+            (task.prev_task, task.next_task) = (None, None)
+        count = len(self.tasks) - len(kept)
+        self.tasks[:] = kept
+        self.occupancy.trim(now)
+        self.evicted += count
+        self.version = next(_versions)
+        self.changed()
+        return count
 
-            if pair[1] is None:
-                start_time = max(end0 + extra, start_time)
-                return start_time, start_time - end0
+    def get_total_time(self):
+        return max((task.end for task in self.tasks if task.type != OPERATION_TYPE["PICKUP"]), default=0)
 
-            start1 = pair[1].start - self.extra_duration
+    def validate_timeline(self):
+        # first task starting in a period with more than capacity tasks
+        (times, levels) = (self.occupancy.times, self.occupancy.levels)
+        for (time, level) in zip(times, levels):
+            if level > self.capacity:
+                return self.find_index_by_time(time), time
+        return None, None
 
-            if end0 >= start_time - extra:
-                if start1 - end0 >= duration + extra:
-                    return end0 + extra, 0
+    def detect_unload_anomaly(self):
+        return []
+
+    def find_slot(self, duration, start_time, priority):
+        # the earliest start with a free place for the whole duration; distance is the time
+        # since the occupancy last changed
+        occupancy = self.occupancy
+        if not len(occupancy):
+            return start_time, 0
+        (start, changed) = occupancy.earliest(start_time, duration, self.capacity)
+        distance = start - changed if changed > -math.inf else 0
+        return start, distance
 
-            if end0 < (start_time - extra) < start1:
-                if start_time + duration + extra < start1:
-                    return start_time, start_time - end0
+    def find_slot_before(self, duration, end_time, priority):
+        occupancy = self.occupancy
+        if not len(occupancy):
+            return end_time - duration, 0
+        return occupancy.latest(end_time, duration, self.capacity), 0
 
-        return None
+    def find_time_to_insert(self, start_time):
+        # inserted tasks never push others here
+        return start_time, None
+
+    def pushes(self, task, index=None):
+        return False
+
+    def align_tasks(self, start_task=None, index=None):
+        if self.checker is not None:
+            self.checker.check()
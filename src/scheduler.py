@@ -1,46 +1,238 @@
 import math
-from typing import Dict, Tuple, List
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional
 from datetime import timedelta
+from timeit import default_timer as timer
 
-from resources import Resource, OvenResource, Task
+from resources import Resource, OvenResource, Task, Journal, InvariantChecker
+from groups import ResourceGroup, GROUP_MIN_SIZE
+from metrics import PerfCounters, UsageMeter, profiled
+from slot_cache import SlotCache
+from events import tracer, CandidateEvaluated, InsertCandidateEvaluated, StepPlanned, Replan
+
+
+class Snapshot:
+    __slots__ = ("position", "closed")
+
+    def __init__(self, position):
+        self.position = position
+        self.closed = False
 
 
 class Scheduler:
-    def __init__(self, resources: Dict[str, Resource]):
+    def __init__(self, resources: Dict[str, Resource], group_min_size=GROUP_MIN_SIZE):
+        # candidate lists of at least group_min_size resources of one kind are searched as a
+        # ResourceGroup; None queries every resource
         self.resources = resources
+        self.journal = None
+        self.checker = None
+        self.perf = None
+        self.usage = None
+        self.cache = None
+        self.recorder = None
+        self.group_min_size = group_min_size
+        self.groups = {}
 
-    def print_resource_utilization(self, count, pickup_emulation_time):
+    def snapshot(self) -> Snapshot:
+        # Start recording changes; snapshots nest. Resources only journal while one is open.
+        if self.recorder is not None:
+            raise RuntimeError("a recorded scheduler cannot take snapshots: rolled back calls would stay in the trace")
+        if self.journal is None:
+            self.journal = Journal()
+            for resource in self.resources.values():
+                resource.journal = self.journal
+        self.journal.open += 1
+        self.journal.moved.clear()
+        return Snapshot(len(self.journal.entries))
+
+    def rollback(self, snapshot: Snapshot):
+        # Undo every change made since the snapshot; tasks placed since then are dropped.
+        self.journal.undo_to(snapshot.position)
+        self._close(snapshot)
+
+    def commit(self, snapshot: Snapshot):
+        # Keep the changes; an enclosing snapshot can still roll them back.
+        self._close(snapshot)
+
+    def _close(self, snapshot):
+        if snapshot.closed:
+            return
+        snapshot.closed = True
+        self.journal.open -= 1
+        if self.journal.open == 0:
+            for resource in self.resources.values():
+                resource.journal = None
+            self.journal = None
+
+    @contextmanager
+    def fork(self):
+        # What-if planning on the live timelines: everything done inside the block is
+        # rolled back on exit unless the snapshot was committed.
+        #
+        #     with scheduler.fork() as snapshot:
+        #         tasks = scheduler.schedule_forward(sequence, product_id, start_time)
+        #         finish = tasks[-1].end
+        snapshot = self.snapshot()
+        try:
+            yield snapshot
+        finally:
+            if not snapshot.closed:
+                self.rollback(snapshot)
+
+    def resource_utilization(self, count, pickup_emulation_time):
+        # total time, products per 24h and per-resource utilization of the current schedule
         ends = [r.get_total_time() for r in self.resources.values()]
         total_time = max(ends)
         if pickup_emulation_time is not None:
             total_time += pickup_emulation_time * count / 2
 
+        utilization = {}
+        for r in self.resources.values():
+            if self.usage is not None:
+                active_time = self.usage.total[r.name]
+            else:
+                active_time = sum([task.duration for task in r.tasks])
+            if active_time:
+                # a capacity resource is shared out over its places
+                utilization[r.name] = (active_time, active_time / total_time / getattr(r, "capacity", 1))
+        return total_time, 86400 / total_time * count, utilization
+
+    def check_invariants(self, mode="raise"):
+        # Incremental validation: overlaps and LOAD/UNLOAD anomalies are checked where
+        # insert_task/align_tasks change the timelines. "raise" raises one InvariantViolation
+        # with every violation an operation caused, "collect" gathers them in
+        # checker.violations; None turns checking off.
+        self.checker = InvariantChecker(mode) if mode is not None else None
+        for resource in self.resources.values():
+            resource.checker = self.checker
+        return self.checker
+
+    def enable_stats(self, enabled=True):
+        # Counts and times find_time calls, candidates per step, schedule_forward runs and their
+        # replans, and align_tasks cascades (tasks moved, stack depth); see stats(). Disabled,
+        # every instrumented call costs one `is None` check.
+        self.perf = PerfCounters() if enabled else None
+        for resource in self.resources.values():
+            resource.perf = self.perf
+        return self.perf
+
+    def stats(self, reset=False):
+        # snapshot of the counters as plain dicts, {} while disabled
+        if self.perf is None:
+            return {}
+        snapshot = self.perf.snapshot()
+        if reset:
+            self.enable_stats()
+        return snapshot
+
+    def enable_usage(self, enabled=True, window=3600):
+        # Keeps busy time per resource and window, finished orders per window and order shifts
+        # up to date as tasks are placed, shifted and rolled back; see UsageMeter. Tasks
+        # already on the timelines are counted as busy time, orders from now on.
+        self.usage = UsageMeter(window) if enabled else None
+        for resource in self.resources.values():
+            resource.usage = self.usage
+            if self.usage is not None:
+                for task in resource.tasks:
+                    self.usage.placed(resource, task)
+        return self.usage
+
+    def enable_cache(self, enabled=True, size=4096):
+        # Memoizes find_slot and find_time_to_insert per resource timeline version in one LRU
+        # of size entries, see SlotCache; cache_stats() has its hits and misses.
+        self.cache = SlotCache(size) if enabled else None
+        for resource in self.resources.values():
+            resource.cache = self.cache
+        return self.cache
+
+    def cache_stats(self, reset=False):
+        # hits, misses and hit rate of the slot cache, {} while disabled; reset starts the counts over
+        return self.cache.stats(reset) if self.cache is not None else {}
+
+    def record(self, path=None):
+        # Appends every schedule_forward, schedule_backward, insert_sequence(s) and evict call
+        # with the decisions it made to a trace file at path, see recording.DecisionTrace;
+        # None closes the trace.
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if path is not None:
+            from recording import DecisionTrace
+
+            self.recorder = DecisionTrace(path, self)
+        return self.recorder
+
+    @staticmethod
+    def profile(cpu=True, memory=False):
+        # cProfile and/or tracemalloc around a scheduling run, summarized by profile.report():
+        #
+        #     with scheduler.profile(memory=True) as profile:
+        #         simulate(scheduler, orders, oven)
+        return profiled(cpu, memory)
+
+    def print_resource_utilization(self, count, pickup_emulation_time):
+        (total_time, products_in_day, utilization) = self.resource_utilization(count, pickup_emulation_time)
+
         print(f"Total time: {timedelta(seconds=total_time)} ({total_time} sec)")
-        products_in_day = 86400 / total_time * count
         print(f"Max products in 24h: {products_in_day}")
         print(f"Max products in 1h: {products_in_day / 24}")
 
-        for r in self.resources.values():
-            active_time = sum([task.duration for task in r.tasks])
-            if active_time:
-                print(
-                    f"Resource {r.name}: total time = {total_time}, active_time = {active_time}, utilization = {active_time / total_time}")
+        for (name, (active_time, share)) in utilization.items():
+            print(f"Resource {name}: total time = {total_time}, active_time = {active_time}, utilization = {share}")
 
     def find_resource(self, task_data, start_time, product_id):
+        return self.pick_resource(task_data, product_id, self.evaluate_resources(task_data, start_time, product_id))
+
+    def group(self, names):
+        key = tuple(names)
+        if key not in self.groups:
+            members = [self.resources[name] for name in names]
+            self.groups[key] = ResourceGroup(members) if ResourceGroup.fits(members) else None
+        return self.groups[key]
+
+    def evaluate_resources(self, task_data, start_time, product_id):
+        # (resource, available_start, distance) for every candidate that can win, see ResourceGroup
         duration = task_data['duration']
+        names = task_data['resource']
+        group = None
+        if self.group_min_size is not None and len(names) >= self.group_min_size:
+            group = self.group(names)
+        if group is not None:
+            members = group.candidates(start_time, task_data["priority"])
+        else:
+            members = [self.resources[name] for name in names]
+        candidates = []
+        perf = self.perf
+        cache = self.cache
+        for resource in members:
+            if perf is not None:
+                started = timer()
+            if cache is None:
+                (available_start, distance) = resource.find_slot(duration, start_time, task_data["priority"])
+            else:
+                (available_start, distance) = cache.find_slot(resource, duration, start_time, task_data["priority"])
+            if perf is not None:
+                perf.observe("find_time", timer() - started)
+            if tracer.level <= CandidateEvaluated.level:
+                tracer.emit(CandidateEvaluated(product_id, resource.name, available_start, distance))
+            candidates.append((resource, available_start, distance))
+        if perf is not None:
+            perf.counts["find_time"] += len(candidates)
+            perf.observe("candidates", len(candidates))
+        return candidates
+
+    @staticmethod
+    def pick_resource(task_data, product_id, candidates):
         min_start = math.inf
         target_resource = None
         min_distance = -math.inf
-        for resource_name in task_data['resource']:
-            resource = self.resources[resource_name]
-            (available_start, distance) = resource.find_time(duration, start_time, task_data["priority"])
-            print(f"Planning {product_id}: candidate resource {resource.name} "
-                  f"with time slot started at {available_start}, distance = {distance}")
+        for (resource, available_start, distance) in candidates:
             if available_start < min_start or (available_start == min_start and distance > min_distance):
                 min_start = available_start
                 target_resource = resource
                 min_distance = distance
-        task = Task(min_start, duration, product_id, target_resource, task_data["type"], task_data["priority"])
+        task = Task(min_start, task_data['duration'], product_id, target_resource, task_data["type"],
+                    task_data["priority"])
         return target_resource, task
 
     def find_resource_to_insert(self, task_data, start_time, product_id):
@@ -50,9 +242,12 @@ class Scheduler:
         target_index = None
         for resource_name in task_data['resource']:
             resource = self.resources[resource_name]
-            (available_start, index) = resource.find_time_to_insert(start_time)
-            print(f"Inserting for {product_id}: candidate resource {resource.name} "
-                  f"with time slot started at {available_start} at index {index}")
+            if self.cache is None:
+                (available_start, index) = resource.find_time_to_insert(start_time)
+            else:
+                (available_start, index) = self.cache.find_time_to_insert(resource, start_time)
+            if tracer.level <= InsertCandidateEvaluated.level:
+                tracer.emit(InsertCandidateEvaluated(product_id, resource.name, available_start, index))
             if available_start < min_start:
                 min_start = available_start
                 target_resource = resource
@@ -69,10 +264,9 @@ class Scheduler:
             else:
                 start = prev_task.end  # start time of the next task
 
-            print(f"Planning {product_id}: task for resource {step["resource"]}, duration {step["duration"]}. "
-                  f"Desired start time = {start}")
             (resource, task) = self.find_resource(step, start, product_id)
-            print(f"Planning {product_id}: found resource {resource.name} with time slot started at {task.start}")
+            if tracer.level <= StepPlanned.level:
+                tracer.emit(StepPlanned(product_id, resource.name, start, task.start))
             task.prev_task = prev_task
             if prev_task:
                 prev_task.next_task = task
@@ -82,33 +276,148 @@ class Scheduler:
             actual_start = task.start
             delta = actual_start - start
             if delta > 0:
-                print(f"Planning {product_id}: schedule shift detected {delta}. Replanning...")
                 return tasks, delta
 
             prev_task = task
 
         return tasks, 0
 
-    def schedule_forward(self, sequence, product_id, start_time=0) -> List[Task]:
+    def plan_forward(self, sequence, product_id, start_time=0) -> List[Tuple[Resource, Task]]:
+        # where schedule_forward puts the sequence, (resource, task) per step; changes no timeline
         # Try to schedule the sequence
         base_start_time = start_time
         while True:
-            print(f"Planning {product_id}: base_start_time = {base_start_time}")
             (tasks, delta) = self.schedule_forward_impl(sequence, base_start_time, product_id)
+            if delta <= 0:
+                return tasks
+            base_start_time += delta
+            if tracer.level <= Replan.level:
+                tracer.emit(Replan(product_id, base_start_time, delta))
+            if self.perf is not None:
+                self.perf.counts["replans"] += 1
+
+    def schedule_forward(self, sequence, product_id, start_time=0) -> List[Task]:
+        if self.perf is not None:
+            started = timer()
+            replans = self.perf.counts["replans"]
+        tasks = self.plan_forward(sequence, product_id, start_time)
+        if self.recorder is not None:
+            self.recorder.forward(sequence, product_id, start_time, tasks)
+        self.commit_plan(tasks, start_time)
+
+        if self.perf is not None:
+            self.perf.counts["schedule_forward"] += 1
+            self.perf.observe("schedule_forward", timer() - started)
+            self.perf.observe("replans", self.perf.counts["replans"] - replans)
+        return [task[1] for task in tasks]
+
+    def commit_plan(self, tasks, requested_start):
+        # Adds planned (resource, task) steps to the resources and registers the order with
+        # the usage meter, shifted against requested_start
+        for (resource, task) in tasks:
+            resource.insert_task(task, None)
+        if self.usage is not None and tasks:
+            self.usage.order(requested_start, [tasks[0][1], tasks[-1][1]])
+
+    def find_resource_before(self, task_data, end_time, product_id):
+        # the latest start ending by end_time, ties to the most room after it: pick_resource mirrored
+        duration = task_data['duration']
+        max_start = -math.inf
+        target_resource = None
+        max_distance = -math.inf
+        for resource_name in task_data['resource']:
+            resource = self.resources[resource_name]
+            (available_start, distance) = resource.find_time_before(duration, end_time, task_data["priority"])
+            if tracer.level <= CandidateEvaluated.level:
+                tracer.emit(CandidateEvaluated(product_id, resource.name, available_start, distance))
+            if available_start > max_start or (available_start == max_start and distance > max_distance):
+                max_start = available_start
+                target_resource = resource
+                max_distance = distance
+        task = Task(max_start, duration, product_id, target_resource, task_data["type"], task_data["priority"])
+        return target_resource, task
+
+    def schedule_backward_impl(self, sequence, base_end_time, product_id):
+        tasks = []  # (resource, task), from the last step
+        next_task = None
+        for step in reversed(sequence):
+            end = base_end_time if next_task is None else next_task.start
+            (resource, task) = self.find_resource_before(step, end, product_id)
+            if tracer.level <= StepPlanned.level:
+                tracer.emit(StepPlanned(product_id, resource.name, end - step['duration'], task.start))
+            task.next_task = next_task
+            if next_task:
+                next_task.prev_task = task
+            tasks.append((resource, task))
+
+            # check if the step has to end earlier
+            delta = end - task.end
+            if delta > 0:
+                return tasks, delta
+
+            next_task = task
+
+        tasks.reverse()
+        return tasks, 0
+
+    def schedule_backward(self, sequence, product_id, end_time, start_time=None) -> Optional[List[Task]]:
+        # Places the sequence back-to-back as late as possible, ending at or before end_time:
+        # every step takes the latest free gap that ends where the next step starts, and a
+        # step that has to end earlier moves the whole sequence back (the replan loop of
+        # schedule_forward, mirrored). Tasks only go into free gaps, so nothing placed before
+        # is pushed. Returns None and places nothing if the sequence would start before
+        # start_time.
+        if self.perf is not None:
+            started = timer()
+            replans = self.perf.counts["replans"]
+        total_duration = sum(step['duration'] for step in sequence)
+        base_end_time = end_time
+        while True:
+            if start_time is not None and base_end_time - total_duration < start_time:
+                if self.recorder is not None:
+                    self.recorder.backward(sequence, product_id, end_time, start_time, None)
+                return None
+            (tasks, delta) = self.schedule_backward_impl(sequence, base_end_time, product_id)
             if delta > 0:
-                base_start_time += delta
+                base_end_time -= delta
+                if tracer.level <= Replan.level:
+                    tracer.emit(Replan(product_id, base_end_time - total_duration, -delta))
+                if self.perf is not None:
+                    self.perf.counts["replans"] += 1
             else:
                 break
 
-        # Add the tasks to the resources
-        for (resource, task) in tasks:
-            resource.insert_task(task, None)
+        if self.recorder is not None:
+            self.recorder.backward(sequence, product_id, end_time, start_time, tasks)
+        # on time when it starts where it was planned
+        self.commit_plan(tasks, tasks[0][1].start if tasks else end_time)
 
+        if self.perf is not None:
+            self.perf.counts["schedule_backward"] += 1
+            self.perf.observe("schedule_backward", timer() - started)
+            self.perf.observe("replans", self.perf.counts["replans"] - replans)
         return [task[1] for task in tasks]
 
+    def schedule_mixed(self, sequence, product_id, start_time=0, due_time=None) -> List[Task]:
+        # just in time: backward from due_time when that starts at or after start_time, else
+        # (or without a due time) forward from start_time as schedule_forward does.
+        # Experimental: orders placed backward block the gaps later orders need, and on
+        # bench_just_in_time far more orders end up late than with schedule_forward.
+        if due_time is not None:
+            tasks = self.schedule_backward(sequence, product_id, due_time, start_time)
+            if tasks is not None:
+                return tasks
+        return self.schedule_forward(sequence, product_id, start_time)
+
     def insert_sequence(self, sequence, start_time, product_id):
-        print(f"Inserting {product_id}: start_time = {start_time}")
+        (tasks, placed) = self._insert(sequence, start_time, product_id)
+        if self.recorder is not None:
+            self.recorder.inserted(sequence, start_time, product_id, placed)
+        return tasks[0][1].start, tasks[-1][1].end
+
+    def _insert(self, sequence, start_time, product_id):
         tasks = []  # (resource, task)
+        placed = []  # (resource, start, index) of every step as it was inserted
         prev_task = None
         for step in sequence:
             if prev_task is None:
@@ -116,18 +425,40 @@ class Scheduler:
             else:
                 start = prev_task.end  # start time of the next task
 
-            print(f"Inserting {product_id}: task for resource {step["resource"]}, duration {step["duration"]}. "
-                  f"Desired start time = {start}")
             (resource, task, index) = self.find_resource_to_insert(step, start, product_id)
-            print(f"Inserting {product_id}: found resource {resource.name} "
-                  f"with time slot started at {task.start} at index {index}")
             task.prev_task = prev_task
             if prev_task:
                 prev_task.next_task = task
             tasks.append((resource, task))
+            placed.append((resource, task.start, index))
 
             resource.insert_task(task, index)
 
             prev_task = task
+        return tasks, placed
 
-        return tasks[0][1].start, tasks[-1][1].end
+    def insert_sequences(self, items):
+        # Bulk insert_sequence, e.g. for the pickups of a batch; items are (sequence,
+        # start_time, product_id). They are inserted one by one in start_time order, equal
+        # start times in input order, so the result is that of insert_sequence calls in that
+        # order whatever the order of items. Returns (start, end) per item, in input order.
+        # It costs what those calls cost: chain shifts add up while align pushes are absorbed
+        # by gaps, so no single alignment sweep per resource gives the same timelines.
+        order = sorted(range(len(items)), key=lambda position: (items[position][1], position))
+        found = [None] * len(items)
+        placed = []  # (sequence, start_time, product_id, placed steps) in insertion order
+        for position in order:
+            (sequence, start_time, product_id) = items[position]
+            (tasks, steps) = self._insert(sequence, start_time, product_id)
+            found[position] = (tasks[0][1].start, tasks[-1][1].end)
+            placed.append((sequence, start_time, product_id, steps))
+        if self.recorder is not None:
+            self.recorder.inserted_many(placed)
+        return found
+
+    def evict(self, now):
+        # Resource.evict on every resource; returns how many tasks were dropped
+        count = sum(resource.evict(now) for resource in self.resources.values())
+        if self.recorder is not None:
+            self.recorder.evicted(now)
+        return count
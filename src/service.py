@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import resource as rusage
+from collections import Counter
+from itertools import groupby
+from timeit import default_timer as timer
+from typing import NamedTuple, Any, List, Tuple
+
+import resources as resource_sets
+from data_generator import init_seed, generate_order_distribution, bus_time as DAY_PROFILE
+from metrics import Histogram
+from simulation import build_scheduler, generate_order_sequence
+
+
+class Assignment(NamedTuple):
+    product_id: Any
+    tasks: List[Tuple[str, float, float]]  # (resource, start, end) per step
+    latency: float  # seconds from submit() to the assignment
+
+
+class SchedulingService:
+    """Online front end for a Scheduler.
+
+    Orders submitted with submit() are scheduled one by one with schedule_forward and
+    come out of the assignments queue in arrival order. The simulated clock `now`
+    follows order arrivals (or advance()); every evict_every seconds tasks that are fully
+    in the past are dropped from the resources and only counted, so memory and latency
+    stay flat however long the service runs.
+    """
+
+    def __init__(self, scheduler, oven, evict_every=3600):
+        self.scheduler = scheduler
+        self.oven = oven
+        self.evict_every = evict_every
+        self.now = 0
+        self.next_eviction = evict_every
+        self.orders = asyncio.Queue()
+        self.assignments = asyncio.Queue()
+        self.latency = Histogram()
+        self.counters = Counter()
+
+    async def submit(self, order):
+        await self.orders.put((timer(), order))
+
+    async def close(self):
+        await self.orders.put(None)
+
+    def advance(self, now):
+        self.now = max(self.now, now)
+        if self.now >= self.next_eviction:
+            self.counters["evicted_tasks"] += self.scheduler.evict(self.now)
+            self.next_eviction = self.now + self.evict_every
+
+    def assign(self, order):
+        self.advance(order["start_time"])
+        start_time = max(order["start_time"], self.now)
+        tasks = self.scheduler.schedule_forward(
+            sequence=generate_order_sequence(self.oven, order["cook_time"]),
+            product_id=order["order"], start_time=start_time)
+
+        shift = tasks[0].start - order["start_time"]
+        self.counters["orders"] += 1
+        if shift:
+            self.counters["shifted"] += 1
+            self.counters["shift_time"] += shift
+        return [(task.resource.name, task.start, task.end) for task in tasks]
+
+    async def run(self):
+        # serves until close(); a None on the assignments queue marks the end
+        while True:
+            item = await self.orders.get()
+            if item is None:
+                await self.assignments.put(None)
+                return
+            (received, order) = item
+            tasks = self.assign(order)
+            latency = timer() - received
+            self.latency.add(latency)
+            await self.assignments.put(Assignment(order["order"], tasks, latency))
+
+    async def follow(self, clock, interval=1.0):
+        # advances now from clock() between orders, for intake driven by wall time
+        while True:
+            self.advance(clock())
+            await asyncio.sleep(interval)
+
+    def report(self):
+        report = {
+            "orders": self.counters["orders"],
+            "shifted": self.counters["shifted"],
+            "avg_shift": self.counters["shift_time"] / self.counters["orders"] if self.counters["orders"] else 0,
+            "evicted_tasks": self.counters["evicted_tasks"],
+            "live_tasks": sum(len(r.tasks) for r in self.scheduler.resources.values()),
+            "latency_p50": self.latency.percentile(50),
+            "latency_p95": self.latency.percentile(95),
+            "latency_p99": self.latency.percentile(99),
+            "latency_max": self.latency.max,
+        }
+        if self.scheduler.usage is not None:
+            # percentiles of the shifted orders, shifts followed through later cascades
+            shifts = self.scheduler.usage.shift_summary()
+            report.update({f"shift_{key}": shifts[key] for key in ("p50", "p95", "p99", "max")})
+        return report
+
+
+def day_orders(days, seed=123, bus_time=DAY_PROFILE, **kwargs):
+    # the bus_time profile repeated for every day, start times continuing across days
+    init_seed(seed)
+    for day in range(days):
+        for order in generate_order_distribution(bus_time=bus_time, verbose=False, **kwargs):
+            order["order"] = f"{day}.{order['order']}"
+            order["start_time"] += day * 86400
+            order["end_time"] += day * 86400
+            yield order
+
+
+async def replay(service, orders, on_assignment=None):
+    serving = asyncio.create_task(service.run())
+    for order in orders:
+        await service.submit(order)
+        # hand over to the service so latency is measured per order, not per backlog
+        await asyncio.sleep(0)
+        while not service.assignments.empty():
+            assignment = service.assignments.get_nowait()
+            if on_assignment is not None:
+                on_assignment(assignment)
+    await service.close()
+    await serving
+    while (assignment := service.assignments.get_nowait()) is not None:
+        if on_assignment is not None:
+            on_assignment(assignment)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a multi-day order stream through the online service.")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--oven", default="OVEN2")
+    parser.add_argument("--seed", type=int, default=123)
+    args = parser.parse_args()
+
+    oven = getattr(resource_sets, args.oven)
+    service = SchedulingService(build_scheduler(oven), oven)
+    service.scheduler.enable_usage()
+
+    async def main():
+        orders = day_orders(args.days, args.seed, cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60,
+                            cook_max_time=8 * 60, cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+        print(f"{'day':>4} {'orders':>7} {'live tasks':>10} {'p50, us':>8} {'p95, us':>8} {'p99, us':>8} "
+              f"{'max rss, MB':>11}")
+        for (day, batch) in groupby(orders, key=lambda order: order["order"].split(".", 1)[0]):
+            latency = Histogram()
+            await replay(service, batch, lambda assignment: latency.add(assignment.latency))
+            live = sum(len(r.tasks) for r in service.scheduler.resources.values())
+            rss = rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{day:>4} {latency.count:>7} {live:>10} {latency.percentile(50) * 1e6:>8.0f} "
+                  f"{latency.percentile(95) * 1e6:>8.0f} {latency.percentile(99) * 1e6:>8.0f} {rss:>11.1f}")
+        print(service.report())
+
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+import numpy as np
+
+from resources import OPERATION_TYPE, MANIPULATOR_COLD, MANIPULATOR_WARM, WARM_STORAGE_LIMIT, Resource, OvenResource, \
+    CapacityResource
+from scheduler import Scheduler
+from data_generator import init_seed, generate_orders, generate_order_distribution
+
+
+def median(data):
+    # Sort a copy of the list
+    data = sorted(data)
+    # Calculate the median
+    n = len(data)
+    if n % 2 == 1:
+        # If odd, the median is the middle element
+        return data[n // 2]
+    else:
+        # If even, the median is the average of the two middle elements
+        return (data[n // 2 - 1] + data[n // 2]) / 2
+
+
+def generate_order_sequence(oven, oven_time, warm_room=None, warm_time=WARM_STORAGE_LIMIT):
+    sequence = [
+        {
+            "resource": MANIPULATOR_COLD,
+            "type": OPERATION_TYPE["UNLOAD"],
+            "duration": 30,
+            "priority": 5
+        },
+        {
+            "resource": MANIPULATOR_WARM,
+            "type": OPERATION_TYPE["LOAD"],
+            "duration": 30,
+            "priority": 7
+        },
+        {
+            "resource": oven,
+            "type": OPERATION_TYPE["OVEN"],
+            "duration": oven_time,
+            "priority": 5
+        },
+        {
+            "resource": MANIPULATOR_WARM,
+            "type": OPERATION_TYPE["UNLOAD"],
+            "duration": 30,
+            "priority": 5
+        },
+    ]
+    if warm_room is not None:
+        sequence.append({
+            "resource": warm_room,
+            "type": OPERATION_TYPE["STORE"],
+            "duration": warm_time,
+            "priority": 5
+        })
+    return sequence
+
+
+def generate_pickup_sequence():
+    return [
+        {
+            "resource": MANIPULATOR_WARM,
+            "type": OPERATION_TYPE["PICKUP"],
+            "duration": 30,
+            "priority": 5
+        },
+    ]
+
+
+def build_scheduler(oven, oven_extra_duration=30, warm_room=(), warm_room_capacity=None):
+    # warm_room names become one slot each, or CapacityResources of warm_room_capacity places
+    resources = {}
+    for r in MANIPULATOR_COLD + MANIPULATOR_WARM + oven:
+        resources[r] = Resource(r) if r not in oven else OvenResource(r, oven_extra_duration)
+    for r in warm_room:
+        resources[r] = Resource(r) if warm_room_capacity is None else CapacityResource(r, warm_room_capacity)
+    return Scheduler(resources)
+
+
+def make_orders(seed, count=None, bus_time=None, cook_time_base=7 * 60, cook_time_scale=0, cook_min_time=6 * 60,
+                cook_max_time=8 * 60, cook_extra_time=30 * 3, pickup_max_time=10 * 60):
+    # count orders released at once, or orders spread over the hours of a bus_time profile
+    init_seed(seed)
+    if bus_time is not None:
+        return generate_order_distribution(bus_time=bus_time, cook_time_base=cook_time_base,
+                                           cook_time_scale=cook_time_scale, cook_min_time=cook_min_time,
+                                           cook_max_time=cook_max_time, cook_extra_time=cook_extra_time,
+                                           pickup_max_time=pickup_max_time, verbose=False)
+    return generate_orders(count=count, cook_time_base=cook_time_base, cook_time_scale=cook_time_scale,
+                           cook_min_time=cook_min_time, cook_max_time=cook_max_time, pickup_max_time=pickup_max_time)
+
+
+def due_time(order):
+    # when the order is picked up: its expected end plus the pickup timeout
+    return order["end_time"] + order["pickup_timeout"]
+
+
+def simulate(scheduler, orders, oven, pickups=False, warm_room=None, warm_time=WARM_STORAGE_LIMIT, mode="forward",
+             **kwargs):
+    # schedules every order, then the pickups, the way main.py does; returns order -> tasks.
+    # mode "mixed" places orders just in time for due_time with Scheduler.schedule_mixed and
+    # their pickups at the due time instead of pickup_timeout after the actual end.
+    if mode not in ("forward", "mixed"):
+        raise ValueError(f"Unknown mode: {mode}")
+    tasks = {}
+    for order in orders:
+        sequence = generate_order_sequence(oven, order["cook_time"], warm_room, warm_time)
+        if mode == "mixed":
+            tasks[order["order"]] = scheduler.schedule_mixed(
+                sequence=sequence,
+                product_id=order["order"],
+                start_time=order["start_time"],
+                due_time=due_time(order), **kwargs)
+        else:
+            tasks[order["order"]] = scheduler.schedule_forward(
+                sequence=sequence,
+                product_id=order["order"],
+                start_time=order["start_time"], **kwargs)
+
+    if pickups:
+        place_pickups(scheduler, orders, tasks, mode)
+    return tasks
+
+
+def place_pickups(scheduler, orders, tasks, mode="forward"):
+    # the pickups of simulate, for orders already placed as tasks
+    for order in orders:
+        if order["pickup_timeout"]:
+            actual_end = tasks[order["order"]][-1].end
+            start_time = actual_end + order["pickup_timeout"]
+            if mode == "mixed":
+                start_time = max(actual_end, due_time(order))
+            scheduler.insert_sequence(
+                sequence=generate_pickup_sequence(),
+                product_id=order["order"],
+                start_time=start_time)
+
+
+def schedule_batches(scheduler, batches, oven, warm_room=None, warm_time=WARM_STORAGE_LIMIT, **kwargs):
+    # Schedules ORDER_DTYPE batches (see data_generator.order_batches) without per-order dicts;
+    # product ids are f"{day}.{hour}.{number}". Yields each batch with the start of its first
+    # step and the end of its last step per order, as scheduled.
+    sequences = {}
+    for batch in batches:
+        starts = np.empty(len(batch), np.float64)
+        ends = np.empty(len(batch), np.float64)
+        columns = zip(batch["day"].tolist(), batch["hour"].tolist(), batch["number"].tolist(),
+                      batch["cook_time"].tolist(), batch["start_time"].tolist())
+        for (index, (day, hour, number, cook_time, start_time)) in enumerate(columns):
+            sequence = sequences.get(cook_time)
+            if sequence is None:
+                sequence = sequences[cook_time] = generate_order_sequence(oven, cook_time, warm_room, warm_time)
+            tasks = scheduler.schedule_forward(sequence=sequence, product_id=f"{day}.{hour}.{number}",
+                                               start_time=start_time, **kwargs)
+            starts[index] = tasks[0].start
+            ends[index] = tasks[-1].end
+        yield batch, starts, ends
+
+
+def shift_statistics(orders, tasks):
+    diffs = []
+    for order in orders:
+        diff_start = tasks[order["order"]][0].start - order["start_time"]
+        if diff_start != 0:
+            diffs.append(diff_start)
+    return {
+        "shifted": len(diffs),
+        "avg_shift": sum(diffs) / len(diffs) if diffs else 0,
+        "median_shift": median(diffs) if diffs else 0,
+        "max_shift": max(diffs, default=0),
+    }
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+_SLOT = 0
+_INSERT = 1
+
+
+class SlotCache:
+    """Bounded LRU cache of find_slot and find_time_to_insert results.
+
+    Keys are (resource, resource.version, query). Every change of a timeline bumps the
+    version of its resource, so an entry is only hit while the timeline is exactly as it
+    was when the entry was made. A rollback gives the resources back their earlier versions,
+    so what-if placements on a fork hit the entries made before it; versions that never
+    come back age out. A query repeated between changes costs one dict lookup.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        found = self.entries.get(key)
+        if found is None:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return found
+
+    def _store(self, key, found):
+        entries = self.entries
+        entries[key] = found
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+        return found
+
+    def find_slot(self, resource, duration, start_time, priority):
+        key = (resource, resource.version, _SLOT, duration, start_time, priority)
+        found = self._lookup(key)
+        if found is None:
+            found = self._store(key, resource.find_slot(duration, start_time, priority))
+        return found
+
+    def find_time_to_insert(self, resource, start_time):
+        key = (resource, resource.version, _INSERT, start_time)
+        found = self._lookup(key)
+        if found is None:
+            found = self._store(key, resource.find_time_to_insert(start_time))
+        return found
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self, reset=False):
+        queries = self.hits + self.misses
+        stats = {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / queries if queries else 0.0,
+                 "entries": len(self.entries), "size": self.size}
+        if reset:
+            (self.hits, self.misses) = (0, 0)
+        return stats
@@ -0,0 +1,162 @@
+import argparse
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from timeit import default_timer as timer
+
+import numpy as np
+
+import resources as resource_sets
+from data_generator import bus_time as DAY_PROFILE
+from simulation import build_scheduler, make_orders, simulate, shift_statistics
+
+BUS_PROFILES = {
+    "day": DAY_PROFILE,
+    "rush": [0] * 11 + [30, 40, 20] + [0] * 10,
+    "flat": [10] * 24,
+}
+
+# (cook_time_base, cook_time_scale, cook_min_time, cook_max_time)
+COOK_TIMES = {
+    "fixed": (7 * 60, 0, 6 * 60, 8 * 60),
+    "normal": (7 * 60, 30, 6 * 60, 8 * 60),
+    "wide": (7 * 60, 60, 5 * 60, 10 * 60),
+}
+
+COLUMNS = ["scenario", "oven", "volume", "cook", "pickups", "seed", "orders", "total_time", "products_in_day",
+           "products_in_hour", "shifted", "avg_shift", "median_shift", "max_shift", "cold_utilization",
+           "warm_utilization", "oven_utilization", "invalid_timelines", "anomalies", "elapsed"]
+
+
+def scenario_grid(ovens=("OVEN1", "OVEN2", "OVEN3", "OVEN4"), volumes=(100,), cooks=("fixed",), seeds=range(4),
+                  pickups=False):
+    # volumes are order counts released at once or names of BUS_PROFILES. The seed belongs to the
+    # scenario, not to the worker running it, so every scenario draws the same orders on any pool
+    # size and a resumed sweep reproduces the interrupted one.
+    scenarios = []
+    for (oven, volume, cook, seed) in product(ovens, volumes, cooks, seeds):
+        scenarios.append({
+            "scenario": f"{oven}/{volume}/{cook}/{'pickups' if pickups else 'orders'}/{seed}",
+            "oven": oven,
+            "volume": str(volume),
+            "cook": cook,
+            "pickups": pickups,
+            "seed": seed,
+        })
+    return scenarios
+
+
+def run_scenario(scenario):
+    started = timer()
+    oven = getattr(resource_sets, scenario["oven"])
+    (cook_time_base, cook_time_scale, cook_min_time, cook_max_time) = COOK_TIMES[scenario["cook"]]
+    volume = scenario["volume"]
+    orders = make_orders(scenario["seed"],
+                         count=int(volume) if volume.isdigit() else None,
+                         bus_time=BUS_PROFILES.get(volume),
+                         cook_time_base=cook_time_base, cook_time_scale=cook_time_scale,
+                         cook_min_time=cook_min_time, cook_max_time=cook_max_time)
+
+    scheduler = build_scheduler(oven)
+    tasks = simulate(scheduler, orders, oven, pickups=scenario["pickups"])
+
+    (total_time, products_in_day, utilization) = scheduler.resource_utilization(len(orders), 30)
+    share = {name: value for (name, (_, value)) in utilization.items()}
+    row = dict(scenario)
+    row.update(shift_statistics(orders, tasks))
+    row.update({
+        "orders": len(orders),
+        "total_time": total_time,
+        "products_in_day": products_in_day,
+        "products_in_hour": products_in_day / 24,
+        "cold_utilization": sum(share.get(name, 0) for name in resource_sets.MANIPULATOR_COLD),
+        "warm_utilization": sum(share.get(name, 0) for name in resource_sets.MANIPULATOR_WARM),
+        "oven_utilization": sum(share.get(name, 0) for name in oven) / len(oven),
+        "invalid_timelines": sum(r.validate_timeline()[0] is not None for r in scheduler.resources.values()),
+        "anomalies": len(scheduler.resources["WARM_HAND"].detect_unload_anomaly()),
+        "elapsed": timer() - started,
+    })
+    return row
+
+
+class ResultStore:
+    """Columnar sweep results in a directory of numbered .npz parts.
+
+    Every flush writes a complete part under a temporary name and renames it, so an
+    interrupted sweep loses at most the rows of one unflushed batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.npz")))
+
+    def append(self, rows):
+        if not rows:
+            return
+        name = os.path.join(self.path, f"part-{len(self.parts()):06d}.npz")
+        with open(name + ".tmp", "wb") as file:
+            np.savez(file, **{column: np.array([row[column] for row in rows]) for column in COLUMNS})
+        os.replace(name + ".tmp", name)
+
+    def load(self):
+        # column -> numpy array over every stored row
+        parts = []
+        for name in self.parts():
+            with np.load(name) as part:
+                parts.append({column: part[column] for column in COLUMNS})
+        if not parts:
+            return {column: np.array([]) for column in COLUMNS}
+        return {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS}
+
+    def done(self):
+        return set(self.load()["scenario"].tolist())
+
+    def export(self, path):
+        np.savez(path, **self.load())
+
+
+def run_sweep(scenarios, store, workers=None, flush_every=50):
+    # runs the scenarios the store does not have yet; returns how many were run
+    done = store.done()
+    pending = [scenario for scenario in scenarios if scenario["scenario"] not in done]
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_scenario, scenario) for scenario in pending]
+            for future in as_completed(futures):
+                rows.append(future.result())
+                if len(rows) >= flush_every:
+                    store.append(rows)
+                    rows = []
+    finally:
+        store.append(rows)
+    return len(pending)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a scenario sweep; rerun with the same --out to resume.")
+    parser.add_argument("--out", default="sweep")
+    parser.add_argument("--ovens", nargs="+", default=["OVEN1", "OVEN2", "OVEN3", "OVEN4"])
+    parser.add_argument("--volumes", nargs="+", default=["100", "day"])
+    parser.add_argument("--cooks", nargs="+", default=["fixed", "normal"], choices=list(COOK_TIMES))
+    parser.add_argument("--seeds", type=int, default=4)
+    parser.add_argument("--pickups", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--export", default=None, help="also write every row into one .npz file")
+    args = parser.parse_args()
+
+    for volume in args.volumes:
+        if not volume.isdigit() and volume not in BUS_PROFILES:
+            parser.error(f"unknown volume {volume}: use an order count or one of {', '.join(BUS_PROFILES)}")
+
+    store = ResultStore(args.out)
+    scenarios = scenario_grid(args.ovens, args.volumes, args.cooks, range(args.seeds), args.pickups)
+    started = timer()
+    count = run_sweep(scenarios, store, args.workers)
+    print(f"Ran {count} of {len(scenarios)} scenarios in {timer() - started:.1f}s, results in {args.out}")
+    if args.export:
+        store.export(args.export)
@@ -0,0 +1,370 @@
+import json
+import mmap
+import sys
+from array import array
+
+from resources import OPERATION_TYPE, Resource, OvenResource, CapacityResource, Task
+
+TYPE_CODES = list(OPERATION_TYPE.values())
+_TYPE_CODE = {task_type: code for (code, task_type) in enumerate(TYPE_CODES)}
+NO_TASK = -1
+
+
+def _times(values):
+    # integer timelines stay integer, so values round-trip exactly
+    values = list(values)
+    if all(isinstance(v, int) for v in values):
+        return array("q", values)
+    return array("d", values)
+
+
+class ProductTable:
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.codes = {product_id: code for code, product_id in enumerate(self.ids)}
+
+    def code(self, product_id):
+        code = self.codes.get(product_id)
+        if code is None:
+            code = len(self.ids)
+            self.codes[product_id] = code
+            self.ids.append(product_id)
+        return code
+
+
+class TaskView:
+    __slots__ = ("timeline", "index")
+
+    def __init__(self, timeline, index):
+        self.timeline = timeline
+        self.index = index
+
+    @property
+    def start(self):
+        return self.timeline.starts[self.index]
+
+    @property
+    def end(self):
+        return self.timeline.ends[self.index]
+
+    @property
+    def duration(self):
+        return self.timeline.ends[self.index] - self.timeline.starts[self.index]
+
+    @property
+    def product_id(self):
+        return self.timeline.products.ids[self.timeline.product_codes[self.index]]
+
+    @property
+    def type(self):
+        return TYPE_CODES[self.timeline.types[self.index]]
+
+    @property
+    def priority(self):
+        return self.timeline.priorities[self.index]
+
+    def __repr__(self):
+        return (f'TaskView(start={self.start}, end={self.end}, duration={self.duration}, '
+                f'product_id={self.product_id}, resource_name={self.timeline.name}, type={self.type})')
+
+
+class CompactTimeline:
+    """Columnar copy of one resource timeline.
+
+    Starts, ends, priorities, type codes and product codes live in typed arrays;
+    next_resource/next_index point at the next task of the same product chain
+    (NO_TASK when there is none). It is a read-only copy: the live timelines stay Task
+    objects in the blocks of a free-gap index, since cascades move them in place.
+    """
+
+    def __init__(self, name, products, starts, ends, priorities, types, product_codes,
+                 next_resource=None, next_index=None, extra_duration=None):
+        self.name = name
+        self.products = products
+        self.starts = starts
+        self.ends = ends
+        self.priorities = priorities
+        self.types = types
+        self.product_codes = product_codes
+        self.next_resource = next_resource if next_resource is not None else array("i", [NO_TASK] * len(starts))
+        self.next_index = next_index if next_index is not None else array("q", [NO_TASK] * len(starts))
+        self.extra_duration = extra_duration
+
+    @classmethod
+    def from_tasks(cls, name, tasks, products, extra_duration=None):
+        return cls(name, products,
+                   _times(task.start for task in tasks),
+                   _times(task.end for task in tasks),
+                   array("i", [task.priority for task in tasks]),
+                   array("B", [_TYPE_CODE[task.type] for task in tasks]),
+                   array("i", [products.code(task.product_id) for task in tasks]),
+                   extra_duration=extra_duration)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.starts)
+        if not 0 <= index < len(self.starts):
+            raise IndexError(index)
+        return TaskView(self, index)
+
+    def __iter__(self):
+        return (TaskView(self, index) for index in range(len(self.starts)))
+
+    @property
+    def tasks(self):
+        # stands in for a resource in plot_schedule and export_schedule
+        return self
+
+    def busy_time(self):
+        return sum(self.ends) - sum(self.starts)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.starts, self.ends, self.priorities, self.types,
+                                                 self.product_codes, self.next_resource, self.next_index))
+
+
+def compact_schedule(resources):
+    # name -> CompactTimeline for every resource, sharing one product table and
+    # keeping prev/next product chains as (resource, index) references
+    products = ProductTable()
+    names = list(resources)
+    timelines = {}
+    location = {}
+    for (code, name) in enumerate(names):
+        resource = resources[name]
+        timelines[name] = CompactTimeline.from_tasks(name, resource.tasks, products,
+                                                     getattr(resource, "extra_duration", None))
+        for (index, task) in enumerate(resource.tasks):
+            location[id(task)] = (code, index)
+
+    for name in names:
+        timeline = timelines[name]
+        for (index, task) in enumerate(resources[name].tasks):
+            if task.next_task is not None and id(task.next_task) in location:
+                (timeline.next_resource[index], timeline.next_index[index]) = location[id(task.next_task)]
+    return timelines
+
+
+# Schedule files: a fixed prefix (MAGIC, header length), a JSON header with the resources and
+# the offset, typecode and length of every column, then the raw columns, each aligned to 8
+# bytes. Product ids are JSON values packed into one blob with an offsets column.
+
+MAGIC = b"SCHEDCOL"
+VERSION = 1
+_ALIGN = 8
+_COLUMNS = ("starts", "ends", "priorities", "types", "product_codes", "next_resource", "next_index")
+_KINDS = {kind.__name__: kind for kind in (Resource, OvenResource, CapacityResource)}
+
+
+def describe_resource(resource):
+    # kind and settings of a resource, enough for build_resource to make an empty copy
+    kind = type(resource).__name__
+    if _KINDS.get(kind) is not type(resource):
+        raise ValueError(f"cannot save resource {resource.name!r} of type {kind}")
+    return {"name": resource.name, "kind": kind, "extra_duration": getattr(resource, "extra_duration", None),
+            "capacity": getattr(resource, "capacity", None)}
+
+
+def build_resource(entry):
+    kind = _KINDS[entry["kind"]]
+    if kind is OvenResource:
+        return OvenResource(entry["name"], entry["extra_duration"])
+    if kind is CapacityResource:
+        return CapacityResource(entry["name"], entry["capacity"])
+    return Resource(entry["name"])
+
+
+def _encode_id(product_id):
+    return json.dumps(product_id, separators=(",", ":")).encode()
+
+
+def _decode_id(value):
+    # JSON has no tuples; ids are hashable, so lists come back as tuples
+    if isinstance(value, list):
+        return tuple(_decode_id(item) for item in value)
+    return value
+
+
+def save_schedule(scheduler, path):
+    # Writes the resources, tasks, product chains and resource settings of a Scheduler
+    timelines = compact_schedule(scheduler.resources)
+    products = next(iter(timelines.values())).products if timelines else ProductTable()
+    blob = bytearray()
+    offsets = array("q", [0])
+    for product_id in products.ids:
+        blob += _encode_id(product_id)
+        offsets.append(len(blob))
+
+    chunks = []
+    size = 0
+
+    def column(values):
+        nonlocal size
+        data = values.tobytes()
+        chunks.append(data + bytes(-len(data) % _ALIGN))
+        entry = [size, values.typecode, len(values)]
+        size += len(chunks[-1])
+        return entry
+
+    header = {"version": VERSION, "byteorder": sys.byteorder, "group_min_size": scheduler.group_min_size,
+              "products": {"offsets": column(offsets), "blob": column(array("B", blob))}, "resources": []}
+    for (name, resource) in scheduler.resources.items():
+        timeline = timelines[name]
+        header["resources"].append({
+            **describe_resource(resource),
+            "evicted": resource.evicted, "evicted_busy": resource.evicted_busy,
+            "past_pairs": [[prev, next_priority, end] for ((prev, next_priority), end) in resource.past_pairs.items()],
+            "columns": {key: column(getattr(timeline, key)) for key in _COLUMNS}})
+
+    encoded = json.dumps(header).encode()
+    encoded += b" " * (-(len(MAGIC) + 8 + len(encoded)) % _ALIGN)
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(len(encoded).to_bytes(8, "little"))
+        file.write(encoded)
+        for chunk in chunks:
+            file.write(chunk)
+
+
+class _MappedProducts:
+    # product ids of a ScheduleFile, decoded on access
+    def __init__(self, offsets, blob):
+        self.ids = _MappedIds(offsets, blob)
+
+
+class _MappedIds:
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        return _decode_id(json.loads(self.blob[self.offsets[code]:self.offsets[code + 1]].tobytes()))
+
+
+class ScheduleFile:
+    """A schedule written by save_schedule, memory-mapped.
+
+    timelines maps resource names to CompactTimelines whose columns are views on the mapping,
+    so opening reads the header only and columns are paged in when touched. scheduler()
+    builds a live Scheduler without re-running placement, which takes a Task per task it
+    keeps; with now, the tasks evict(now) would drop stay in the file and are only counted.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise
+        self._views = [memoryview(self._map)]
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a schedule file")
+        length = int.from_bytes(self._map[len(MAGIC):len(MAGIC) + 8], "little")
+        self._data = len(MAGIC) + 8 + length
+        self.header = json.loads(self._map[len(MAGIC) + 8:self._data])
+        if self.header["version"] != VERSION or self.header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path}: unsupported version or byte order")
+
+        products = self.header["products"]
+        self.products = _MappedProducts(self._column(products["offsets"]), self._column(products["blob"]))
+        self.timelines = {}
+        for entry in self.header["resources"]:
+            columns = {key: self._column(entry["columns"][key]) for key in _COLUMNS}
+            self.timelines[entry["name"]] = CompactTimeline(entry["name"], self.products,
+                                                            extra_duration=entry["extra_duration"], **columns)
+
+    def _column(self, entry):
+        (offset, typecode, count) = entry
+        start = self._data + offset
+        view = self._views[0][start:start + count * array(typecode).itemsize]
+        self._views.append(view)
+        self._views.append(view.cast(typecode))
+        return self._views[-1]
+
+    def close(self):
+        # timelines and task views from this file can not be used afterwards
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _kept(resource, timeline, now):
+        # indices of the tasks evict(now) keeps; the dropped ones go to the eviction counters
+        (starts, ends, priorities) = (timeline.starts, timeline.ends, timeline.priorities)
+        if now is None:
+            return range(len(ends))
+        if isinstance(resource, CapacityResource):
+            kept = [index for index in range(len(ends)) if ends[index] >= now]
+            dropped = len(ends) - len(kept)
+            resource.evicted_busy += sum(ends[i] - starts[i] for i in range(len(ends)) if ends[i] < now)
+        else:
+            limit = now - resource.evict_margin()
+            dropped = 0
+            while dropped + 1 < len(ends) and ends[dropped + 1] < limit:
+                dropped += 1
+            for index in range(dropped):
+                resource.past_pairs.setdefault((priorities[index], priorities[index + 1]), ends[index])
+                resource.evicted_busy += ends[index] - starts[index]
+            kept = range(dropped, len(ends))
+        resource.evicted += dropped
+        return kept
+
+    def scheduler(self, now=None):
+        from scheduler import Scheduler
+
+        resources = {}
+        built = []  # per resource: file index -> Task
+        product_ids = {}
+        for entry in self.header["resources"]:
+            name = entry["name"]
+            resource = build_resource(entry)
+            resource.evicted = entry["evicted"]
+            resource.evicted_busy = entry["evicted_busy"]
+            resource.past_pairs = {(prev, next_priority): end for (prev, next_priority, end) in entry["past_pairs"]}
+            resources[name] = resource
+
+            timeline = self.timelines[name]
+            (starts, ends) = (timeline.starts, timeline.ends)
+            tasks = {}
+            for index in self._kept(resource, timeline, now):
+                code = timeline.product_codes[index]
+                if code not in product_ids:
+                    product_ids[code] = self.products.ids[code]
+                task = Task(starts[index], ends[index] - starts[index], product_ids[code], resource,
+                            TYPE_CODES[timeline.types[index]], timeline.priorities[index])
+                task.end = ends[index]
+                tasks[index] = task
+            resource._append(list(tasks.values()))
+            built.append(tasks)
+
+        for (timeline, tasks) in zip(self.timelines.values(), built):
+            for (index, task) in tasks.items():
+                code = timeline.next_resource[index]
+                if code != NO_TASK:
+                    next_task = built[code].get(timeline.next_index[index])
+                    if next_task is not None:
+                        (task.next_task, next_task.prev_task) = (next_task, task)
+        return Scheduler(resources, group_min_size=self.header["group_min_size"])
+
+
+def load_schedule(path, now=None):
+    # Scheduler saved at path; see ScheduleFile.scheduler for now
+    with ScheduleFile(path) as schedule:
+        return schedule.scheduler(now)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from resources import OVEN2  # noqa: E402
+from simulation import build_scheduler, make_orders, simulate  # noqa: E402
+
+
+def timelines(scheduler):
+    return {name: [(task.start, task.end, task.product_id, task.type) for task in resource.tasks]
+            for (name, resource) in scheduler.resources.items()}
+
+
+@pytest.fixture
+def placed():
+    # placed(count, seed) -> scheduler, orders and order -> tasks: count orders released at
+    # once on OVEN2, with cook times spread around 7 minutes; usage: enable the usage meter
+    def place(count=200, seed=123, usage=False, **settings):
+        scheduler = build_scheduler(OVEN2, **settings)
+        if usage:
+            scheduler.enable_usage()
+        orders = make_orders(seed, count=count, cook_time_scale=30)
+        return scheduler, orders, simulate(scheduler, orders, OVEN2)
+
+    return place
@@ -0,0 +1,77 @@
+import random
+
+from conftest import timelines
+from resources import OVEN2, Resource, OvenResource, Task
+from simulation import build_scheduler, generate_order_sequence
+
+
+def build_timeline(resource, count=300, seed=0):
+    rnd = random.Random(seed)
+    start = 0
+    for number in range(count):
+        duration = rnd.choice([30, 60, 420])
+        resource.add_task(Task(start, duration, f"product.{number}", resource, "OTHER", 5))
+        start += duration + rnd.choice([0, 0, 30, 90, 600])
+    return resource
+
+
+def scan_latest(resource, duration, end_time, pad=0):
+    # latest start ending by end_time that keeps pad clear of every task, scanning the gaps
+    tasks = resource.tasks
+    if tasks[-1].end + pad <= end_time - duration:
+        return end_time - duration
+    for (first, second) in reversed(list(zip(tasks, tasks[1:]))):
+        start = min(end_time, second.start - pad) - duration
+        if first.end + pad <= start:
+            return start
+    return min(end_time, tasks[0].start - pad) - duration
+
+
+def test_latest_fit_matches_a_scan():
+    rnd = random.Random(1)
+    for (resource, pad) in ((build_timeline(Resource("HAND")), 0), (build_timeline(OvenResource("OVEN", 30)), 60)):
+        end = resource.tasks[-1].end
+        for _ in range(300):
+            (duration, end_time) = (rnd.choice([30, 60, 420]), rnd.randrange(end + 1000))
+            (start, _) = resource.find_slot_before(duration, end_time, 5)
+            assert start == scan_latest(resource, duration, end_time, pad)
+
+
+def test_backward_ends_at_the_due_time_and_pushes_nothing(placed):
+    (scheduler, _, tasks) = placed(50)
+    before = timelines(scheduler)
+    due = max(order_tasks[-1].end for order_tasks in tasks.values()) + 3600
+    placed_tasks = scheduler.schedule_backward(generate_order_sequence(OVEN2, 420), "late", due)
+
+    assert placed_tasks[-1].end == due
+    assert all(first.end == second.start for (first, second) in zip(placed_tasks, placed_tasks[1:]))
+    after = timelines(scheduler)
+    for (name, timeline) in before.items():
+        assert [task for task in after[name] if task[2] != "late"] == timeline
+
+
+def test_backward_fits_between_orders_or_gives_up(placed):
+    (scheduler, _, tasks) = placed(50)
+    due = min(order_tasks[-1].end for order_tasks in tasks.values())
+    sequence = generate_order_sequence(OVEN2, 420)
+    before = timelines(scheduler)
+    assert scheduler.schedule_backward(sequence, "late", due, start_time=due - 10) is None
+    assert timelines(scheduler) == before
+
+    placed_tasks = scheduler.schedule_backward(sequence, "early", due)
+    assert placed_tasks[-1].end <= due
+    for resource in scheduler.resources.values():
+        assert all(first.end <= second.start for (first, second) in zip(resource.tasks, resource.tasks[1:]))
+
+
+def test_mixed_goes_forward_without_room_before_the_due_time():
+    (mixed, forward) = (build_scheduler(OVEN2), build_scheduler(OVEN2))
+    sequence = generate_order_sequence(OVEN2, 420)
+    for number in range(30):
+        mixed.schedule_mixed(sequence, f"order.{number}", start_time=0, due_time=None if number % 3 else 10)
+        forward.schedule_forward(sequence, f"order.{number}", 0)
+    assert timelines(mixed) == timelines(forward)
+
+    due = max(resource.tasks[-1].end for resource in mixed.resources.values()) + 7200
+    just_in_time = mixed.schedule_mixed(sequence, "due", start_time=0, due_time=due)
+    assert just_in_time[-1].end == due
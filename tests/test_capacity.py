@@ -0,0 +1,74 @@
+import random
+
+from conftest import timelines
+from occupancy import OccupancySteps
+from resources import OVEN2, WARM_ROOM, WARM_ROOM_15, CapacityResource, Task
+from simulation import build_scheduler, make_orders, simulate
+
+
+def levels(intervals, time):
+    return sum(start <= time < end for (start, end) in intervals)
+
+
+def test_earliest_and_latest_match_a_scan():
+    rnd = random.Random(3)
+    intervals = []
+    steps = OccupancySteps()
+    for _ in range(60):
+        start = rnd.randrange(2000)
+        intervals.append((start, start + rnd.choice([30, 60, 300])))
+        steps.add(*intervals[-1], 1)
+    # occupancy only changes at interval bounds, so a fit can be checked there
+    bounds = sorted({time for interval in intervals for time in interval})
+
+    def fits(time, duration, limit):
+        return all(levels(intervals, t) < limit for t in [time] + bounds if time <= t < time + duration)
+
+    for _ in range(200):
+        (time, duration, limit) = (rnd.randrange(2500), rnd.choice([30, 120, 600]), rnd.choice([1, 2, 3]))
+        (start, _) = steps.earliest(time, duration, limit)
+        assert fits(start, duration, limit)
+        assert not any(fits(t, duration, limit) for t in [time] + bounds if time <= t < start)
+
+        latest = steps.latest(time + duration, duration, limit)
+        assert fits(latest, duration, limit)
+        assert not any(fits(t - duration, duration, limit) for t in bounds if latest + duration < t <= time + duration)
+
+
+def test_warm_room_never_holds_more_than_its_capacity():
+    scheduler = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=4)
+    checker = scheduler.check_invariants("raise")
+    simulate(scheduler, make_orders(7, count=150, cook_time_scale=30), OVEN2, warm_room=WARM_ROOM)
+    room = scheduler.resources[WARM_ROOM[0]]
+
+    assert checker.violations == []
+    assert room.validate_timeline() == (None, None)
+    assert max(room.occupancy.levels) == 4
+    assert max(levels([(task.start, task.end) for task in room.tasks], task.start) for task in room.tasks) == 4
+
+
+def test_a_room_that_never_fills_places_like_its_slots():
+    orders = make_orders(7, count=60, cook_time_scale=30)
+    slots = build_scheduler(OVEN2, warm_room=WARM_ROOM_15)
+    room = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=len(WARM_ROOM_15))
+    simulate(slots, orders, OVEN2, warm_room=WARM_ROOM_15)
+    simulate(room, orders, OVEN2, warm_room=WARM_ROOM)
+
+    (slot_timelines, room_timelines) = (timelines(slots), timelines(room))
+    stored = sorted(task for name in WARM_ROOM_15 for task in slot_timelines.pop(name))
+    assert room_timelines.pop(WARM_ROOM[0]) == stored
+    assert room_timelines == slot_timelines
+
+
+def test_a_cascade_into_a_full_period_is_reported():
+    room = CapacityResource("ROOM", 1)
+    for (number, start) in enumerate((0, 100)):
+        room.add_task(Task(start, 60, f"product.{number}", room, "STORE", 5))
+    assert room.validate_timeline() == (None, None)
+
+    task = room.tasks[0]
+    (old_start, old_end) = (task.start, task.end)
+    (task.start, task.end) = (70, 130)
+    room.moved(task, old_start, old_end)
+    assert room.over_capacity(task)
+    assert room.validate_timeline() == (1, 100)
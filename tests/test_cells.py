@@ -0,0 +1,54 @@
+import math
+
+import pytest
+
+from cells import ShardedScheduler, round_robin
+from resources import OVEN2
+from service import SchedulingService, day_orders
+from simulation import build_scheduler
+
+ORDER_SETTINGS = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                      cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+
+
+@pytest.fixture
+def sharded():
+    with ShardedScheduler(2, OVEN2, chunk=16) as sharded:
+        yield sharded
+
+
+def test_every_cell_schedules_like_a_single_scheduler(sharded):
+    orders = list(day_orders(2, **ORDER_SETTINGS))
+    assigned = sharded.schedule(orders)
+    assert set(assigned) == {order["order"] for order in orders}
+
+    for index in range(2):
+        service = SchedulingService(build_scheduler(OVEN2), OVEN2, math.inf)
+        mine = [order for order in orders if assigned[order["order"]][0] == index]
+        assert mine
+        for order in mine:
+            assert service.assign(order) == assigned[order["order"]][1]
+
+    merged = sharded.resources()
+    assert sorted(merged) == sorted(f"{index}/{name}" for index in range(2) for name in build_scheduler(OVEN2).resources)
+    assert sum(len(timeline) for timeline in merged.values()) == 4 * len(orders)
+
+
+def test_round_robin_spreads_orders_evenly():
+    orders = list(day_orders(1, **ORDER_SETTINGS))
+    with ShardedScheduler(3, OVEN2, round_robin) as sharded:
+        assigned = sharded.schedule(orders)
+        reports = sharded.report()
+    counts = [report["orders"] for (report, _) in reports]
+    assert sum(counts) == len(orders) and max(counts) - min(counts) <= 1
+    assert [sum(cell == index for (cell, _) in assigned.values()) for index in range(3)] == counts
+
+
+def test_an_error_leaves_no_reply_behind(sharded):
+    orders = list(day_orders(1, **ORDER_SETTINGS))
+    sharded.schedule(orders)
+    with pytest.raises(ValueError):
+        sharded._ask([(0, "unknown", None), (1, "schedule", None)])
+    # the reply of cell 1 was taken with the error: the next request gets its own answers
+    reports = sharded.report()
+    assert sum(report["orders"] for (report, _) in reports) == len(orders)
@@ -0,0 +1,19 @@
+import pytest
+
+from concurrent_scheduler import ConcurrentScheduler, line_resources, stress
+from resources import OVEN2
+
+
+@pytest.mark.parametrize("lines", [1, 4])
+@pytest.mark.parametrize("shared", [False, True])
+def test_stress_equals_the_committed_calls_one_by_one(lines, shared):
+    (scheduler, _, problems) = stress(4, 60, OVEN2, lines, pickups=0.2, seed=7, shared=shared)
+    assert problems == []
+    assert sum(method == "schedule_forward" for (method, _) in scheduler.commits) == 4 * 60
+
+
+def test_single_threaded_features_are_refused():
+    scheduler = ConcurrentScheduler(line_resources(OVEN2, 1))
+    scheduler.enable_usage()
+    with pytest.raises(RuntimeError):
+        scheduler.schedule_forward([], "product", 0)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from data_generator import (bus_time, count_batches, generate_order_distribution, generate_orders, init_seed,
+                            order_batches)
+from resources import OVEN2
+from simulation import build_scheduler, generate_order_sequence, schedule_batches
+
+SETTINGS = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                pickup_max_time=10 * 60)
+
+
+def test_exact_batches_repeat_the_daily_distribution():
+    init_seed(7)
+    batches = list(order_batches(bus_time, cook_extra_time=90, days=3, chunk_days=2, exact=True, **SETTINGS))
+    init_seed(7)
+    days = [generate_order_distribution(bus_time, cook_extra_time=90, verbose=False, **SETTINGS) for _ in range(3)]
+
+    assert [len(batch) for batch in batches] == [2 * sum(bus_time), sum(bus_time)]
+    rows = np.concatenate(batches)
+    expected = [(day, order["hour"], int(order["order"].split(".")[1]), order["cook_time"],
+                 order["start_time"] + 86400 * day, order["end_time"] + 86400 * day, order["pickup_timeout"])
+                for (day, orders) in enumerate(days) for order in orders]
+    assert rows.tolist() == expected
+
+
+def test_chunked_batches_keep_the_hourly_profile():
+    init_seed(7)
+    rows = np.concatenate(list(order_batches(bus_time, cook_extra_time=90, days=5, chunk_days=2, **SETTINGS)))
+
+    assert len(rows) == 5 * sum(bus_time)
+    assert (np.diff(rows["start_time"]) > 0).all()
+    assert (rows["start_time"] // 3600 == rows["hour"] + 24 * rows["day"]).all()
+    for day in range(5):
+        hours = rows["hour"][rows["day"] == day]
+        assert np.bincount(hours, minlength=24).tolist() == bus_time
+    assert ((rows["cook_time"] >= 6 * 60) & (rows["cook_time"] <= 8 * 60)).all()
+    assert (rows["end_time"] == rows["start_time"] + rows["cook_time"] + 90).all()
+
+
+def test_count_batches_equal_generate_orders():
+    init_seed(7)
+    (batch,) = count_batches(500, **SETTINGS)
+    init_seed(7)
+    orders = generate_orders(500, **SETTINGS)
+    assert batch["number"].tolist() == list(range(500))
+    assert batch["cook_time"].tolist() == [order["cook_time"] for order in orders]
+    assert batch["pickup_timeout"].tolist() == [order["pickup_timeout"] for order in orders]
+
+    sizes = [len(batch) for batch in count_batches(2500, chunk=1000, **SETTINGS)]
+    assert sizes == [1000, 1000, 500]
+
+
+def test_scheduling_batches_equals_scheduling_dicts():
+    init_seed(7)
+    batches = list(order_batches(bus_time, cook_extra_time=90, days=2, **SETTINGS))
+    (by_batches, by_dicts) = (build_scheduler(OVEN2), build_scheduler(OVEN2))
+
+    for (batch, starts, ends) in schedule_batches(by_batches, batches, OVEN2):
+        for (row, start, end) in zip(batch.tolist(), starts.tolist(), ends.tolist()):
+            (day, hour, number, cook_time, start_time, _, _) = row
+            tasks = by_dicts.schedule_forward(sequence=generate_order_sequence(OVEN2, cook_time),
+                                              product_id=f"{day}.{hour}.{number}", start_time=start_time)
+            assert (tasks[0].start, tasks[-1].end) == (start, end)
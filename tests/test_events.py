@@ -0,0 +1,47 @@
+import json
+
+from conftest import timelines
+from events import tracer, RingBufferSink, JsonLinesSink, DEBUG, INFO, OFF
+
+
+def test_sinks_get_the_events_of_their_level(placed):
+    (quiet, _, _) = placed(count=100)
+    debug = tracer.add_sink(RingBufferSink(capacity=None), DEBUG)
+    info = tracer.add_sink(RingBufferSink(capacity=None), INFO)
+    try:
+        assert tracer.level == DEBUG
+        (scheduler, _, _) = placed(count=100)
+    finally:
+        tracer.remove_sink(debug)
+        tracer.remove_sink(info)
+    assert tracer.level == OFF
+
+    kinds = {type(event).__name__ for event in debug.events}
+    assert {"CandidateEvaluated", "StepPlanned", "Replan"} <= kinds
+    assert info.events and all(event.level >= INFO for event in info.events)
+    assert list(info.events) == [event for event in debug.events if event.level >= INFO]
+    # listening changes nothing
+    assert timelines(scheduler) == timelines(quiet)
+
+
+def test_removing_a_sink_raises_the_level():
+    debug = tracer.add_sink(RingBufferSink(), DEBUG)
+    info = tracer.add_sink(RingBufferSink(), INFO)
+    tracer.remove_sink(debug)
+    assert tracer.level == INFO
+    tracer.remove_sink(info)
+    assert tracer.level == OFF
+
+
+def test_json_lines_sink_writes_one_record_per_event(placed, tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = tracer.add_sink(JsonLinesSink(str(path)), INFO)
+    try:
+        placed(count=50)
+    finally:
+        tracer.remove_sink(sink)
+        sink.close()
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert records
+    assert {record["event"] for record in records} <= {"Replan", "Inserted"}
+    assert all("product_id" in record for record in records)
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from benchmark import build_timeline, scan_find_time, scan_oven_find_time
+from resources import OvenResource, Resource, Task
+
+
+def resource_and_scan(oven):
+    if oven:
+        return OvenResource("OVEN", 30), scan_oven_find_time
+    return Resource("HAND"), scan_find_time
+
+
+def queries(resource, count, seed):
+    rnd = random.Random(seed)
+    end = resource.tasks[-1].end if resource.tasks else 1000
+    return [(rnd.choice([30, 60, 420]), rnd.randrange(end + 600), rnd.choice([5, 6, 7])) for _ in range(count)]
+
+
+@pytest.mark.parametrize("oven", [False, True])
+@pytest.mark.parametrize("density", [0.3, 0.99])
+def test_find_time_equals_the_linear_scan(oven, density):
+    (resource, scan) = resource_and_scan(oven)
+    build_timeline(resource, 2000, density)
+    for query in queries(resource, 300, 1):
+        assert resource.find_time(*query) == scan(resource, *query), query
+
+
+@pytest.mark.parametrize("oven", [False, True])
+def test_find_time_follows_inserts_cascades_and_removals(oven):
+    (resource, scan) = resource_and_scan(oven)
+    build_timeline(resource, 500, 0.8)
+    rnd = random.Random(2)
+    for step in range(200):
+        if step % 3 == 2:
+            resource.remove_task(rnd.choice(resource.tasks))
+        else:
+            # where insert_sequence puts a task: insert_task pushes everything behind it
+            (start, index) = resource.find_time_to_insert(rnd.randrange(resource.tasks[-1].end))
+            task = Task(start, rnd.choice([30, 60]), f"new.{step}", resource, "OTHER", rnd.choice([5, 7]))
+            resource.insert_task(task, index)
+        assert resource.validate_timeline() == (None, None)
+        for query in queries(resource, 5, step):
+            assert resource.find_time(*query) == scan(resource, *query), query
+
+
+def test_empty_timeline():
+    for oven in (False, True):
+        (resource, scan) = resource_and_scan(oven)
+        assert resource.find_time(30, 100, 5) == scan(resource, 30, 100, 5)
+
+
+def leaves_in_order(index):
+    # the tasks of the leaf chain, first leaf to last
+    leaf = index.root
+    while leaf.children is not None:
+        leaf = leaf.children[0]
+    tasks = []
+    while leaf is not None:
+        assert leaf.tasks or leaf is index.root
+        tasks.extend(leaf.tasks)
+        leaf = leaf.next
+    return tasks
+
+
+def test_blocks_split_and_merge_back():
+    # enough tasks for branches to split, then removals down to an empty index
+    (resource, scan) = resource_and_scan(False)
+    build_timeline(resource, 5000, 0.5)
+    rnd = random.Random(3)
+    for step in range(3000):
+        (start, index) = resource.find_time_to_insert(rnd.randrange(resource.tasks[-1].end))
+        resource.insert_task(Task(start, 30, f"new.{step}", resource, "OTHER", 5), index)
+    assert resource.free_gaps.root.children[0].children is not None
+    while resource.tasks:
+        for _ in range(min(len(resource.tasks), 997)):
+            resource.remove_task(rnd.choice(resource.tasks))
+        assert leaves_in_order(resource.free_gaps) == resource.tasks
+        assert all(resource.free_gaps.position(task) == index for (index, task) in enumerate(resource.tasks))
+        for query in queries(resource, 20, len(resource.tasks)):
+            assert resource.find_time(*query) == scan(resource, *query), query
+    assert len(resource.free_gaps) == 0 and resource.free_gaps.root.children is None
@@ -0,0 +1,55 @@
+import random
+
+from conftest import timelines
+from events import tracer, RingBufferSink, DEBUG
+from resources import OVEN4, WARM_ROOM_15, OPERATION_TYPE, MANIPULATOR_COLD, MANIPULATOR_WARM, Resource, OvenResource
+from scheduler import Scheduler
+from simulation import generate_order_sequence, generate_pickup_sequence, make_orders
+
+
+def scheduler_with(group_min_size):
+    resources = {}
+    for r in MANIPULATOR_COLD + MANIPULATOR_WARM + OVEN4:
+        resources[r] = Resource(r) if r not in OVEN4 else OvenResource(r, 30)
+    resources.update((r, Resource(r)) for r in WARM_ROOM_15)
+    return Scheduler(resources, group_min_size=group_min_size)
+
+
+def store(duration, priority):
+    return {"resource": WARM_ROOM_15, "type": OPERATION_TYPE["STORE"], "duration": duration, "priority": priority}
+
+
+def place(scheduler, orders, seed):
+    # orders with a warm-room STORE step of mixed priority, pickups, a forked what-if that is
+    # rolled back and one that is committed
+    rnd = random.Random(seed)
+    for (index, order) in enumerate(orders):
+        start_time = index * 40 + rnd.randrange(60)
+        sequence = generate_order_sequence(OVEN4, order["cook_time"]) + [store(rnd.choice([600, 1800]),
+                                                                              rnd.choice([5, 7]))]
+        if index % 10 == 3:
+            with scheduler.fork():
+                scheduler.schedule_forward(sequence, f"what-if.{index}", start_time)
+        with scheduler.fork() as snapshot:
+            tasks = scheduler.schedule_forward(sequence, order["order"], start_time)
+            scheduler.commit(snapshot)
+        if index % 4 == 0:
+            scheduler.schedule_forward(generate_pickup_sequence(), f"pickup.{index}", tasks[-1].end + 30)
+
+
+def evaluated(scheduler, orders):
+    # places orders, returning how many candidate slots were evaluated
+    events = tracer.add_sink(RingBufferSink(capacity=None), DEBUG)
+    try:
+        place(scheduler, orders, 11)
+    finally:
+        tracer.remove_sink(events)
+    return sum(type(event).__name__ == "CandidateEvaluated" for event in events.events)
+
+
+def test_groups_place_like_their_members():
+    orders = make_orders(5, count=300, cook_time_scale=30)
+    (members, groups) = (scheduler_with(None), scheduler_with(3))
+    (member_candidates, group_candidates) = (evaluated(members, orders), evaluated(groups, orders))
+    assert timelines(groups) == timelines(members)
+    assert group_candidates < member_candidates
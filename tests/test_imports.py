@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+CORE = ["resources", "scheduler", "gap_index", "occupancy", "events", "metrics", "groups", "slot_cache", "recording",
+        "timeline", "concurrent_scheduler", "local_search"]
+
+
+def loaded_after(modules, *heavy):
+    # the heavy modules a fresh interpreter has loaded after importing modules
+    script = (f"import sys\nsys.path.insert(0, {SRC!r})\nimport {', '.join(modules)}\n"
+              f"print(' '.join(name for name in {heavy!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def test_core_modules_need_no_third_party_packages():
+    assert loaded_after(CORE, "numpy", "pandas", "plotly", "matplotlib") == []
+
+
+@pytest.mark.parametrize("module", ["plot_schedule", "simulation", "main"])
+def test_plotting_packages_load_only_when_drawing(module):
+    assert loaded_after([module], "pandas", "plotly", "matplotlib") == []
@@ -0,0 +1,76 @@
+import random
+
+from conftest import timelines
+from recording import diff, replay
+from resources import MANIPULATOR_COLD, OPERATION_TYPE
+from simulation import generate_pickup_sequence
+
+
+def pickups(orders, tasks):
+    return [(generate_pickup_sequence(), tasks[order["order"]][-1].end + order["pickup_timeout"], order["order"])
+            for order in orders]
+
+
+def one_by_one(scheduler, items):
+    found = [None] * len(items)
+    for position in sorted(range(len(items)), key=lambda position: (items[position][1], position)):
+        found[position] = scheduler.insert_sequence(*items[position])
+    return found
+
+
+def test_equals_insert_sequence_in_start_order(placed):
+    (bulk, orders, tasks) = placed()
+    items = pickups(orders, tasks)
+    random.Random(1).shuffle(items)
+    found = bulk.insert_sequences(items)
+
+    (serial, orders, tasks) = placed()
+    assert found == one_by_one(serial, items)
+    assert timelines(bulk) == timelines(serial)
+
+
+def test_equal_start_times_keep_input_order(placed):
+    (bulk, orders, tasks) = placed(50)
+    end = max(order_tasks[-1].end for order_tasks in tasks.values())
+    items = [(generate_pickup_sequence(), end, order["order"]) for order in orders]
+    bulk.insert_sequences(items)
+
+    (serial, _, _) = placed(50)
+    for item in items:
+        serial.insert_sequence(*item)
+    assert timelines(bulk) == timelines(serial)
+
+
+def test_multi_step_sequences(placed):
+    (bulk, orders, tasks) = placed(100)
+    cold = {"resource": MANIPULATOR_COLD, "type": OPERATION_TYPE["OTHER"], "duration": 60, "priority": 5}
+    items = [(sequence + [cold], start_time, product_id)
+             for (sequence, start_time, product_id) in pickups(orders, tasks)]
+    random.Random(2).shuffle(items)
+    found = bulk.insert_sequences(items)
+
+    (serial, _, _) = placed(100)
+    assert found == one_by_one(serial, items)
+    assert timelines(bulk) == timelines(serial)
+
+
+def test_nothing_to_insert(placed):
+    (scheduler, _, _) = placed(10)
+    before = timelines(scheduler)
+    assert scheduler.insert_sequences([]) == []
+    assert timelines(scheduler) == before
+
+
+def test_trace_replays_and_diffs(placed, tmp_path):
+    (scheduler, orders, tasks) = placed(100)
+    path = str(tmp_path / "trace.jsonl")
+    scheduler.record(path)
+    items = pickups(orders, tasks)
+    random.Random(3).shuffle(items)
+    scheduler.insert_sequences(items)
+    scheduler.record(None)
+
+    (replayed, calls) = replay(path)
+    assert calls == 1
+    assert timelines(replayed) == timelines(scheduler)
+    assert diff(path) is None
@@ -0,0 +1,66 @@
+import pytest
+
+from data_generator import bus_time
+from resources import OVEN2, InvariantViolation, Resource, Task
+from scheduler import Scheduler
+from simulation import build_scheduler, make_orders, simulate
+
+
+def hand(*spans):
+    resource = Resource("HAND")
+    for (number, (start, end)) in enumerate(spans):
+        resource.add_task(Task(start, end - start, f"product.{number}", resource, "OTHER", 5))
+    return resource, Scheduler({"HAND": resource})
+
+
+def test_clean_schedule_raises_nothing():
+    scheduler = build_scheduler(OVEN2)
+    checker = scheduler.check_invariants("raise")
+    simulate(scheduler, make_orders(3, count=200, cook_time_scale=30), OVEN2)
+    assert checker.violations == []
+
+
+def test_collect_reports_what_the_full_scans_find():
+    # pickups cascading over a day of orders leave overlaps and unload anomalies behind
+    scheduler = build_scheduler(OVEN2)
+    checker = scheduler.check_invariants("collect")
+    simulate(scheduler, make_orders(2, bus_time=bus_time, cook_time_scale=30), OVEN2, pickups=True)
+    collected = {(violation.kind, violation.first, violation.second) for violation in checker.violations}
+    found = {("unload_anomaly", first, second) for (first, second) in
+             scheduler.resources["WARM_HAND"].detect_unload_anomaly()}
+    for resource in scheduler.resources.values():
+        found.update(("overlap", first, second) for (first, second) in zip(resource.tasks, resource.tasks[1:])
+                     if first.end > second.start)
+    assert {kind for (kind, _, _) in found} == {"overlap", "unload_anomaly"}
+    assert found <= collected
+
+
+def test_raise_carries_every_violation_of_the_operation():
+    (resource, scheduler) = hand((0, 30), (60, 90))
+    scheduler.check_invariants("raise")
+    # overlaps both neighbours
+    with pytest.raises(InvariantViolation) as raised:
+        resource.add_task(Task(20, 50, "product.new", resource, "OTHER", 5))
+    violations = raised.value.violations
+    assert [(violation.kind, violation.first.start, violation.second.start) for violation in violations] == \
+        [("overlap", 0, 20), ("overlap", 20, 60)]
+    assert raised.value.violation is violations[0]
+    assert "and 1 more" in str(raised.value)
+
+
+def test_every_violation_is_reported_once():
+    (resource, scheduler) = hand((0, 30), (60, 90))
+    checker = scheduler.check_invariants("raise")
+    with pytest.raises(InvariantViolation):
+        resource.add_task(Task(20, 20, "product.new", resource, "OTHER", 5))
+    # an unrelated change does not raise the old overlap again, a new overlap does
+    resource.add_task(Task(200, 30, "product.far", resource, "OTHER", 5))
+    with pytest.raises(InvariantViolation) as raised:
+        resource.add_task(Task(210, 30, "product.late", resource, "OTHER", 5))
+    assert len(raised.value.violations) == 1
+    assert len(checker.violations) == 2
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        build_scheduler(OVEN2).check_invariants("warn")
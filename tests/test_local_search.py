@@ -0,0 +1,37 @@
+from conftest import timelines
+from local_search import LocalSearch, Placement
+from resources import OVEN2
+from simulation import generate_order_sequence
+
+
+def search(placed, cut, temperature=0.0):
+    (scheduler, orders, tasks) = placed(150, usage=True)
+    placements = [Placement(order["order"], generate_order_sequence(OVEN2, order["cook_time"]), order["start_time"],
+                            tasks[order["order"]]) for order in orders]
+    local_search = LocalSearch(scheduler, placements)
+    if not cut:
+        # place every order of a candidate, then compare
+        apply = local_search._apply
+
+        def place_all(indices, limit):
+            placed = apply(indices)
+            return placed if local_search.cost() < limit else None
+
+        local_search._apply = place_all
+    return scheduler, local_search, local_search.run(300, temperature)
+
+
+def test_cut_candidates_change_nothing(placed):
+    (cut, cut_search, cut_result) = search(placed, True)
+    (full, _, full_result) = search(placed, False)
+    assert cut_search.counts["cut"] > 0
+    assert (cut_result["kept"], cut_result["cost"]) == (full_result["kept"], full_result["cost"])
+    assert timelines(cut) == timelines(full)
+
+
+def test_run_ends_on_the_cheapest_schedule(placed):
+    (scheduler, local_search, result) = search(placed, True, temperature=600)
+    assert result["cost"][1] <= result["cost"][0]
+    assert local_search.cost() == result["cost"][1]
+    for resource in scheduler.resources.values():
+        assert resource.validate_timeline() == (None, None)
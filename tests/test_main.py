@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from conftest import timelines
+from main import load_config, run
+from resources import OVEN2
+from simulation import build_scheduler, make_orders, simulate
+
+
+@pytest.mark.parametrize("settings", [{"count": "5"}, {"count": 5.0}, {"pickups": 1}, {"plot": None},
+                                      {"bus_time": [1, "2"]}, {"cook_time_base": True}, {"trace": 3}])
+def test_load_config_checks_value_types(settings, tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(settings))
+    with pytest.raises(ValueError):
+        load_config(str(path))
+
+
+def test_load_config_takes_valid_values(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"count": 5, "cook_time_base": 400.5, "bus_time": [1, 0.5], "trace": None}))
+    config = load_config(str(path), pickups=True)
+    assert (config["count"], config["pickups"], config["plot"]) == (5, True, False)
+
+
+@pytest.mark.parametrize("mode", ["forward", "mixed"])
+def test_run_is_simulate(mode):
+    config = load_config(count=150, mode=mode, pickups=True)
+    (scheduler, orders, tasks) = run(config)
+
+    expected = build_scheduler(OVEN2)
+    simulate(expected, make_orders(config["seed"], count=150), OVEN2, pickups=True, mode=mode)
+    assert timelines(scheduler) == timelines(expected)
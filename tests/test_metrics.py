@@ -0,0 +1,88 @@
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import timelines
+from events import tracer, RingBufferSink, DEBUG
+from metrics import Histogram
+from resources import OVEN2
+from simulation import generate_order_sequence, make_orders, shift_statistics
+
+
+def test_exact_histogram_follows_removals():
+    generator = random.Random(5)
+    histogram = Histogram(exact=True)
+    values = []
+    for _ in range(3000):
+        if values and generator.random() < 0.45:
+            histogram.remove(values.pop(generator.randrange(len(values))))
+        else:
+            value = generator.choice([0, generator.randint(1, 5000), generator.random() * 50])
+            histogram.add(value)
+            values.append(value)
+        ordered = sorted(values)
+        assert histogram.count == len(values)
+        if values:
+            assert (histogram.min, histogram.max) == (ordered[0], ordered[-1])
+        else:
+            assert (histogram.min, histogram.max) == (float("inf"), float("-inf"))
+        if values:
+            for p in (1, 50, 95, 100):
+                assert histogram.percentile(p) == ordered[max(0, -(-p * len(values) // 100) - 1)]
+
+
+def test_remove_needs_exact():
+    histogram = Histogram()
+    histogram.add(3)
+    with pytest.raises(ValueError):
+        histogram.remove(3)
+
+
+def test_usage_meter_shifts_follow_cascades(placed):
+    (scheduler, orders, tasks) = placed(100, usage=True)
+    # orders inserted at the start cascade through the schedule and shift every order again
+    scheduler.insert_sequences([(generate_order_sequence(OVEN2, 400), 0, f"early.{i}") for i in range(3)])
+    shifts = sorted(tasks[order["order"]][0].start - order["start_time"] for order in orders)
+    shifts = [shift for shift in shifts if shift > 0]
+    summary = scheduler.usage.shift_summary()
+    assert summary["shifted"] == shift_statistics(orders, tasks)["shifted"] == len(shifts)
+    assert summary["max"] == shift_statistics(orders, tasks)["max_shift"] == shifts[-1]
+    assert summary["p50"] == shifts[(len(shifts) + 1) // 2 - 1]
+
+
+def test_counters_match_the_traced_events(placed):
+    (quiet, _, _) = placed(150)
+    (scheduler, orders, _) = placed(0)
+    assert scheduler.stats() == {}
+    scheduler.enable_stats()
+    events = tracer.add_sink(RingBufferSink(capacity=None), DEBUG)
+    try:
+        for order in make_orders(123, count=150, cook_time_scale=30):
+            scheduler.schedule_forward(generate_order_sequence(OVEN2, order["cook_time"]), order["order"],
+                                       order["start_time"])
+    finally:
+        tracer.remove_sink(events)
+    kinds = Counter(type(event).__name__ for event in events.events)
+    stats = scheduler.stats(reset=True)
+    (counts, histograms) = (stats["counts"], stats["histograms"])
+
+    assert counts["schedule_forward"] == histograms["schedule_forward"]["count"] == 150
+    assert counts["find_time"] == kinds["CandidateEvaluated"] == histograms["find_time"]["count"]
+    assert counts["replans"] == kinds["Replan"] > 0
+    assert histograms["replans"]["count"] == 150
+    assert counts["align_tasks"] == kinds["Inserted"] == histograms["align_moved"]["count"]
+    assert counts["moved"] >= kinds["Shifted"]
+    assert scheduler.stats()["counts"] == {}
+    # counting changes nothing
+    assert timelines(scheduler) == timelines(quiet)
+
+
+def test_profile_reports_cpu_and_memory(placed):
+    (scheduler, _, _) = placed(0)
+    with scheduler.profile(memory=True) as profile:
+        for i in range(20):
+            scheduler.schedule_forward(generate_order_sequence(OVEN2, 420), f"order.{i}", 0)
+    report = profile.report()
+    assert "schedule_forward" in report
+    assert profile.peak_bytes > 0
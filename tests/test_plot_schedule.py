@@ -0,0 +1,50 @@
+import numpy as np
+
+from plot_schedule import export_schedule, timeline_bars
+from resources import OVEN2, WARM_ROOM
+from simulation import build_scheduler, make_orders, simulate
+
+
+def warm_room_schedule(count=150, capacity=4):
+    scheduler = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=capacity)
+    simulate(scheduler, make_orders(7, count=count, cook_time_scale=30), OVEN2, warm_room=WARM_ROOM)
+    return scheduler
+
+
+def drawn_busy_time(blocks, resources):
+    # busy seconds per resource as drawn: merged bars scaled back by capacity, detail bars as is
+    busy = dict.fromkeys(resources, 0.0)
+    for block in blocks:
+        lengths = block["Finish"] - block["Start"]
+        if block["Type"] == "BUSY":
+            lengths = lengths * block["Occupancy"] * getattr(resources[block["Resource"]], "capacity", 1)
+        busy[block["Resource"]] += lengths.sum()
+    return busy
+
+
+def test_occupancy_is_a_share_of_the_capacity():
+    resources = warm_room_schedule().resources
+    blocks = timeline_bars(resources, max_bars=50)
+    room = [block for block in blocks if block["Resource"] == WARM_ROOM[0]]
+    assert room and max(block["Occupancy"].max() for block in room) > 0.5
+    for block in blocks:
+        assert ((block["Occupancy"] > 0) & (block["Occupancy"] <= 1)).all()
+
+
+def test_window_splits_busy_time_between_merged_and_detail_bars():
+    resources = warm_room_schedule().resources
+    high = max(resource.tasks[-1].end for resource in resources.values() if resource.tasks)
+    # a window edge through the middle of tasks
+    blocks = timeline_bars(resources, window=(high / 3 + 7, high / 2 + 7), max_bars=50)
+    busy = drawn_busy_time(blocks, resources)
+    for (name, resource) in resources.items():
+        assert np.isclose(busy[name], sum(task.duration for task in resource.tasks))
+
+
+def test_export_png_with_a_capacity_resource(tmp_path):
+    resources = warm_room_schedule().resources
+    high = max(resource.tasks[-1].end for resource in resources.values() if resource.tasks)
+    path = str(tmp_path / "schedule.png")
+    assert export_schedule(resources, path, window=(high / 2, high / 2 + 3600), max_bars=50) > 0
+    with open(path, "rb") as image:
+        assert image.read(8) == b"\x89PNG\r\n\x1a\n"
@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import timelines
+from data_generator import bus_time
+from recording import diff, read_trace, replay
+from resources import OVEN2, WARM_ROOM, Task
+from simulation import build_scheduler, generate_order_sequence, generate_pickup_sequence, make_orders, due_time
+
+
+def recorded_run(path):
+    # every recorded call: forward and just-in-time orders, single and bulk pickups, evict
+    scheduler = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=30)
+    scheduler.record(path)
+    orders = make_orders(11, bus_time=bus_time, cook_time_scale=30)
+    tasks = {}
+    for (number, order) in enumerate(orders):
+        if (number + 1) % 3:
+            sequence = generate_order_sequence(OVEN2, order["cook_time"], WARM_ROOM)
+            tasks[order["order"]] = scheduler.schedule_forward(sequence, order["order"], order["start_time"])
+        else:
+            # without the warm room most of them fit backward from their due time
+            sequence = generate_order_sequence(OVEN2, order["cook_time"])
+            tasks[order["order"]] = scheduler.schedule_mixed(sequence, order["order"], order["start_time"],
+                                                             due_time(order))
+    half = len(orders) // 2
+    for order in orders[:half]:
+        scheduler.insert_sequence(generate_pickup_sequence(), tasks[order["order"]][-1].end, order["order"])
+    scheduler.evict(tasks[orders[half]["order"]][0].start)
+    scheduler.insert_sequences([(generate_pickup_sequence(), tasks[order["order"]][-1].end, order["order"])
+                                for order in orders[half:]])
+    scheduler.record(None)
+    return scheduler
+
+
+def test_replay_rebuilds_the_timelines(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    scheduler = recorded_run(path)
+    records = list(read_trace(path)[1])
+    assert {record[0] for record in records} == {"f", "b", "i", "m", "e"}
+    assert any(record[0] == "b" and record[-2] is not None for record in records)
+    (replayed, calls) = replay(path)
+    assert timelines(replayed) == timelines(scheduler)
+    assert calls == len(records)
+
+
+def test_diff_of_an_unchanged_search_is_clean(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    recorded_run(path)
+    assert diff(path) is None
+
+
+def test_diff_finds_the_first_changed_decision(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    recorded_run(path)
+    # the same resources with the cold hand busy at the start: the first order goes later
+    scheduler = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=30)
+    hand = scheduler.resources["COLD_HAND"]
+    hand.add_task(Task(-10, 3600, "blocker", hand, "OTHER", 5))
+    divergence = diff(path, scheduler)
+    assert divergence is not None
+    assert (divergence.call, divergence.step) == (0, 0)
+    assert divergence.recorded[0] == divergence.found[0] == "COLD_HAND"
+    assert divergence.found[1] > divergence.recorded[1]
+
+
+def test_trace_of_another_version_is_refused(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    path.write_text('{"trace": 1}\n')
+    with pytest.raises(ValueError):
+        read_trace(str(path))
@@ -0,0 +1,42 @@
+import asyncio
+import math
+from itertools import groupby
+
+from resources import OVEN2
+from service import SchedulingService, day_orders, replay
+from simulation import build_scheduler
+
+ORDER_SETTINGS = dict(cook_time_base=7 * 60, cook_time_scale=30, cook_min_time=6 * 60, cook_max_time=8 * 60,
+                      cook_extra_time=30 * 3, pickup_max_time=10 * 60)
+
+
+def serve(days, evict_every):
+    service = SchedulingService(build_scheduler(OVEN2), OVEN2, evict_every)
+    assignments = []
+    asyncio.run(replay(service, day_orders(days, **ORDER_SETTINGS), assignments.append))
+    return service, assignments
+
+
+def test_eviction_keeps_assignments_and_bounds_live_tasks():
+    (kept, kept_assignments) = serve(3, math.inf)
+    (evicting, evicted_assignments) = serve(3, 3600)
+
+    assert [(a.product_id, a.tasks) for a in evicted_assignments] == [(a.product_id, a.tasks) for a in kept_assignments]
+    (kept_report, evicting_report) = (kept.report(), evicting.report())
+    assert kept_report["evicted_tasks"] == 0
+    assert evicting_report["evicted_tasks"] > 0
+    assert evicting_report["live_tasks"] + evicting_report["evicted_tasks"] == kept_report["live_tasks"]
+    for key in ("orders", "shifted", "avg_shift"):
+        assert evicting_report[key] == kept_report[key]
+
+
+def test_live_tasks_stay_below_one_day():
+    service = SchedulingService(build_scheduler(OVEN2), OVEN2, 3600)
+    live = []
+    for (_, batch) in groupby(day_orders(4, **ORDER_SETTINGS), key=lambda order: order["order"].split(".", 1)[0]):
+        for order in batch:
+            service.assign(order)
+        live.append(service.report()["live_tasks"])
+
+    report = service.report()
+    assert max(live) < (report["live_tasks"] + report["evicted_tasks"]) / 4
@@ -0,0 +1,64 @@
+from conftest import timelines
+from resources import OVEN2, CapacityResource, Resource, Task
+from simulation import generate_order_sequence
+
+
+def test_repeated_query_hits_until_the_timeline_changes(placed):
+    (scheduler, _, _) = placed(20)
+    cache = scheduler.enable_cache()
+    hand = scheduler.resources["COLD_HAND"]
+
+    found = cache.find_slot(hand, 30, 100, 5)
+    assert cache.find_slot(hand, 30, 100, 5) == found == hand.find_slot(30, 100, 5)
+    assert cache.find_time_to_insert(hand, 100) == cache.find_time_to_insert(hand, 100)
+    assert scheduler.cache_stats(reset=True)["hits"] == 2
+
+    version = hand.version
+    hand.tasks[0].shift(15)
+    assert hand.version != version
+    assert cache.find_slot(hand, 30, 100, 5) == hand.find_slot(30, 100, 5)
+    assert scheduler.cache_stats()["hits"] == 0
+
+
+def test_every_change_bumps_the_version():
+    for resource in (Resource("HAND"), CapacityResource("ROOM", 2)):
+        versions = [resource.version]
+        task = Task(0, 30, "product.0", resource, "OTHER", 5)
+        resource.add_task(task)
+        versions.append(resource.version)
+        resource.insert_task(Task(10, 30, "product.1", resource, "OTHER", 5), None)
+        versions.append(resource.version)
+        task.shift(100)
+        versions.append(resource.version)
+        resource.remove_task(task)
+        versions.append(resource.version)
+        resource.evict(1000)
+        versions.append(resource.version)
+        assert len(set(versions)) == len(versions)
+
+
+def test_rollback_restores_versions_so_the_next_fork_hits(placed):
+    (scheduler, _, _) = placed(50)
+    cache = scheduler.enable_cache()
+    sequence = generate_order_sequence(OVEN2, 420)
+    with scheduler.fork():
+        scheduler.schedule_forward(sequence, "what-if.0", 0)
+    cache.stats(reset=True)
+    with scheduler.fork():
+        scheduler.schedule_forward(sequence, "what-if.1", 0)
+    assert cache.stats()["hits"] > 0
+
+
+def test_cached_scheduling_places_like_uncached(placed):
+    (cached, _, _) = placed(200)
+    (plain, _, _) = placed(200)
+    cached.enable_cache(size=64)
+    sequence = generate_order_sequence(OVEN2, 420)
+    for number in range(50):
+        for scheduler in (cached, plain):
+            with scheduler.fork():
+                scheduler.schedule_forward(sequence, f"what-if.{number}", number * 60)
+            scheduler.schedule_forward(sequence, f"order.{number}", number * 60)
+    assert timelines(cached) == timelines(plain)
+    stats = cached.cache_stats()
+    assert stats["hits"] > 0 and stats["entries"] <= 64
@@ -0,0 +1,64 @@
+import random
+
+from conftest import timelines
+from resources import OVEN2
+from simulation import generate_order_sequence, generate_pickup_sequence
+
+
+def state(scheduler):
+    # timelines, what the gap indexes answer and what the usage meter counts
+    rnd = random.Random(4)
+    end = max(resource.tasks[-1].end for resource in scheduler.resources.values())
+    queries = [(rnd.choice([30, 420]), rnd.randrange(end), 5) for _ in range(50)]
+    answers = {name: [resource.find_time(*query) for query in queries]
+               for (name, resource) in scheduler.resources.items()}
+    return timelines(scheduler), answers, scheduler.usage.shift_summary(), dict(scheduler.usage.total)
+
+
+def change(scheduler, orders, tasks, seed):
+    # orders placed at the start cascade through the schedule; pickups; orders taken off
+    rnd = random.Random(seed)
+    for i in range(3):
+        scheduler.schedule_forward(generate_order_sequence(OVEN2, 420), f"early.{seed}.{i}", rnd.randrange(600))
+    scheduler.insert_sequence(generate_pickup_sequence(), rnd.randrange(20000), f"pickup.{seed}")
+    for order in rnd.sample(orders, 5):
+        for task in tasks[order["order"]]:
+            if task._node is not None:
+                task.resource.remove_task(task)
+
+
+def test_fork_rolls_everything_back(placed):
+    (scheduler, orders, tasks) = placed(150, usage=True)
+    before = state(scheduler)
+    with scheduler.fork():
+        change(scheduler, orders, tasks, 1)
+        assert state(scheduler) != before
+    assert state(scheduler) == before
+    assert scheduler.journal is None
+
+
+def test_committed_fork_keeps_the_changes(placed):
+    (scheduler, orders, tasks) = placed(150, usage=True)
+    (expected, _, expected_tasks) = placed(150, usage=True)
+    with scheduler.fork() as snapshot:
+        change(scheduler, orders, tasks, 2)
+        scheduler.commit(snapshot)
+    change(expected, orders, expected_tasks, 2)
+    assert state(scheduler) == state(expected)
+
+
+def test_nested_snapshots(placed):
+    (scheduler, orders, tasks) = placed(150, usage=True)
+    before = state(scheduler)
+    outer = scheduler.snapshot()
+    change(scheduler, orders, tasks, 3)
+    middle = state(scheduler)
+    with scheduler.fork():
+        change(scheduler, orders, tasks, 4)
+    assert state(scheduler) == middle
+    with scheduler.fork() as inner:
+        change(scheduler, orders, tasks, 5)
+        scheduler.commit(inner)
+    assert state(scheduler) != middle
+    scheduler.rollback(outer)
+    assert state(scheduler) == before
@@ -0,0 +1,38 @@
+import numpy as np
+
+from sweep import COLUMNS, ResultStore, run_sweep, scenario_grid
+
+
+def rows_by_scenario(columns):
+    # the stored rows without their run times, by scenario
+    rows = {}
+    for index in range(len(columns["scenario"])):
+        row = {column: columns[column][index].item() for column in COLUMNS if column != "elapsed"}
+        rows[row["scenario"]] = row
+    return rows
+
+
+def test_resumed_sweep_equals_a_full_one(tmp_path):
+    scenarios = scenario_grid(ovens=("OVEN1", "OVEN2"), volumes=(20,), seeds=range(2))
+    full = ResultStore(str(tmp_path / "full"))
+    assert run_sweep(scenarios, full, workers=2) == 4
+
+    # interrupted after a flush of the first two scenarios
+    resumed = ResultStore(str(tmp_path / "resumed"))
+    run_sweep(scenarios[:2], resumed, workers=1)
+    assert run_sweep(scenarios, resumed, workers=2, flush_every=1) == 2
+    assert len(resumed.parts()) == 3
+    assert run_sweep(scenarios, resumed, workers=2) == 0
+
+    assert rows_by_scenario(resumed.load()) == rows_by_scenario(full.load())
+
+
+def test_export_writes_every_row(tmp_path):
+    store = ResultStore(str(tmp_path / "sweep"))
+    run_sweep(scenario_grid(ovens=("OVEN1",), volumes=(10,), seeds=range(3)), store, workers=1, flush_every=2)
+    path = str(tmp_path / "all.npz")
+    store.export(path)
+    with np.load(path) as exported:
+        assert sorted(exported.files) == sorted(COLUMNS)
+        assert len(exported["scenario"]) == 3
+        assert (exported["orders"] == 10).all()
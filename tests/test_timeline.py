@@ -0,0 +1,59 @@
+from conftest import timelines
+from resources import OVEN2, WARM_ROOM
+from simulation import build_scheduler, generate_order_sequence, make_orders, simulate
+from timeline import ScheduleFile, compact_schedule, load_schedule, save_schedule
+
+
+def chains(scheduler):
+    # every task with the task after it in its product chain
+    return sorted((task.product_id, task.resource.name, task.start,
+                   None if task.next_task is None else (task.next_task.resource.name, task.next_task.start))
+                  for resource in scheduler.resources.values() for task in resource.tasks)
+
+
+def warm_room_schedule(count=150):
+    scheduler = build_scheduler(OVEN2, warm_room=WARM_ROOM, warm_room_capacity=30)
+    orders = make_orders(7, count=count, cook_time_scale=30)
+    simulate(scheduler, orders, OVEN2, pickups=True, warm_room=WARM_ROOM)
+    return scheduler
+
+
+def test_save_and_load_round_trip(tmp_path):
+    scheduler = warm_room_schedule()
+    path = str(tmp_path / "schedule.bin")
+    save_schedule(scheduler, path)
+    loaded = load_schedule(path)
+    assert timelines(loaded) == timelines(scheduler)
+    assert chains(loaded) == chains(scheduler)
+
+    # the loaded scheduler goes on placing orders the same way
+    for scheduler in (scheduler, loaded):
+        for i in range(20):
+            scheduler.schedule_forward(generate_order_sequence(OVEN2, 400, WARM_ROOM), f"late.{i}", 1000 * i)
+    assert timelines(loaded) == timelines(scheduler)
+
+
+def test_load_with_now_evicts_like_the_scheduler(tmp_path):
+    scheduler = warm_room_schedule()
+    path = str(tmp_path / "schedule.bin")
+    save_schedule(scheduler, path)
+    now = max(resource.tasks[-1].end for resource in scheduler.resources.values()) // 2
+    loaded = load_schedule(path, now)
+    assert scheduler.evict(now) > 0
+    assert timelines(loaded) == timelines(scheduler)
+    for (name, resource) in scheduler.resources.items():
+        assert (loaded.resources[name].evicted, loaded.resources[name].evicted_busy) == \
+            (resource.evicted, resource.evicted_busy)
+
+
+def test_mapped_timelines_equal_the_compact_copy(tmp_path):
+    scheduler = warm_room_schedule(50)
+    path = str(tmp_path / "schedule.bin")
+    save_schedule(scheduler, path)
+    compact = compact_schedule(scheduler.resources)
+    with ScheduleFile(path) as schedule:
+        for (name, timeline) in compact.items():
+            mapped = schedule.timelines[name]
+            assert [(task.start, task.end, task.product_id, task.type) for task in mapped] == \
+                [(task.start, task.end, task.product_id, task.type) for task in timeline]
+            assert mapped.busy_time() == timeline.busy_time()